@@ -23,7 +23,8 @@ class Catalog(object):
             self, url=None, timeout=30 * 60, user_id=None,
             password=None, token=None, ignore_authrc=False,
             trust_all_ssl_certificates=False,
-            auth_svc='https://ci.kbase.us/services/auth/api/legacy/KBase/Sessions/Login'):
+            auth_svc='https://ci.kbase.us/services/auth/api/legacy/KBase/Sessions/Login',
+            use_msgpack=False):
         if url is None:
             raise ValueError('A url is required')
         self._service_ver = None
@@ -31,7 +32,7 @@ class Catalog(object):
             url, timeout=timeout, user_id=user_id, password=password,
             token=token, ignore_authrc=ignore_authrc,
             trust_all_ssl_certificates=trust_all_ssl_certificates,
-            auth_svc=auth_svc)
+            auth_svc=auth_svc, use_msgpack=use_msgpack)
 
     def version(self, context=None):
         """
@@ -1,6 +1,12 @@
 # -*- coding: utf-8 -*-
 #BEGIN_HEADER
+import contextlib
+import fcntl
 import logging
+import os
+import tempfile
+import threading
+import time
 
 from biokbase.catalog.controller import CatalogController
 #END_HEADER
@@ -26,6 +32,68 @@ class Catalog:
     GIT_COMMIT_HASH = "fda05a2962373163e4983dc5187b1c51cd1455b1"
 
     #BEGIN_CLASS_HEADER
+    # seconds a process waits before it tries again to create a controller that failed, doubled
+    # with each failure up to the max
+    INIT_RETRY_SEC = 1
+    INIT_RETRY_MAX_SEC = 60
+
+    @property
+    def cc(self):
+        return self.get_controller()
+
+    def get_controller(self):
+        '''
+        Returns the CatalogController of this process.  pymongo clients are not fork safe,
+        so each (uwsgi worker) process creates its own controller on first use.  If that fails,
+        calls fail right away with the same error until the retry time has passed.
+        '''
+        if self._cc_pid != os.getpid():
+            with self._cc_lock:
+                if self._cc_pid != os.getpid():
+                    self._init_controller()
+        return self._cc
+
+    def _init_controller(self):
+        failure = self._init_failure
+        if failure is not None and failure['pid'] != os.getpid():
+            failure = None
+        if failure is not None and time.monotonic() < failure['retry_at']:
+            raise IOError('Initializing the Catalog Controller failed, retrying in {:.0f}s: {}'
+                          .format(failure['retry_at'] - time.monotonic(), failure['error']))
+        logging.info('Initializing the Catalog Controller in process ' + str(os.getpid()))
+        try:
+            with self._db_setup() as setup_db:
+                cc = CatalogController(self._config, setup_db=setup_db)
+        except Exception as e:
+            count = failure['count'] + 1 if failure is not None else 1
+            retry = min(self.INIT_RETRY_SEC * 2 ** (count - 1), self.INIT_RETRY_MAX_SEC)
+            logging.error('Initializing the Catalog Controller failed, retrying in {}s: {}'
+                          .format(retry, e))
+            self._init_failure = {'pid': os.getpid(), 'count': count, 'error': str(e),
+                                  'retry_at': time.monotonic() + retry}
+            raise
+        self._cc = cc
+        self._cc_pid = os.getpid()
+        self._init_failure = None
+
+    @contextlib.contextmanager
+    def _db_setup(self):
+        '''
+        Yields whether this process has to set up the db schema and indexes.  The processes
+        forked from the one that created this Catalog share its setup file: the first of them
+        to create a controller sets up the db while holding a lock on the file, and marks the
+        file when it succeeds.  The others wait for the lock and skip the setup.  The lock is
+        released if its holder dies.
+        '''
+        fd = self._setup_file.fileno()
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+        try:
+            done = os.pread(fd, 1, 0) == b'1'
+            yield not done
+            if not done:
+                os.pwrite(fd, b'1', 0)
+        finally:
+            fcntl.lockf(fd, fcntl.LOCK_UN)
     #END_CLASS_HEADER
 
     # config contains contents of config file in a hash or None if it couldn't
@@ -36,9 +104,18 @@ class Catalog:
                             level=logging.INFO)
         logging.info('Starting the Catalog service.  Service configuration:\n'
                      "\n".join('  '+c+'='+config[c]) for c in config if c != 'nms-admin-token')
-        logging.info('Initializing the Catalog Controller...')
-        self.cc = CatalogController(config)
-        logging.info('Initialization complete.')
+        self._config = config
+        self._cc = None
+        self._cc_pid = None
+        self._cc_lock = threading.Lock()
+        self._init_failure = None
+        # created before the workers are forked, so that they all share it
+        self._setup_file = tempfile.TemporaryFile()
+        if str(config.get('lazy-init', '')).lower() != 'true':
+            # validates the configuration and sets up the db before any workers start
+            logging.info('Initializing the Catalog Controller...')
+            self.get_controller()
+            logging.info('Initialization complete.')
         #END_CONSTRUCTOR
         pass
 
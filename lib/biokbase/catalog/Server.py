@@ -1,23 +1,38 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import atexit
+import contextlib
+import contextvars
 import datetime
 import json
+import logging
+import math
 import os
 import random as _random
 import sys
+import threading
+import time
 import traceback
+from concurrent.futures import ThreadPoolExecutor
 from getopt import getopt, GetoptError
 from multiprocessing import Process
 from os import environ
 from wsgiref.simple_server import make_server
 
-import requests as _requests
 from jsonrpcbase import JSONRPCService, InvalidParamsError, KeywordError, \
-    JSONRPCError, InvalidRequestError
+    JSONRPCError, InvalidRequestError, MethodNotFoundError
 from jsonrpcbase import ServerError as JSONServerError
 
 from biokbase import log
 from biokbase.catalog.authclient import KBaseAuth as _KBaseAuth
+from biokbase.catalog import authclient, codec, deadline, http_session, \
+    httpcache, logqueue, metrics, profiling, tracing
+from biokbase.catalog.admission import AdmissionController, RateLimitedError
+from biokbase.catalog.compression import ResponseCompressor, decompress
+from biokbase.catalog.lanes import Lanes
+from biokbase.catalog.prefork import PreforkServer
+from biokbase.catalog.response_cache import ResponseCache
+from biokbase.catalog.singleflight import SingleFlight, request_key
 
 try:
     from ConfigParser import ConfigParser
@@ -27,6 +42,8 @@ except ImportError:
 DEPLOY = 'KB_DEPLOYMENT_CONFIG'
 SERVICE = 'KB_SERVICE_NAME'
 AUTH = 'auth-service-url'
+# seconds the mongo check of GET /ready is reused for by a worker
+READY_CHECK_SECONDS = 5
 
 # Note that the error fields do not match the 2.0 JSONRPC spec
 
@@ -49,6 +66,12 @@ def get_config():
         retconfig[nameval[0]] = nameval[1]
     return retconfig
 
+
+def get_config_int(key, default):
+    if not config or not config.get(key, '').strip():
+        return default
+    return int(config[key])
+
 config = get_config()
 
 from biokbase.catalog.Impl import Catalog  # noqa @IgnorePep8
@@ -67,61 +90,163 @@ class JSONObjectEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, obj)
 
 
+def iter_rpc_response(respond, chunk_size=64 * 1024):
+    """
+    Yields the JSON encoding of an RPC response as utf8 chunks of roughly
+    chunk_size bytes. A list result is encoded one element at a time so the
+    complete document never has to be held in memory.
+    """
+    result = respond.get('result')
+    if not (isinstance(result, list) and len(result) == 1 and
+            isinstance(result[0], list)):
+        yield codec.dumps(respond).encode('utf8')
+        return
+    buf = ['{']
+    for key, value in respond.items():
+        if key != 'result':
+            buf.append(codec.dumps(key) + ': ' + codec.dumps(value) + ', ')
+    buf.append('"result": [[')
+    size = 0
+    for i, item in enumerate(result[0]):
+        part = codec.dumps(item)
+        buf.append(part if i == 0 else ', ' + part)
+        size += len(part)
+        if size >= chunk_size:
+            yield ''.join(buf).encode('utf8')
+            buf = []
+            size = 0
+    buf.append(']]}')
+    yield ''.join(buf).encode('utf8')
+
+
+def get_response_codec(ctx):
+    return ctx.get('response_codec') or codec.current()
+
+
 class JSONRPCServiceCustom(JSONRPCService):
 
+    # read only methods whose identical concurrent calls share one execution
+    singleflight_methods = frozenset()
+    # caches the encoded results of read only methods, if configured
+    response_cache = None
+
+    def __init__(self):
+        super().__init__()
+        self.singleflight = SingleFlight()
+
     def call(self, ctx, jsondata):
         """
-        Calls jsonrpc service's method and returns its return value in a JSON
-        string or None if there is none.
+        Calls jsonrpc service's method and returns its return value encoded
+        with the response codec of the request (a JSON string by default) or
+        None if there is none.
 
         Arguments:
         jsondata -- remote method call in jsonrpc format
         """
+        if self.response_cache is not None and isinstance(jsondata, dict) and \
+                jsondata.get('method') in self.response_cache.methods and \
+                jsondata.get('id') is not None and ctx.get('profiler') is None:
+            return self._call_cached(ctx, jsondata)
         result = self.call_py(ctx, jsondata)
         if result is not None:
-            return json.dumps(result, cls=JSONObjectEncoder)
+            with tracing.span('encode'):
+                return get_response_codec(ctx).dumps(result)
 
         return None
 
+    def _call_cached(self, ctx, jsondata):
+        """
+        Same as call() for a method in the response cache: the encoded result
+        is looked up in or added to the cache, and the response envelope is
+        encoded around it.
+        """
+        cache = self.response_cache
+        response_codec = get_response_codec(ctx)
+        request = self._get_default_vals()
+        self._fill_request(request, jsondata)
+        key = (response_codec.name,
+               request_key(request['method'], request['params']))
+        # read before running the method, so that a result computed while
+        # the data changed is not cached
+        generation = cache.generation()
+        result = cache.get(request['method'], key, generation)
+        if result is None:
+            respond = self._handle_request(ctx, request)
+            with tracing.span('encode'):
+                result = response_codec.dumps(respond['result'])
+            cache.put(key, generation, result)
+        respond = {}
+        self._fill_ver(request['jsonrpc'], respond)
+        respond['id'] = request['id']
+        return response_codec.splice(respond, result)
+
     def _call_method(self, ctx, request):
         """Calls given method with given params and returns it value."""
+        profiler = ctx.pop('profiler', None)
+        if profiler is not None:
+            info = {'method': request['method'], 'user': ctx['user_id']}
+            result, ctx['profile_id'] = profiler.run(
+                info, self._call_method, ctx, request)
+            return result
         method = self.method_data[request['method']]['method']
         params = request['params']
         result = None
         try:
-            if isinstance(params, list):
-                # Does it have enough arguments?
-                if len(params) < self._man_args(method) - 1:
-                    raise InvalidParamsError('not enough arguments')
-                # Does it have too many arguments?
-                if(not self._vargs(method) and len(params) >
-                        self._max_args(method) - 1):
-                    raise InvalidParamsError('too many arguments')
-
-                result = method(ctx, *params)
-            elif isinstance(params, dict):
-                # Do not accept keyword arguments if the jsonrpc version is
-                # not >=1.1.
-                if request['jsonrpc'] < 11:
-                    raise KeywordError
-
-                result = method(ctx, **params)
-            else:  # No params
-                result = method(ctx)
+            if request['method'] in self.singleflight_methods:
+                # the key is taken first, methods may modify their params
+                key = request_key(request['method'], params)
+                result, shared = self.singleflight.do(
+                    key, lambda: self._invoke(ctx, request, method, params))
+                if shared:
+                    metrics.RPC_COALESCED.inc(method=request['method'])
+            else:
+                result = self._invoke(ctx, request, method, params)
         except JSONRPCError:
             raise
         except Exception as e:
-            # log.exception('method %s threw an exception' % request['method'])
-            # Exception was raised inside the method.
-            newerr = JSONServerError()
-            newerr.trace = traceback.format_exc()
-            if len(e.args) == 1:
-                newerr.data = repr(e.args[0])
-            else:
-                newerr.data = repr(e.args)
-            raise newerr
+            raise self.method_error(request, e)
         return result
 
+    def method_error(self, request, e):
+        """
+        Returns the JSON-RPC error to raise for the exception e of a method.
+        Must be called while handling e, as its trace is included.
+        """
+        if deadline.is_timeout(e):
+            return deadline.DeadlineExceededError(
+                '%s did not finish before the request deadline: %s' % (
+                    request['method'], e))
+        # log.exception('method %s threw an exception' % request['method'])
+        # Exception was raised inside the method.
+        newerr = JSONServerError()
+        newerr.trace = traceback.format_exc()
+        if len(e.args) == 1:
+            newerr.data = repr(e.args[0])
+        else:
+            newerr.data = repr(e.args)
+        return newerr
+
+    def _invoke(self, ctx, request, method, params):
+        if isinstance(params, list):
+            # Does it have enough arguments?
+            if len(params) < self._man_args(method) - 1:
+                raise InvalidParamsError('not enough arguments')
+            # Does it have too many arguments?
+            if(not self._vargs(method) and len(params) >
+                    self._max_args(method) - 1):
+                raise InvalidParamsError('too many arguments')
+
+            return method(ctx, *params)
+        elif isinstance(params, dict):
+            # Do not accept keyword arguments if the jsonrpc version is
+            # not >=1.1.
+            if request['jsonrpc'] < 11:
+                raise KeywordError
+
+            return method(ctx, **params)
+        else:  # No params
+            return method(ctx)
+
     def call_py(self, ctx, jsondata):
         """
         Calls jsonrpc service's method and returns its return value in python
@@ -184,7 +309,10 @@ class JSONRPCServiceCustom(JSONRPCService):
             self._validate_params_types(request['method'], request['params'])
 
         result = self._call_method(ctx, request)
+        return self.respond(request, result)
 
+    def respond(self, request, result):
+        """Returns the response to request, None for notifications."""
         # Do not respond to notifications.
         if request['id'] is None:
             return None
@@ -252,8 +380,8 @@ class MethodContext(dict):
                         'id': str(_random.random())[2:]
                         }
             body = json.dumps(arg_hash)
-            response = _requests.post(callbackURL, data=body,
-                                      timeout=60)
+            response = http_session.post(callbackURL, data=body,
+                                         timeout=60)
             response.encoding = 'utf-8'
             if response.status_code == 500:
                 if ('content-type' in response.headers and
@@ -538,9 +666,106 @@ class Application(object):
                              name='Catalog.status',
                              types=[dict])
         authurl = config.get(AUTH) if config else None
-        self.auth_client = _KBaseAuth(authurl)
+        if (config or {}).get('token-cache-file'):
+            # share validated tokens and roles with the other workers of the
+            # host, or keep the per-process cache if the file can't be used
+            try:
+                from biokbase.catalog.shared_cache import SharedTokenCache
+                authclient.token_cache = SharedTokenCache(
+                    config['token-cache-file'],
+                    get_config_int('token-cache-size', 4096),
+                    namespace=authurl or '')
+            except (ImportError, OSError, ValueError) as e:
+                logging.warning('Using a per-process token cache: %s', e)
+        self.auth_client = _KBaseAuth(
+            authurl, invalid_ttl=get_config_int('invalid-token-cache-ttl', 0))
+        self.batch_max_workers = get_config_int('batch-max-workers', 0)
+        self.batch_max_size = get_config_int('batch-max-size', 100)
+        self._batch_lock = threading.Lock()
+        self._batch_executor = None
+        self.stream_methods = set(
+            m.strip() for m in (config or {}).get('stream-methods', '').split(',')
+            if m.strip())
+        self.compressor = ResponseCompressor(
+            encodings=[e.strip() for e in (config or {}).get(
+                'compression-encodings', '').split(',') if e.strip()],
+            min_size=get_config_int('compression-min-size', 1024),
+            level=get_config_int('compression-level', 6))
+        self.max_request_size = get_config_int('max-request-size',
+                                               256 * 1024 * 1024)
+        codec.use((config or {}).get('json-codec', 'auto'))
+        metrics.REGISTRY.configure((config or {}).get('metrics-dir'))
+        tracing.configure(config or {})
+        http_session.configure(config or {})
+        # log records are written by a background thread, so that a slow log
+        # sink doesn't hold up requests
+        self.log_queue = None
+        if get_config_int('log-queue-size', 0) > 0:
+            self.log_queue = logqueue.LogQueue(
+                get_config_int('log-queue-size', 0))
+            self.userlog = logqueue.AsyncLog(self.userlog, self.log_queue,
+                                             'user')
+            self.serverlog = logqueue.AsyncLog(self.serverlog, self.log_queue,
+                                               'server')
+            atexit.register(self.log_queue.flush)
+        logqueue.configure_root_logger(
+            (config or {}).get('log-format', 'text'), self.log_queue)
+        self.admission = AdmissionController(config)
+        self.deadlines = deadline.Deadlines(config)
+        self.lanes = Lanes(config)
+        self.lanes.check_limits(self.admission.concurrency_limits)
+        singleflight_methods = frozenset(
+            m.strip() for m in (config or {}).get(
+                'singleflight-methods', '').split(',') if m.strip())
+        for m in singleflight_methods:
+            if self.method_authentication.get(m) != 'none':
+                raise ValueError('singleflight-methods may only list methods '
+                                 'that do not authenticate, not ' + m)
+        self.rpc_service.singleflight_methods = singleflight_methods
+        response_cache_methods = frozenset(
+            m.strip() for m in (config or {}).get(
+                'response-cache-methods', '').split(',') if m.strip())
+        for m in response_cache_methods:
+            if self.method_authentication.get(m) != 'none':
+                raise ValueError('response-cache-methods may only list methods '
+                                 'that do not authenticate, not ' + m)
+            if m in httpcache.UNVERSIONED_METHODS:
+                raise ValueError('response-cache-methods may not list ' + m +
+                                 ', its results change without a new data '
+                                 'generation')
+        # cached results are already encoded, so they are not streamed
+        self.stream_methods -= response_cache_methods
+        # how stale the data generation used by the response and http caches
+        # may be
+        self.generation_poll = get_config_int('response-cache-poll-ms',
+                                              1000) / 1000.0
+        if response_cache_methods:
+            self.rpc_service.response_cache = ResponseCache(
+                response_cache_methods, self.data_generation,
+                max_bytes=get_config_int('response-cache-max-bytes',
+                                         64 * 1024 * 1024))
+        self.http_cache_max_age = get_config_int('http-cache-max-age', 0)
+        self.profiles = None
+        if (config or {}).get('profile-dir'):
+            self.profiles = profiling.ProfileStore(
+                config['profile-dir'],
+                get_config_int('profile-max-count', 100))
+        self.warmup_methods = [
+            m.strip() for m in (config or {}).get('warmup-methods', '').split(',')
+            if m.strip()]
+        for m in self.warmup_methods:
+            if self.method_authentication.get(m) != 'none':
+                raise ValueError('warmup-methods may only list methods that '
+                                 'do not authenticate, not ' + m)
+        self._warmup_lock = threading.Lock()
+        self._warmup = {'pid': None, 'running': False, 'done': False,
+                        'error': None}
+        # the time and result of the last mongo check of readiness
+        self._mongo_check = (None, None)
 
     def __call__(self, environ, start_response):
+        if self._warmup['pid'] != os.getpid():
+            self.start_warm_up()
         # Context object, equivalent to the perl impl CallContext
         ctx = MethodContext(self.userlog)
         ctx['client_ip'] = getIPAddress(environ)
@@ -550,14 +775,54 @@ class Application(object):
             body_size = int(environ.get('CONTENT_LENGTH', 0))
         except (ValueError):
             body_size = 0
+        if environ['REQUEST_METHOD'] == 'GET' and \
+                environ.get('PATH_INFO') == '/metrics':
+            response_body = metrics.REGISTRY.render().encode('utf8')
+            start_response('200 OK', [
+                ('content-type', metrics.CONTENT_TYPE),
+                ('content-length', str(len(response_body)))])
+            return [response_body]
+        if environ['REQUEST_METHOD'] == 'GET' and \
+                environ.get('PATH_INFO', '').startswith('/profiles/'):
+            return self.get_profile(ctx, environ, start_response)
+        if environ['REQUEST_METHOD'] == 'GET' and \
+                environ.get('PATH_INFO') == '/ready':
+            status, report = self.readiness()
+            response_body = codec.dumps(report).encode('utf8')
+            start_response(status, [
+                ('content-type', 'application/json'),
+                ('content-length', str(len(response_body)))])
+            return [response_body]
+        trace = tracing.start_trace('request',
+                                    environ.get('HTTP_TRACEPARENT'),
+                                    client_ip=ctx['client_ip'])
+        encoding = self.compressor.negotiate(
+            environ.get('HTTP_ACCEPT_ENCODING'))
+        cache_headers = []
         if environ['REQUEST_METHOD'] == 'OPTIONS':
             # we basically do nothing and just return headers
             status = '200 OK'
             rpc_result = ""
+        elif environ['REQUEST_METHOD'] == 'GET' and \
+                environ.get('PATH_INFO', '').startswith(httpcache.PREFIX):
+            ctx['response_codec'] = codec.response_codec(
+                environ.get('HTTP_ACCEPT'), None)
+            status, rpc_result, cache_headers = self.process_get(
+                ctx, environ, encoding)
         else:
-            request_body = environ['wsgi.input'].read(body_size)
+            ctx['response_codec'] = codec.response_codec(
+                environ.get('HTTP_ACCEPT'), environ.get('CONTENT_TYPE'))
             try:
-                req = json.loads(request_body)
+                # a body that is too large is not read at all
+                if body_size > self.max_request_size:
+                    raise ValueError('Request body exceeds {} bytes'.format(
+                        self.max_request_size))
+                request_body = decompress(
+                    environ['wsgi.input'].read(body_size),
+                    environ.get('HTTP_CONTENT_ENCODING'),
+                    self.max_request_size)
+                req = codec.request_codec(
+                    environ.get('CONTENT_TYPE')).loads(request_body)
             except ValueError as ve:
                 err = {'error': {'code': -32700,
                                  'name': "Parse error",
@@ -566,71 +831,11 @@ class Application(object):
                        }
                 rpc_result = self.process_error(err, ctx, {'version': '1.1'})
             else:
-                ctx['module'], ctx['method'] = req['method'].split('.')
-                ctx['call_id'] = req['id']
-                ctx['rpc_context'] = {
-                    'call_stack': [{'time': self.now_in_utc(),
-                                    'method': req['method']}
-                                   ]
-                }
-                prov_action = {'service': ctx['module'],
-                               'method': ctx['method'],
-                               'method_params': req['params']
-                               }
-                ctx['provenance'] = [prov_action]
-                try:
-                    token = environ.get('HTTP_AUTHORIZATION')
-                    # parse out the method being requested and check if it
-                    # has an authentication requirement
-                    method_name = req['method']
-                    auth_req = self.method_authentication.get(
-                        method_name, 'none')
-                    if auth_req != 'none':
-                        if token is None and auth_req == 'required':
-                            err = JSONServerError()
-                            err.data = (
-                                'Authentication required for ' +
-                                'Catalog ' +
-                                'but no authentication header was passed')
-                            raise err
-                        elif token is None and auth_req == 'optional':
-                            pass
-                        else:
-                            try:
-                                user = self.auth_client.get_user(token)
-                                ctx['user_id'] = user
-                                ctx['authenticated'] = 1
-                                ctx['token'] = token
-                            except Exception as e:
-                                if auth_req == 'required':
-                                    err = JSONServerError()
-                                    err.data = \
-                                        "Token validation failed: %s" % e
-                                    raise err
-                    if (environ.get('HTTP_X_FORWARDED_FOR')):
-                        self.log(log.INFO, ctx, 'X-Forwarded-For: ' +
-                                 environ.get('HTTP_X_FORWARDED_FOR'))
-                    self.log(log.INFO, ctx, 'start method')
-                    rpc_result = self.rpc_service.call(ctx, req)
-                    self.log(log.INFO, ctx, 'end method')
-                    status = '200 OK'
-                except JSONRPCError as jre:
-                    err = {'error': {'code': jre.code,
-                                     'name': jre.message,
-                                     'message': jre.data
-                                     }
-                           }
-                    trace = jre.trace if hasattr(jre, 'trace') else None
-                    rpc_result = self.process_error(err, ctx, req, trace)
-                except Exception:
-                    err = {'error': {'code': 0,
-                                     'name': 'Unexpected Server Error',
-                                     'message': 'An unexpected server error ' +
-                                                'occurred',
-                                     }
-                           }
-                    rpc_result = self.process_error(err, ctx, req,
-                                                    traceback.format_exc())
+                if isinstance(req, list):
+                    status, rpc_result = self.process_batch(ctx, req, environ)
+                else:
+                    status, rpc_result = self.process_request(
+                        ctx, req, environ, stream=True)
 
         # print('Request method was %s\n' % environ['REQUEST_METHOD'])
         # print('Environment dictionary is:\n%s\n' % pprint.pformat(environ))
@@ -638,19 +843,517 @@ class Application(object):
         # print('Result from the method call is:\n%s\n' % \
         #    pprint.pformat(rpc_result))
 
-        if rpc_result:
-            response_body = rpc_result
-        else:
-            response_body = ''
+        status, response_headers, chunks = self.build_response(
+            ctx, environ, status, rpc_result, encoding, cache_headers, trace)
+        start_response(status, response_headers)
+        return chunks
 
+    def build_response(self, ctx, environ, status, rpc_result, encoding,
+                       cache_headers, trace):
+        """
+        Finishes the trace of a request and returns the http status, headers
+        and body chunks of its response, compressed with encoding if set.
+        """
+        response_codec = get_response_codec(ctx)
         response_headers = [
             ('Access-Control-Allow-Origin', '*'),
             ('Access-Control-Allow-Headers', environ.get(
                 'HTTP_ACCESS_CONTROL_REQUEST_HEADERS', 'authorization')),
-            ('content-type', 'application/json'),
-            ('content-length', str(len(response_body)))]
-        start_response(status, response_headers)
-        return [response_body.encode('utf8')]
+            ('content-type', response_codec.content_type)]
+        if trace is not None:
+            if ctx.get('method'):
+                trace.root.set_attribute('rpc.method', ctx['method'])
+            server_timing = trace.finish()
+            if server_timing:
+                response_headers.append(('Server-Timing', server_timing))
+                response_headers.append(('Timing-Allow-Origin', '*'))
+        if ctx.get('profile_id'):
+            response_headers.append((profiling.ID_HEADER, ctx['profile_id']))
+        if ctx.get('retry_after'):
+            response_headers.append(
+                ('Retry-After', str(max(1, math.ceil(ctx['retry_after'])))))
+        response_headers.extend(cache_headers)
+        vary = []
+        if codec.msgpack is not None:
+            vary.append('Accept')
+        if self.compressor.encodings:
+            vary.append('Accept-Encoding')
+        if vary:
+            response_headers.append(('Vary', ', '.join(vary)))
+        if status == '304 Not Modified':
+            return status, [h for h in response_headers
+                            if h[0] != 'content-type'], []
+
+        if isinstance(rpc_result, dict):
+            # large result, streamed without a content-length
+            try:
+                chunks = self.stream_response(ctx, rpc_result)
+            except Exception:
+                status = '500 Internal Server Error'
+                metrics.RPC_ERRORS.inc(method=ctx['module'] + '.' + ctx['method'])
+                rpc_result = self.process_error(
+                    {'error': {'code': 0,
+                               'name': 'Unexpected Server Error',
+                               'message': 'The result could not be encoded',
+                               }
+                     }, ctx, rpc_result, traceback.format_exc())
+            else:
+                if encoding:
+                    response_headers.append(('content-encoding', encoding))
+                    chunks = self.compressor.compress_iter(chunks, encoding)
+                return status, response_headers, chunks
+
+        if isinstance(rpc_result, bytes):
+            response_body = rpc_result
+        elif rpc_result:
+            response_body = rpc_result.encode('utf8')
+        else:
+            response_body = b''
+        if encoding and len(response_body) >= self.compressor.min_size:
+            response_body = self.compressor.compress(response_body, encoding)
+            response_headers.append(('content-encoding', encoding))
+        response_headers.append(('content-length', str(len(response_body))))
+        return status, response_headers, [response_body]
+
+    def stream_response(self, ctx, respond):
+        """
+        Returns an iterator over the encoded chunks of a streamed response.
+        The first chunk is encoded right away, so that a result that can't be
+        encoded gets an error response instead of a 200. The end of the
+        method is logged once the last chunk has been encoded. A later error
+        is logged and raised, so that the server drops the connection. The
+        body then lacks its closing brackets, so clients can't mistake it for
+        a complete response.
+        """
+        response_codec = get_response_codec(ctx)
+        if response_codec.content_type == codec.JSON_CONTENT_TYPE:
+            chunks = iter_rpc_response(respond)
+        else:
+            chunks = iter([response_codec.dumps(respond)])
+        first = next(chunks, b'')
+
+        def stream():
+            try:
+                yield first
+                for chunk in chunks:
+                    yield chunk
+            except Exception:
+                metrics.RPC_ERRORS.inc(method=ctx['module'] + '.' + ctx['method'])
+                self.log(log.ERR, ctx, 'streaming the response failed: ' +
+                         traceback.format_exc())
+                raise
+            self.log(log.INFO, ctx, 'end method')
+        return stream()
+
+    def process_request(self, ctx, req, environ, stream=False):
+        """
+        Authenticates and runs a single JSON-RPC request, returning the http
+        status and the encoded response (None for notifications). If
+        stream is set and the method is configured for streaming, the
+        response is returned unencoded for iter_rpc_response.
+        """
+        start = time.perf_counter()
+        with metrics.RPC_IN_FLIGHT.track_inprogress():
+            status, rpc_result = self._run_request(ctx, req, environ, stream)
+        self.observe_request(req, status, time.perf_counter() - start)
+        return status, rpc_result
+
+    def known_method(self, method):
+        """
+        Returns method if it is registered, otherwise 'unknown', so that the
+        method names sent by clients can't add metric labels without bound.
+        """
+        if method not in self.rpc_service.method_data:
+            return 'unknown'
+        return method
+
+    def observe_request(self, req, status, seconds):
+        method = self.known_method(req['method'])
+        metrics.RPC_REQUESTS.inc(method=method)
+        if status != '200 OK':
+            metrics.RPC_ERRORS.inc(method=method)
+        metrics.RPC_LATENCY.observe(seconds, method=method)
+
+    def _run_request(self, ctx, req, environ, stream):
+        deadline_token = None
+        try:
+            deadline_token = self.start_deadline(ctx, req, environ)
+            self.start_method(ctx, req, environ)
+            method_name = req['method']
+            with self.admit(ctx, method_name):
+                if stream and method_name in self.stream_methods:
+                    call = self.rpc_service.call_py
+                else:
+                    call = self.rpc_service.call
+                rpc_result = self.lanes.run(method_name, call, ctx, req)
+            # the end of a streamed response is logged once it has been sent
+            if not isinstance(rpc_result, dict):
+                self.log(log.INFO, ctx, 'end method')
+            status = '200 OK'
+        except Exception as e:
+            status, rpc_result = self.request_error(ctx, req, e)
+        finally:
+            deadline.end(deadline_token)
+        return status, rpc_result
+
+    def start_deadline(self, ctx, req, environ):
+        """
+        Sets up the context of a JSON-RPC request and starts its deadline,
+        returning the token to end it with.
+        """
+        ctx['module'], ctx['method'] = req['method'].split('.')
+        ctx['call_id'] = req.get('id')
+        ctx['rpc_context'] = {
+            'call_stack': [{'time': self.now_in_utc(),
+                            'method': req['method']}
+                           ]
+        }
+        prov_action = {'service': ctx['module'],
+                       'method': ctx['method'],
+                       'method_params': req.get('params')
+                       }
+        ctx['provenance'] = [prov_action]
+        # the deadline covers authentication and the method's mongo queries
+        # and http calls
+        try:
+            rpc_context = req.get('context')
+            seconds = self.deadlines.seconds(
+                req['method'], environ.get(deadline.HEADER) or (
+                    rpc_context.get(deadline.CONTEXT_FIELD)
+                    if isinstance(rpc_context, dict) else None))
+        except ValueError as e:
+            err = JSONServerError()
+            err.data = str(e)
+            raise err
+        return deadline.start(seconds)
+
+    def start_method(self, ctx, req, environ, get_user=None):
+        """
+        Authenticates a JSON-RPC request and logs the start of its method.
+        get_user(token), if set, is used instead of the auth client to find
+        the user of the token.
+        """
+        token = environ.get('HTTP_AUTHORIZATION')
+        self.authenticate(ctx, req['method'], token, get_user)
+        if (environ.get('HTTP_X_FORWARDED_FOR')):
+            self.log(log.INFO, ctx, 'X-Forwarded-For: ' +
+                     environ.get('HTTP_X_FORWARDED_FOR'))
+        if environ.get(profiling.HEADER):
+            if self.profiles is None or \
+                    not self.is_admin_request(ctx, token):
+                err = JSONServerError()
+                err.data = ('Profiling is not enabled or the token is '
+                            'not a catalog admin token')
+                raise err
+            ctx['profiler'] = self.profiles
+        self.log(log.INFO, ctx, 'start method')
+
+    def authenticate(self, ctx, method_name, token, get_user=None):
+        # parse out the method being requested and check if it
+        # has an authentication requirement
+        auth_req = self.method_authentication.get(
+            method_name, 'none')
+        if auth_req != 'none':
+            if token is None and auth_req == 'required':
+                err = JSONServerError()
+                err.data = (
+                    'Authentication required for ' +
+                    'Catalog ' +
+                    'but no authentication header was passed')
+                raise err
+            elif token is None and auth_req == 'optional':
+                pass
+            else:
+                try:
+                    user = (get_user or self.auth_client.get_user)(token)
+                    ctx['user_id'] = user
+                    ctx['authenticated'] = 1
+                    ctx['token'] = token
+                except Exception as e:
+                    if deadline.is_timeout(e):
+                        raise deadline.DeadlineExceededError(
+                            'Token validation did not finish before '
+                            'the request deadline')
+                    if auth_req == 'required':
+                        err = JSONServerError()
+                        err.data = \
+                            "Token validation failed: %s" % e
+                        raise err
+
+    @contextlib.contextmanager
+    def admit(self, ctx, method_name):
+        """
+        Holds the admission of a method call and traces it. Raises
+        RateLimitedError if the call is over a limit.
+        """
+        user = ctx['user_id'] or 'ip:%s' % ctx['client_ip']
+        method_name = self.known_method(method_name)
+        with self.admission.admit(method_name, user), \
+                tracing.span('rpc.' + method_name):
+            yield
+
+    def request_error(self, ctx, req, e):
+        """
+        Returns the http status and the encoded error response for the
+        exception e of a request. Must be called while handling e.
+        """
+        status = '500 Internal Server Error'
+        if isinstance(e, RateLimitedError):
+            status = '429 Too Many Requests'
+            ctx['retry_after'] = e.retry_after
+            err = {'error': {'code': e.code,
+                             'name': e.message,
+                             'message': e.data
+                             }
+                   }
+            rpc_result = self.process_error(err, ctx, req)
+        elif isinstance(e, deadline.DeadlineExceededError):
+            status = '504 Gateway Timeout'
+            deadline.EXCEEDED.inc(method=self.known_method(req['method']))
+            err = {'error': {'code': e.code,
+                             'name': e.message,
+                             'message': e.data
+                             }
+                   }
+            rpc_result = self.process_error(err, ctx, req)
+        elif isinstance(e, JSONRPCError):
+            err = {'error': {'code': e.code,
+                             'name': e.message,
+                             'message': e.data
+                             }
+                   }
+            trace = e.trace if hasattr(e, 'trace') else None
+            rpc_result = self.process_error(err, ctx, req, trace)
+        else:
+            err = {'error': {'code': 0,
+                             'name': 'Unexpected Server Error',
+                             'message': 'An unexpected server error ' +
+                                        'occurred',
+                             }
+                   }
+            rpc_result = self.process_error(err, ctx, req,
+                                            traceback.format_exc())
+        return status, rpc_result
+
+    def process_get(self, ctx, environ, encoding):
+        """
+        Runs a GET of a method that needs no authentication (see httpcache),
+        returning the http status, the encoded response (None for a 304) and
+        the caching headers. The ETag is made from the data generation read
+        before the method runs, so it never claims newer data than the
+        response holds.
+        """
+        no_store = [('Cache-Control', httpcache.NO_STORE)]
+        try:
+            req = httpcache.parse_request(environ['PATH_INFO'],
+                                          environ.get('QUERY_STRING'))
+        except ValueError as ve:
+            err = {'error': {'code': -32700,
+                             'name': "Parse error",
+                             'message': str(ve),
+                             }
+                   }
+            return ('400 Bad Request',
+                    self.process_error(err, ctx, {'version': '1.1'}),
+                    no_store)
+        if self.method_authentication.get(req['method']) != 'none':
+            err = {'error': {'code': MethodNotFoundError.code,
+                             'name': MethodNotFoundError.message,
+                             'message': 'No method %s can be called with GET'
+                                        % req['method'],
+                             }
+                   }
+            return ('404 Not Found', self.process_error(err, ctx, req),
+                    no_store)
+        tag = None
+        if req['method'] not in httpcache.UNVERSIONED_METHODS:
+            try:
+                tag = httpcache.etag(self.data_generation(),
+                                     get_response_codec(ctx).name, encoding)
+            except Exception:
+                # mongo can't be reached, the method will report the error
+                pass
+        if tag is None:
+            return self.process_request(ctx, req, environ) + (no_store,)
+        headers = [('ETag', tag), ('Cache-Control', httpcache.cache_control(
+            self.http_cache_max_age))]
+        if httpcache.matches(environ.get('HTTP_IF_NONE_MATCH'), tag):
+            metrics.RPC_NOT_MODIFIED.inc(method=req['method'])
+            return '304 Not Modified', None, headers
+        status, rpc_result = self.process_request(ctx, req, environ)
+        return status, rpc_result, headers if status == '200 OK' else no_store
+
+    def data_generation(self):
+        return impl_Catalog.get_controller().get_data_generation(
+            self.generation_poll)
+
+    def process_batch(self, ctx, reqs, environ):
+        """
+        Runs each request of a JSON-RPC batch through process_request. Errors
+        are reported per request and responses keep the order of the batch.
+        If batch-max-workers is set the requests run concurrently on a
+        bounded thread pool, otherwise one after another.
+        """
+        if not reqs or len(reqs) > self.batch_max_size:
+            err = {'error': {'code': InvalidRequestError.code,
+                             'name': InvalidRequestError.message,
+                             'message': 'Batch must contain between 1 and ' +
+                                        '%d requests' % self.batch_max_size,
+                             }
+                   }
+            return ('500 Internal Server Error',
+                    self.process_error(err, ctx, {'version': '1.1'}))
+
+        def run(req):
+            sub_ctx = MethodContext(self.userlog)
+            sub_ctx['client_ip'] = ctx['client_ip']
+            sub_ctx['response_codec'] = ctx.get('response_codec')
+            if not isinstance(req, dict) or not isinstance(
+                    req.get('method'), str) or '.' not in req['method']:
+                err = {'error': {'code': InvalidRequestError.code,
+                                 'name': InvalidRequestError.message,
+                                 'message': 'Malformed request in batch',
+                                 }
+                       }
+                request = req if isinstance(req, dict) else {}
+                return self.process_error(err, sub_ctx, request)
+            return self.process_request(sub_ctx, req, environ)[1]
+
+        executor = self.get_batch_executor()
+        if executor is None:
+            results = [run(r) for r in reqs]
+        else:
+            # each request runs in a copy of this thread's context so its
+            # spans are added to the trace of the batch
+            contexts = [contextvars.copy_context() for _ in reqs]
+            results = list(executor.map(
+                lambda c, r: c.run(run, r), contexts, reqs))
+        # notifications have no response
+        return '200 OK', get_response_codec(ctx).join(
+            [r for r in results if r])
+
+    def start_warm_up(self):
+        """
+        Warms up this worker process in the background, unless that is already
+        running or done: creates the catalog controller and with it the
+        connection to mongo, then calls each of the warmup-methods once.
+        """
+        with self._warmup_lock:
+            state = self._warmup
+            if state['pid'] == os.getpid() and (state['running'] or
+                                                state['done']):
+                return
+            self._warmup = {'pid': os.getpid(), 'running': True,
+                            'done': False, 'error': None}
+        threading.Thread(target=self._warm_up, name='catalog-warmup',
+                         daemon=True).start()
+
+    def _warm_up(self):
+        error = None
+        try:
+            impl_Catalog.get_controller()
+            for m in self.warmup_methods:
+                ctx = MethodContext(self.userlog)
+                ctx['module'], ctx['method'] = m.split('.')
+                self.rpc_service.method_data[m]['method'](ctx, {})
+        except Exception as e:
+            error = '%s: %s' % (type(e).__name__, e)
+            ctx = MethodContext(self.userlog)
+            self.log(log.ERR, ctx, 'warm up failed: ' + error)
+        with self._warmup_lock:
+            self._warmup.update(running=False, done=error is None, error=error)
+
+    def readiness(self):
+        """
+        Returns the http status and a report of whether this worker is ready
+        to serve requests: it has warmed up and can reach mongo. A failed warm
+        up is retried. The mongo check is reused for READY_CHECK_SECONDS, so
+        that frequent probes don't add load.
+        """
+        with self._warmup_lock:
+            state = dict(self._warmup)
+        if state['pid'] != os.getpid() or state['error']:
+            self.start_warm_up()
+        if state['pid'] != os.getpid() or state['running']:
+            checks = {'warmup': 'running'}
+        elif state['error']:
+            checks = {'warmup': state['error']}
+        else:
+            checks = {'warmup': None, 'mongo': self.check_mongo()}
+        ready = all(v is None for v in checks.values())
+        report = {'ready': ready,
+                  'checks': {k: v or 'ok' for k, v in checks.items()}}
+        if ready:
+            return '200 OK', report
+        return '503 Service Unavailable', report
+
+    def check_mongo(self):
+        """
+        Returns None if mongo can be reached, otherwise an error message. The
+        result is reused for READY_CHECK_SECONDS.
+        """
+        checked, error = self._mongo_check
+        now = time.monotonic()
+        if checked is None or now - checked >= READY_CHECK_SECONDS:
+            error = impl_Catalog.get_controller().check_mongo()
+            self._mongo_check = (now, error)
+        return error
+
+    def is_admin_request(self, ctx, token):
+        """
+        Returns True if the request was made with the token of a catalog
+        admin.
+        """
+        if not token:
+            return False
+        try:
+            user = ctx['user_id'] or self.auth_client.get_user(token)
+            return impl_Catalog.get_controller().is_admin(user, token)
+        except Exception as e:
+            self.log(log.ERR, ctx, 'admin check failed: %s' % e)
+            return False
+
+    def get_profile(self, ctx, environ, start_response):
+        """
+        Serves GET /profiles/<id>: a text report of a stored profile, or its
+        pstats file with ?format=pstats. Only for catalog admins.
+        """
+        profile_id = environ['PATH_INFO'][len('/profiles/'):]
+        raw = 'format=pstats' in environ.get('QUERY_STRING', '').split('&')
+        headers = [('content-type', 'text/plain; charset=utf-8')]
+        if self.profiles is None:
+            status, body = '404 Not Found', b'Profiling is not enabled'
+        elif not self.is_admin_request(
+                ctx, environ.get('HTTP_AUTHORIZATION')):
+            status, body = '403 Forbidden', b'Only catalog admins may ' + \
+                b'read profiles'
+        elif self.profiles.path(profile_id) is None:
+            status, body = '404 Not Found', b'No such profile'
+        elif raw:
+            status = '200 OK'
+            with open(self.profiles.path(profile_id), 'rb') as f:
+                body = f.read()
+            headers = [('content-type', 'application/octet-stream'),
+                       ('content-disposition',
+                        'attachment; filename=%s.prof' % profile_id)]
+        else:
+            status = '200 OK'
+            body = self.profiles.report(profile_id).encode('utf8')
+        headers.append(('content-length', str(len(body))))
+        start_response(status, headers)
+        return [body]
+
+    def get_batch_executor(self):
+        # created on first use so that uwsgi workers don't inherit threads
+        # from the master process
+        if self.batch_max_workers < 2:
+            return None
+        with self._batch_lock:
+            if self._batch_executor is None:
+                self._batch_executor = ThreadPoolExecutor(
+                    max_workers=self.batch_max_workers,
+                    thread_name_prefix='rpc-batch')
+        return self._batch_executor
 
     def process_error(self, error, context, request, trace=None):
         if trace:
@@ -668,7 +1371,7 @@ class Application(object):
         else:
             error['version'] = '1.0'
             error['error']['error'] = trace
-        return json.dumps(error)
+        return get_response_codec(context).dumps(error)
 
     def now_in_utc(self):
         # noqa Taken from http://stackoverflow.com/questions/3401428/how-to-get-an-isoformat-datetime-string-including-the-default-timezone @IgnorePep8
@@ -706,6 +1409,9 @@ try:
         from gevent import monkey
         monkey.patch_all()
     uwsgi.applications = {'': application}
+    # warm up each worker as soon as it is forked
+    from uwsgidecorators import postfork
+    postfork(application.start_warm_up)
 except ImportError:
     # Not available outside of wsgi, ignore
     pass
@@ -742,6 +1448,25 @@ def stop_server():
     _proc = None
 
 
+def start_prefork_server(host='localhost', port=9999, workers=2, threads=8):
+    '''
+    Runs the server with a pool of worker processes, each serving requests on
+    a pool of threads, until it is sent SIGTERM or SIGINT. Workers get up to
+    shutdown-drain-timeout (plus a margin) to finish their requests and
+    module registrations when the server stops.'''
+
+    def stop_worker():
+        if application.log_queue is not None:
+            application.log_queue.flush()
+
+    application.lanes.check_threads(threads)
+    PreforkServer(
+        application, host=host, port=port, workers=workers, threads=threads,
+        graceful_timeout=get_config_int('shutdown-drain-timeout', 60) + 10,
+        on_worker_start=application.start_warm_up,
+        on_worker_stop=stop_worker).serve()
+
+
 def process_async_cli(input_file_path, output_file_path, token):
     exit_code = 0
     with open(input_file_path) as data_file:
@@ -802,23 +1527,35 @@ if __name__ == "__main__":
                 token = sys.argv[3]
         sys.exit(process_async_cli(sys.argv[1], sys.argv[2], token))
     try:
-        opts, args = getopt(sys.argv[1:], "", ["port=", "host="])
+        opts, args = getopt(sys.argv[1:], "", ["port=", "host=", "workers=",
+                                               "threads="])
     except GetoptError as err:
         # print help information and exit:
         print(str(err))  # will print something like "option -a not recognized"
         sys.exit(2)
     port = 9999
     host = 'localhost'
+    workers = 0
+    threads = 8
     for o, a in opts:
         if o == '--port':
             port = int(a)
         elif o == '--host':
             host = a
             print("Host set to %s" % host)
+        elif o == '--workers':
+            workers = int(a)
+        elif o == '--threads':
+            threads = int(a)
         else:
             assert False, "unhandled option"
 
-    start_server(host=host, port=port)
+    if workers > 0:
+        # pre-forked worker processes, each with a pool of threads
+        start_prefork_server(host=host, port=port, workers=workers,
+                             threads=threads)
+    else:
+        start_server(host=host, port=port)
 #    print("Listening on port %s" % port)
 #    httpd = make_server( host, port, application)
 #
@@ -0,0 +1,162 @@
+'''
+Admission control for the catalog server.  Before a request runs it has to get a token
+from its user's bucket and from its method's bucket, and a slot under its method's
+concurrency cap.  Requests that don't are rejected right away with a RateLimitedError
+(sent as a JSON-RPC error with http status 429) instead of queuing behind the expensive
+calls.  Limits are per worker process.
+
+Configured with:
+    rate-limit-per-user = <rate>/<burst>
+        requests per second for each user (or client ip for anonymous calls)
+    rate-limit-methods = <method>=<rate>/<burst>, ...
+        requests per second for a method over all users
+    concurrency-limits = <method>=<max>, ...
+        requests of a method that may run at the same time
+'''
+import collections
+import contextlib
+import threading
+import time
+
+from jsonrpcbase import JSONRPCError
+
+from biokbase.catalog import metrics
+
+REJECTIONS = metrics.Counter('catalog_rpc_rejections_total',
+                             'JSON-RPC requests rejected by admission control',
+                             ['method', 'reason'])
+
+
+class RateLimitedError(JSONRPCError):
+    code = -32029
+    message = 'Too many requests'
+
+    def __init__(self, data, retry_after):
+        super().__init__()
+        self.data = data
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        ''' returns 0 if a token was taken, or the seconds until one will be available '''
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return (1 - self._tokens) / self.rate
+
+    def full(self):
+        with self._lock:
+            elapsed = time.monotonic() - self._updated
+            return self._tokens + elapsed * self.rate >= self.burst
+
+
+def parse_rate(value):
+    ''' parses <rate>/<burst>, the burst defaults to the rate '''
+    rate, _, burst = value.partition('/')
+    rate = float(rate)
+    burst = float(burst) if burst else max(rate, 1.0)
+    if rate <= 0 or burst < 1:
+        raise ValueError('Invalid rate limit: ' + value)
+    return rate, burst
+
+
+def parse_method_limits(value, parse):
+    limits = {}
+    for item in (value or '').split(','):
+        if not item.strip():
+            continue
+        method, sep, limit = item.partition('=')
+        if not sep:
+            raise ValueError('Expected <method>=<limit>, got: ' + item.strip())
+        limits[method.strip()] = parse(limit.strip())
+    return limits
+
+
+class AdmissionController:
+
+    def __init__(self, config, max_users=10000):
+        config = config or {}
+        user_rate = (config.get('rate-limit-per-user') or '').strip()
+        self.user_rate = parse_rate(user_rate) if user_rate else None
+        self.method_buckets = {
+            m: TokenBucket(*r) for m, r in parse_method_limits(
+                config.get('rate-limit-methods'), parse_rate).items()}
+        self.concurrency_limits = parse_method_limits(config.get('concurrency-limits'), int)
+        self.max_users = max_users
+        self._user_buckets = collections.OrderedDict()
+        self._running = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.user_rate or self.method_buckets or self.concurrency_limits)
+
+    @contextlib.contextmanager
+    def admit(self, method, user):
+        '''
+        context manager holding a concurrency slot while the request runs.  Raises
+        RateLimitedError if the request is over a limit.
+        '''
+        if self.user_rate:
+            wait = self._user_bucket(user).take()
+            if wait:
+                self._reject(method, 'user_rate', wait,
+                             'Rate limit exceeded for {}'.format(user))
+        bucket = self.method_buckets.get(method)
+        if bucket is not None:
+            wait = bucket.take()
+            if wait:
+                self._reject(method, 'method_rate', wait,
+                             'Rate limit exceeded for {}'.format(method))
+        limit = self.concurrency_limits.get(method)
+        if limit is None:
+            yield
+            return
+        with self._lock:
+            if self._running[method] >= limit:
+                full = True
+            else:
+                full = False
+                self._running[method] += 1
+        if full:
+            self._reject(method, 'concurrency', 1,
+                         'Too many concurrent {} requests, the limit is {}'.format(
+                             method, limit))
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._running[method] -= 1
+
+    def _user_bucket(self, user):
+        with self._lock:
+            bucket = self._user_buckets.get(user)
+            if bucket is not None:
+                self._user_buckets.move_to_end(user)
+                return bucket
+            bucket = self._user_buckets[user] = TokenBucket(*self.user_rate)
+            if len(self._user_buckets) > self.max_users:
+                # forgetting a full bucket doesn't change any user's limit
+                for u in list(self._user_buckets)[:len(self._user_buckets) // 10]:
+                    if self._user_buckets[u].full():
+                        del self._user_buckets[u]
+                if len(self._user_buckets) > self.max_users:
+                    self._user_buckets.popitem(last=False)
+            return bucket
+
+    def _reject(self, method, reason, retry_after, message):
+        REJECTIONS.inc(method=method, reason=reason)
+        raise RateLimitedError(message, retry_after)
@@ -0,0 +1,309 @@
+'''
+ASGI entry point for the catalog, for running the service under an asyncio server
+(e.g. uvicorn biokbase.catalog.asgi:application --port 5000) alongside or instead of
+the uwsgi deployment of Server.py.
+
+The hot read-only methods in AsyncCatalog are served directly on the event loop with
+the motor based AsyncMongoCatalogDBI, so a single process can hold many concurrent slow
+requests.  These requests go through the same steps of the WSGI Application from Server.py
+(deadline, authentication, admission, tracing, method logging, metrics and compression);
+only the method itself is awaited instead of called.  Every other request (writes, admin
+methods, batches, profiled calls and methods on a lane or in the response cache) is handed
+unchanged to the WSGI Application on a bounded thread pool, so behavior is identical to the
+uwsgi deployment.
+'''
+import asyncio
+import contextvars
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from jsonrpcbase import JSONRPCError
+
+import biokbase.catalog.version
+from biokbase import log
+from biokbase.catalog import Server, builds, codec, deadline, metrics, profiling, tracing
+from biokbase.catalog.compression import decompress
+from biokbase.catalog.async_db import AsyncMongoCatalogDBI
+from biokbase.catalog.controller import (basic_module_info_query, format_basic_module_info,
+                                         client_group_app_ids, format_client_groups)
+
+
+class AsyncCatalog:
+    ''' asyncio versions of the read-only Impl methods, returning the same results '''
+
+    def __init__(self, db):
+        self.db = db
+
+    async def version(self, ctx):
+        return [biokbase.catalog.version.CATALOG_VERSION]
+
+    async def status(self, ctx):
+        return Server.impl_Catalog.status(ctx)
+
+    async def is_registered(self, ctx, params):
+        registered = await self.db.is_registered(module_name=params.get('module_name', ''),
+                                                 git_url=params.get('git_url', ''))
+        return [1 if registered else 0]
+
+    async def list_basic_module_info(self, ctx, params):
+        query = basic_module_info_query(params)
+        if query is None:
+            return [[]]
+        return [format_basic_module_info(await self.db.find_basic_module_info(query))]
+
+    async def list_service_modules(self, ctx, filter):
+        if 'tag' in filter:
+            if filter['tag'] not in ['dev', 'beta', 'release']:
+                raise ValueError('tag parameter must be either "dev", "beta", or "release".')
+            return [await self.db.list_service_module_versions_with_tag(filter['tag'])]
+        return [await self.db.list_all_released_service_module_versions()]
+
+    async def get_client_groups(self, ctx, params):
+        groups = await self.db.list_client_groups(client_group_app_ids(params))
+        return [format_client_groups(groups)]
+
+
+class ASGIApplication:
+
+    def __init__(self, wsgi_app, config):
+        self.wsgi_app = wsgi_app
+        self.config = config or {}
+        self.executor = ThreadPoolExecutor(
+            max_workers=Server.get_config_int('asgi-threads', 16),
+            thread_name_prefix='asgi-wsgi')
+        self.catalog = None
+        self.handlers = {}
+        # startup runs once, when lifespan starts or on the first request, even if it
+        # leaves no handlers (all of them on a lane or in the response cache)
+        self.started = False
+        self.start_lock = asyncio.Lock()
+
+    def startup(self):
+        # the motor client must be created inside the running event loop
+        db = AsyncMongoCatalogDBI(self.config['mongodb-host'],
+                                  self.config['mongodb-database'],
+                                  self.config.get('mongodb-user', ''),
+                                  self.config.get('mongodb-pwd', ''),
+                                  self.config.get('mongodb-authmechanism', 'DEFAULT'))
+        self.catalog = AsyncCatalog(db)
+        cache = self.wsgi_app.rpc_service.response_cache
+        for name in ['version', 'status', 'is_registered', 'list_basic_module_info',
+                     'list_service_modules', 'get_client_groups']:
+            method = 'Catalog.' + name
+            # lanes and the response cache are applied by the WSGI application
+            if method in self.wsgi_app.lanes.methods or (
+                    cache is not None and method in cache.methods):
+                continue
+            self.handlers[method] = getattr(self.catalog, name)
+
+    async def start(self):
+        async with self.start_lock:
+            if not self.started:
+                self.startup()
+                self.started = True
+
+    def shutdown(self):
+        if self.catalog is not None:
+            self.catalog.db.mongo.close()
+        self.executor.shutdown(wait=True)
+        builds.registry.shutdown()
+        if self.wsgi_app.log_queue is not None:
+            self.wsgi_app.log_queue.flush()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            raise ValueError('Unsupported ASGI scope type: ' + scope['type'])
+        if not self.started:
+            # servers that do not send lifespan events
+            await self.start()
+
+        environ = self._environ(scope, await self._read_body(receive))
+        req = self._async_request(environ)
+        if req is not None:
+            status, headers, chunks = await self._call_async(environ, req)
+        else:
+            loop = asyncio.get_event_loop()
+            status, headers, chunks = await loop.run_in_executor(
+                self.executor, self._call_wsgi, environ)
+
+        await send({'type': 'http.response.start',
+                    'status': int(status.split(' ', 1)[0]),
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1'))
+                                for k, v in headers]})
+        for chunk in chunks:
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self.start()
+                except Exception as e:
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _read_body(self, receive):
+        ''' reads the request body, stopping once it is longer than max-request-size '''
+        body = []
+        size = 0
+        while True:
+            message = await receive()
+            body.append(message.get('body', b''))
+            size += len(body[-1])
+            if not message.get('more_body') or size > self.wsgi_app.max_request_size:
+                return b''.join(body)
+
+    def _async_request(self, environ):
+        '''
+        returns the request if it is a single call of a method served on the event loop,
+        otherwise None.  Anything the WSGI application rejects, batches and profiled calls are
+        left to it.
+        '''
+        if environ['REQUEST_METHOD'] != 'POST' or environ.get(profiling.HEADER):
+            return None
+        try:
+            body = decompress(environ['wsgi.input'].getvalue(),
+                              environ.get('HTTP_CONTENT_ENCODING'),
+                              self.wsgi_app.max_request_size)
+            req = codec.request_codec(environ.get('CONTENT_TYPE')).loads(body)
+        except ValueError:
+            return None
+        if isinstance(req, dict) and req.get('method') in self.handlers:
+            return req
+        return None
+
+    async def _call_async(self, environ, req):
+        ''' same as the WSGI application's __call__ for a request served on the event loop '''
+        app = self.wsgi_app
+        ctx = Server.MethodContext(app.userlog)
+        ctx['client_ip'] = Server.getIPAddress(environ)
+        ctx['response_codec'] = codec.response_codec(environ.get('HTTP_ACCEPT'),
+                                                     environ.get('CONTENT_TYPE'))
+        trace = tracing.start_trace('request', environ.get('HTTP_TRACEPARENT'),
+                                    client_ip=ctx['client_ip'])
+        encoding = app.compressor.negotiate(environ.get('HTTP_ACCEPT_ENCODING'))
+        start = time.perf_counter()
+        with metrics.RPC_IN_FLIGHT.track_inprogress():
+            status, rpc_result = await self._run_async(ctx, req, environ)
+        app.observe_request(req, status, time.perf_counter() - start)
+        return app.build_response(ctx, environ, status, rpc_result, encoding, [], trace)
+
+    async def _run_async(self, ctx, req, environ):
+        ''' same as the WSGI application's _run_request, awaiting the method '''
+        app = self.wsgi_app
+        deadline_token = None
+        try:
+            deadline_token = app.start_deadline(ctx, req, environ)
+            get_user = await self._resolve_user(req['method'],
+                                                environ.get('HTTP_AUTHORIZATION'))
+            app.start_method(ctx, req, environ, get_user)
+            with app.admit(ctx, req['method']):
+                rpc_result = await self._call_method(ctx, req)
+            app.log(log.INFO, ctx, 'end method')
+            status = '200 OK'
+        except Exception as e:
+            status, rpc_result = app.request_error(ctx, req, e)
+        finally:
+            deadline.end(deadline_token)
+        return status, rpc_result
+
+    async def _call_method(self, ctx, req):
+        rpc_service = self.wsgi_app.rpc_service
+        request = rpc_service._get_default_vals()
+        rpc_service._fill_request(request, req)
+        rpc_service._validate_params_types(request['method'], request['params'])
+        handler = self.handlers[request['method']]
+        # checks the arguments and creates the coroutine
+        call = rpc_service._invoke(ctx, request, handler, request['params'])
+        try:
+            result = await asyncio.wait_for(call, deadline.remaining())
+        except asyncio.TimeoutError:
+            raise deadline.DeadlineExceededError(
+                '%s did not finish before the request deadline' % request['method'])
+        except JSONRPCError:
+            raise
+        except Exception as e:
+            raise rpc_service.method_error(request, e)
+        respond = rpc_service.respond(request, result)
+        if respond is None:
+            return None
+        with tracing.span('encode'):
+            return ctx['response_codec'].dumps(respond)
+
+    async def _resolve_user(self, method, token):
+        '''
+        looks up the user of the token off the event loop when the method needs it, returning
+        a get_user for Application.start_method that doesn't block
+        '''
+        if token is None or self.wsgi_app.method_authentication.get(method, 'none') == 'none':
+            return None
+        try:
+            user = await self.get_user(token)
+        except Exception as e:
+            error = e
+
+            def get_user(token):
+                raise error
+            return get_user
+        return lambda token: user
+
+    async def get_user(self, token):
+        user = self.wsgi_app.auth_client.get_cached_user(token)
+        if user:
+            return user
+        # the auth client blocks on the auth service, keep it off the event loop.  It runs in a
+        # copy of this context, so that the request's deadline and trace apply.
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(self.executor, contextvars.copy_context().run,
+                                          self.wsgi_app.auth_client.get_user, token)
+
+    def _environ(self, scope, body):
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', ''),
+            'PATH_INFO': scope['path'],
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+        }
+        if scope.get('client'):
+            environ['REMOTE_ADDR'] = scope['client'][0]
+        for name, value in scope['headers']:
+            key = name.decode('latin-1').upper().replace('-', '_')
+            if key in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+                environ[key] = value.decode('latin-1')
+            else:
+                environ['HTTP_' + key] = value.decode('latin-1')
+        return environ
+
+    def _call_wsgi(self, environ):
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = status
+            response['headers'] = headers
+
+        result = self.wsgi_app(environ, start_response)
+        try:
+            chunks = list(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], chunks
+
+
+application = ASGIApplication(Server.application, Server.config)
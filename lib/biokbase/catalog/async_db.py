@@ -0,0 +1,71 @@
+'''
+asyncio implementation of the read-only MongoCatalogDBI paths used by the ASGI entry
+point (asgi.py).  Queries are issued through motor, so a slow Mongo call only parks a
+coroutine instead of holding a worker thread.  The queries and the processing of their
+results are shared with MongoCatalogDBI, so both interfaces return the same data.  As in
+MongoCatalogDBI, the queries get the time left before the request deadline as their maxTimeMS,
+so that mongo stops a query once the request has been abandoned.
+
+motor is an optional dependency and is only needed when running the ASGI server.
+'''
+from biokbase.catalog.db import (DeadlineCollection, MongoCatalogDBI, BASIC_MODULE_INFO_FIELDS,
+                                 RELEASED_SERVICE_VERSIONS_FIELDS,
+                                 RELEASED_SERVICE_VERSIONS_QUERY, SERVICE_MODULES_QUERY,
+                                 apply_version_info, client_group_fields, filter_client_groups,
+                                 module_query, service_module_fields,
+                                 service_versions_with_tag, versions_query)
+
+try:
+    from motor.motor_asyncio import AsyncIOMotorClient
+except ImportError:  # pragma: no cover
+    AsyncIOMotorClient = None
+
+
+class AsyncMongoCatalogDBI:
+
+    def __init__(self, mongo_host, mongo_db, mongo_user, mongo_psswd, mongo_authMechanism):
+        if AsyncIOMotorClient is None:
+            raise ImportError('The motor package is required for the asyncio catalog DB '
+                              'interface')
+        kwargs = {}
+        if mongo_user and mongo_psswd:
+            kwargs = {'username': mongo_user, 'password': mongo_psswd, 'authSource': mongo_db}
+            if mongo_authMechanism and mongo_authMechanism != 'DEFAULT':
+                kwargs['authMechanism'] = mongo_authMechanism
+        self.mongo = AsyncIOMotorClient('mongodb://' + mongo_host, **kwargs)
+
+        self.db = self.mongo[mongo_db]
+        self.modules = DeadlineCollection(self.db[MongoCatalogDBI._MODULES])
+        self.module_versions = DeadlineCollection(self.db[MongoCatalogDBI._MODULE_VERSIONS])
+        self.client_groups = DeadlineCollection(self.db[MongoCatalogDBI._CLIENT_GROUPS])
+
+    async def is_registered(self, module_name='', git_url=''):
+        if not module_name and not git_url:
+            return False
+        query = module_query(module_name=module_name, git_url=git_url)
+        module = await self.modules.find_one(query, ['_id'])
+        return module is not None
+
+    async def find_basic_module_info(self, query):
+        return await self.modules.find(query, BASIC_MODULE_INFO_FIELDS).to_list(None)
+
+    async def substitute_hashes_for_version_info(self, module_list):
+        versions = await self.module_versions.find(versions_query(module_list),
+                                                   {'_id': 0}).to_list(None)
+        return apply_version_info(module_list, versions)
+
+    async def list_service_module_versions_with_tag(self, tag):
+        mods = await self.modules.find(SERVICE_MODULES_QUERY,
+                                       service_module_fields(tag)).to_list(None)
+        await self.substitute_hashes_for_version_info(mods)
+        return service_versions_with_tag(mods, tag)
+
+    async def list_all_released_service_module_versions(self):
+        return await self.module_versions.find(RELEASED_SERVICE_VERSIONS_QUERY,
+                                               RELEASED_SERVICE_VERSIONS_FIELDS).to_list(None)
+
+    async def list_client_groups(self, app_ids):
+        groups = await self.client_groups.find({}, client_group_fields(app_ids)).to_list(None)
+        if app_ids is not None:
+            return filter_client_groups(groups, app_ids)
+        return groups
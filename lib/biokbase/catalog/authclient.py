@@ -5,54 +5,198 @@ A very basic KBase auth client for the Python server.
 
 @author: gaprice@lbl.gov
 '''
+import collections as _collections
+import heapq as _heapq
 import time as _time
-import requests as _requests
 import threading as _threading
 import hashlib
 
+from biokbase.catalog import http_session, metrics, tracing
+
+ROLE_CACHE_HITS = metrics.Counter('catalog_admin_role_cache_hits_total',
+                                  'Admin checks answered from the role cache')
+ROLE_CACHE_MISSES = metrics.Counter('catalog_admin_role_cache_misses_total',
+                                    'Admin checks that fetched the roles from auth')
+TOKEN_REJECTIONS = metrics.Counter('catalog_auth_token_rejections_total',
+                                   'Invalid or expired tokens rejected by the auth service or '
+                                   'from the cache of rejected tokens', ['source'])
+INVALID_TOKENS = metrics.Gauge('catalog_auth_invalid_token_cache_entries',
+                               'Tokens in the cache of rejected tokens')
+# the most rejected tokens, by the first characters of their hash, so that a client retrying
+# a bad token can be told apart without adding a series for every token
+TOP_REJECTED_TOKENS = 5
+REJECTED_TOKENS = metrics.Gauge('catalog_auth_rejected_token_hits',
+                                'Rejections from the cache of rejected tokens, for the {} most '
+                                'rejected tokens'.format(TOP_REJECTED_TOKENS), ['token'])
+
+
+class _Stripe(object):
+    ''' One lock's worth of an LRU cache: entries in least to most recently used order. '''
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.lock = _threading.Lock()
+        self.entries = _collections.OrderedDict()  # key -> (value, time added)
+
+
+class _LRUCache(object):
+    '''
+    A bounded LRU cache whose entries expire max_age seconds after they are added.  Keys are
+    spread over several independently locked stripes, and every operation is O(1): a full
+    stripe evicts its expired entries and then its least recently used one.
+    '''
+
+    def __init__(self, maxsize, max_age, stripes=16):
+        stripes = max(1, min(stripes, maxsize))
+        self._max_age = max_age
+        self._stripes = [_Stripe(maxsize // stripes + (1 if i < maxsize % stripes else 0))
+                         for i in range(stripes)]
+
+    def _stripe(self, key):
+        return self._stripes[hash(key) % len(self._stripes)]
+
+    def get(self, key, max_age=None):
+        ''' Returns the value of key if it was added less than max_age seconds ago, or None. '''
+        stripe = self._stripe(key)
+        with stripe.lock:
+            entry = stripe.entries.get(key)
+            if entry is None:
+                return None
+            age = _time.monotonic() - entry[1]
+            if age > self._max_age:
+                del stripe.entries[key]
+                return None
+            stripe.entries.move_to_end(key)
+        if max_age is not None and age > max_age:
+            return None
+        return entry[0]
+
+    def put(self, key, value):
+        stripe = self._stripe(key)
+        now = _time.monotonic()
+        with stripe.lock:
+            entries = stripe.entries
+            if key in entries:
+                # re-added as the most recently used
+                del entries[key]
+            elif len(entries) >= stripe.maxsize:
+                # make room by dropping the least recently used entry, and any expired ones
+                # after it
+                entries.popitem(last=False)
+                while entries:
+                    oldest = next(iter(entries.values()))
+                    if now - oldest[1] <= self._max_age:
+                        break
+                    entries.popitem(last=False)
+            entries[key] = (value, now)
+
+    def pop(self, key):
+        stripe = self._stripe(key)
+        with stripe.lock:
+            stripe.entries.pop(key, None)
+
+    def clear(self):
+        for stripe in self._stripes:
+            with stripe.lock:
+                stripe.entries.clear()
+
+    def items(self, max_age):
+        ''' Returns the keys and values added less than max_age seconds ago. '''
+        now = _time.monotonic()
+        items = []
+        for stripe in self._stripes:
+            with stripe.lock:
+                items.extend((key, entry[0]) for key, entry in stripe.entries.items()
+                             if now - entry[1] <= min(max_age, self._max_age))
+        return items
+
+    def __len__(self):
+        return sum(len(s.entries) for s in self._stripes)
+
 
 class TokenCache(object):
-    ''' A basic cache for tokens. '''
+    ''' A cache of validated tokens and their auth roles, keyed by the token hash. '''
 
     _MAX_TIME_SEC = 5 * 60  # 5 min
 
-    _lock = _threading.RLock()
+    def __init__(self, maxsize=2000, stripes=16, invalid_maxsize=1000):
+        self._users = _LRUCache(maxsize, self._MAX_TIME_SEC, stripes)
+        self._roles = _LRUCache(maxsize, self._MAX_TIME_SEC, stripes)
+        # kept apart, so that a client cycling through bad tokens can't evict the valid ones.
+        # The values are [error, times the error was returned].
+        self._invalid = _LRUCache(invalid_maxsize, self._MAX_TIME_SEC, stripes)
+        self._hits_lock = _threading.Lock()
 
-    def __init__(self, maxsize=2000):
-        self._cache = {}
-        self._maxsize = maxsize
-        self._halfmax = maxsize / 2  # int division to round down
+    @staticmethod
+    def _hash(token):
+        return hashlib.sha256(token.encode('utf-8')).hexdigest()
 
     def get_user(self, token):
-        token = hashlib.sha256(token.encode('utf-8')).hexdigest()
-        with self._lock:
-            usertime = self._cache.get(token)
-        if not usertime:
-            return None
-
-        user, intime = usertime
-        if _time.time() - intime > self._MAX_TIME_SEC:
-            return None
-        return user
+        return self._users.get(self._hash(token))
 
     def add_valid_token(self, token, user):
         if not token:
             raise ValueError('Must supply token')
         if not user:
             raise ValueError('Must supply user')
-        token = hashlib.sha256(token.encode('utf-8')).hexdigest()
-        with self._lock:
-            self._cache[token] = [user, _time.time()]
-            if len(self._cache) > self._maxsize:
-                sorted_items = sorted(
-                    list(self._cache.items()),
-                    key=(lambda v: v[1][1])
-                )
-                for i, (t, _) in enumerate(sorted_items):
-                    if i <= self._halfmax:
-                        del self._cache[t]
-                    else:
-                        break
+        self._users.put(self._hash(token), user)
+
+    def get_roles(self, token, ttl):
+        '''
+        Returns the roles of a token cached less than ttl seconds ago (at most 5 minutes), or
+        None.
+        '''
+        return self._roles.get(self._hash(token), ttl)
+
+    def add_roles(self, token, roles):
+        if not token:
+            raise ValueError('Must supply token')
+        self._roles.put(self._hash(token), list(roles))
+
+    def get_invalid(self, token, ttl):
+        '''
+        Returns the error of a token rejected less than ttl seconds ago (at most 5 minutes), or
+        None.
+        '''
+        entry = self._invalid.get(self._hash(token), ttl)
+        if entry is None:
+            return None
+        with self._hits_lock:
+            entry[1] += 1
+        return entry[0]
+
+    def add_invalid(self, token, error):
+        if not token:
+            raise ValueError('Must supply token')
+        self._invalid.put(self._hash(token), [error, 0])
+
+    def count_invalid(self, ttl):
+        ''' Returns the number of tokens rejected less than ttl seconds ago. '''
+        return len(self._invalid.items(ttl))
+
+    def top_invalid(self, ttl, n):
+        '''
+        Returns the first 12 characters of the hash and the number of times get_invalid
+        returned the error of the n tokens rejected less than ttl seconds ago that it returned
+        most often.
+        '''
+        top = _heapq.nlargest(n, self._invalid.items(ttl), key=lambda item: item[1][1])
+        return [(key[:12], entry[1]) for key, entry in top if entry[1]]
+
+    def invalidate(self, token):
+        ''' Forgets the user and roles of a token. '''
+        token = self._hash(token)
+        self._users.pop(token)
+        self._roles.pop(token)
+
+    def clear(self):
+        self._users.clear()
+        self._roles.clear()
+        self._invalid.clear()
+
+
+# shared by the auth client and the catalog admin checks
+token_cache = TokenCache()
 
 
 class KBaseAuth(object):
@@ -62,14 +206,43 @@ class KBaseAuth(object):
 
     _LOGIN_URL = 'https://kbase.us/services/auth/api/legacy/KBase/Sessions/Login'
 
-    def __init__(self, auth_url=None):
+    def __init__(self, auth_url=None, cache=None, invalid_ttl=0):
         '''
         Constructor
+        invalid_ttl - seconds a token rejected by the auth service is rejected for without
+            asking it again, 0 to always ask
         '''
         self._authurl = auth_url
         if not self._authurl:
             self._authurl = self._LOGIN_URL
-        self._cache = TokenCache()
+        self._cache = token_cache if cache is None else cache
+        self._invalid_ttl = invalid_ttl
+        if invalid_ttl > 0:
+            # computed from the live entries whenever the metrics are collected
+            INVALID_TOKENS.set_function(
+                lambda: {(): self._cache.count_invalid(invalid_ttl)})
+            REJECTED_TOKENS.set_function(
+                lambda: {(key,): hits for key, hits in self._cache.top_invalid(
+                    invalid_ttl, TOP_REJECTED_TOKENS)})
+
+    def _check_rejected(self, token):
+        if self._invalid_ttl > 0:
+            error = self._cache.get_invalid(token, self._invalid_ttl)
+            if error is not None:
+                TOKEN_REJECTIONS.inc(source='cache')
+                raise ValueError(error)
+
+    def get_cached_user(self, token):
+        '''
+        Returns the user for a token validated recently, or None.  Raises a ValueError for a
+        token rejected recently.
+        '''
+        if not token:
+            return None
+        user = self._cache.get_user(token)
+        if user is None:
+            self._check_rejected(token)
+        return user
 
     def get_user(self, token):
         if not token:
@@ -77,17 +250,25 @@ class KBaseAuth(object):
         user = self._cache.get_user(token)
         if user:
             return user
+        self._check_rejected(token)
 
         d = {'token': token, 'fields': 'user_id'}
-        ret = _requests.post(self._authurl, data=d)
+        with tracing.span('auth.validate_token'):
+            ret = http_session.post(self._authurl, data=d)
         if not ret.ok:
             try:
                 err = ret.json()
             except Exception as e:
                 ret.raise_for_status()
-            raise ValueError('Error connecting to auth service: {} {}\n{}'
-                             .format(ret.status_code, ret.reason,
-                                     err['error']['message']))
+            error = 'Error connecting to auth service: {} {}\n{}'.format(
+                ret.status_code, ret.reason, err['error']['message'])
+            if ret.status_code == 401:
+                # only a definite rejection of the token is remembered, not a failure of the
+                # auth service
+                TOKEN_REJECTIONS.inc(source='auth')
+                if self._invalid_ttl > 0:
+                    self._cache.add_invalid(token, error)
+            raise ValueError(error)
 
         user = ret.json()['user_id']
         self._cache.add_valid_token(token, user)
@@ -26,8 +26,14 @@ except ImportError:
     from urlparse import urlparse as _urlparse  # py2
 import time
 
+try:
+    import msgpack as _msgpack
+except ImportError:
+    _msgpack = None
+
 _CT = 'content-type'
 _AJ = 'application/json'
+_AM = 'application/msgpack'
 _URL_SCHEME = frozenset(['http', 'https'])
 _CHECK_JOB_RETRYS = 3
 
@@ -97,6 +103,13 @@ class _JSONObjectEncoder(_json.JSONEncoder):
         return _json.JSONEncoder.default(self, obj)
 
 
+def _msgpack_default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError('Object of type {} is not MessagePack serializable'.format(
+        type(obj).__name__))
+
+
 class BaseClient(object):
     '''
     The KBase base client.
@@ -120,6 +133,9 @@ class BaseClient(object):
     lookup_url - set to true when contacting KBase dynamic services.
     async_job_check_time_ms - the wait time between checking job state for
         asynchronous jobs run with the run_job method.
+    use_msgpack - send requests and ask for responses as MessagePack rather
+        than JSON. Requires the msgpack package and a server that supports
+        it; a server that doesn't answers with JSON.
     '''
     def __init__(
             self, url=None, timeout=30 * 60, user_id=None,
@@ -129,7 +145,8 @@ class BaseClient(object):
             lookup_url=False,
             async_job_check_time_ms=100,
             async_job_check_time_scale_percent=150,
-            async_job_check_max_time_ms=300000):
+            async_job_check_max_time_ms=300000,
+            use_msgpack=False):
         if url is None:
             raise ValueError('A url is required')
         scheme, _, _, _, _, _ = _urlparse(url)
@@ -163,6 +180,9 @@ class BaseClient(object):
                         authdata['user_id'], authdata['password'], auth_svc)
         if self.timeout < 1:
             raise ValueError('Timeout value must be at least 1 second')
+        if use_msgpack and _msgpack is None:
+            raise ValueError('use_msgpack requires the msgpack package')
+        self.use_msgpack = use_msgpack
 
     def _call(self, url, method, params, context=None):
         arg_hash = {'method': method,
@@ -175,14 +195,22 @@ class BaseClient(object):
                 raise ValueError('context is not type dict as required.')
             arg_hash['context'] = context
 
-        body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
+        headers = self._headers
+        if self.use_msgpack:
+            body = _msgpack.packb(arg_hash, default=_msgpack_default,
+                                  use_bin_type=True)
+            headers = dict(headers)
+            headers[_CT] = _AM
+            headers['Accept'] = _AM
+        else:
+            body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
+        ret = _requests.post(url, data=body, headers=headers,
                              timeout=self.timeout,
                              verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
-            if ret.headers.get(_CT) == _AJ:
-                err = ret.json()
+            if ret.headers.get(_CT) in (_AJ, _AM):
+                err = self._decode(ret)
                 if 'error' in err:
                     raise ServerError(**err['error'])
                 else:
@@ -191,7 +219,7 @@ class BaseClient(object):
                 raise ServerError('Unknown', 0, ret.text)
         if not ret.ok:
             ret.raise_for_status()
-        resp = ret.json()
+        resp = self._decode(ret)
         if 'result' not in resp:
             raise ServerError('Unknown', 0, 'An unknown server error occurred')
         if not resp['result']:
@@ -200,6 +228,11 @@ class BaseClient(object):
             return resp['result'][0]
         return resp['result']
 
+    def _decode(self, ret):
+        if ret.headers.get(_CT) == _AM:
+            return _msgpack.unpackb(ret.content, raw=False)
+        return ret.json()
+
     def _get_service_url(self, service_method, service_version):
         if not self.lookup_url:
             return self.url
@@ -0,0 +1,137 @@
+'''
+Registry of the module registration (build) threads running in this process, so that a
+worker can be shut down without leaving modules stuck in a "building: ..." state.
+
+On shutdown the registry stops accepting new registrations and waits for running builds
+to finish, up to the drain timeout.  Builds still running at the deadline are marked as
+failed with a message asking the user to register again.  A module in the error state can
+be registered again, so the retry starts cleanly.
+'''
+import atexit
+import logging
+import threading
+import time
+
+INTERRUPTED_MESSAGE = ('Registration was interrupted because the catalog service was '
+                       'restarted. Please register the module again.')
+
+
+class _Build:
+
+    __slots__ = ('registration_id', 'git_url', 'db', 'thread', 'started')
+
+    def __init__(self, registration_id, git_url, db, thread):
+        self.registration_id = registration_id
+        self.git_url = git_url
+        self.db = db
+        self.thread = thread
+        self.started = time.time()
+
+
+class BuildRegistry:
+
+    def __init__(self, drain_timeout=60):
+        self.drain_timeout = drain_timeout
+        self.accepting = True
+        self._lock = threading.Lock()
+        self._builds = {}
+
+    def check_accepting(self):
+        if not self.accepting:
+            raise ValueError('The catalog service is shutting down and not accepting new '
+                             'registrations. Please try again shortly.')
+
+    def start(self, registration_id, git_url, db, target, args):
+        '''
+        runs target(*args) in a new registration thread.  If the registry has stopped
+        accepting registrations the build is marked as failed and ValueError is raised.
+        '''
+        build = _Build(registration_id, git_url, db, None)
+        build.thread = threading.Thread(target=self._run, args=(build, target, args),
+                                        name='registration-' + registration_id, daemon=True)
+        with self._lock:
+            accepting = self.accepting
+            if accepting:
+                self._builds[registration_id] = build
+        if not accepting:
+            self._mark_failed(build, INTERRUPTED_MESSAGE)
+            self.check_accepting()
+        build.thread.start()
+
+    def _run(self, build, target, args):
+        try:
+            target(*args)
+        except Exception as e:
+            # the registrar records its own errors, this is a failure to even start
+            logging.exception('Registration {} failed'.format(build.registration_id))
+            self._mark_failed(build, 'Registration failed: {}'.format(e))
+        finally:
+            with self._lock:
+                self._builds.pop(build.registration_id, None)
+
+    def active(self):
+        ''' returns the registration ids of the running builds '''
+        with self._lock:
+            return list(self._builds)
+
+    def shutdown(self, timeout=None):
+        '''
+        stops accepting registrations and waits up to timeout seconds (default the drain
+        timeout) for running builds to finish.  Builds still running after that are marked
+        as failed.  Returns the registration ids of those builds.
+        '''
+        with self._lock:
+            self.accepting = False
+            builds = list(self._builds.values())
+        if not builds:
+            return []
+        timeout = self.drain_timeout if timeout is None else timeout
+        logging.info('Waiting up to {}s for {} running registrations to finish'.format(
+            timeout, len(builds)))
+        deadline = time.monotonic() + timeout
+        for b in builds:
+            b.thread.join(max(0, deadline - time.monotonic()))
+        interrupted = [b for b in builds if b.thread.is_alive()]
+        for b in interrupted:
+            self._mark_failed(b, INTERRUPTED_MESSAGE)
+        return [b.registration_id for b in interrupted]
+
+    def _mark_failed(self, build, message):
+        logging.warning('Marking registration {} of {} as failed: {}'.format(
+            build.registration_id, build.git_url, message))
+        try:
+            build.db.set_build_log_state(build.registration_id, 'error', error_message=message)
+            build.db.set_module_registration_state(git_url=build.git_url, new_state='error',
+                                                   error_message=message)
+        except Exception:
+            logging.exception('Could not mark registration {} as failed'.format(
+                build.registration_id))
+
+
+def drain_on_exit(registry, uwsgi=None):
+    '''
+    drains registry when the process exits.  Registration threads are daemon threads, so the
+    interpreter doesn't wait for them before running the exit handlers.  uwsgi workers don't
+    reliably run the python atexit handlers on reload or SIGTERM, so under uwsgi the drain
+    runs from the uwsgi.atexit hook instead, followed by any hook that was already set.
+    '''
+    if uwsgi is None:
+        atexit.register(registry.shutdown)
+        return
+    previous = getattr(uwsgi, 'atexit', None)
+
+    def drain():
+        registry.shutdown()
+        if previous is not None:
+            previous()
+    uwsgi.atexit = drain
+
+
+registry = BuildRegistry()
+
+try:
+    import uwsgi
+except ImportError:
+    # not running under uwsgi
+    uwsgi = None
+drain_on_exit(registry, uwsgi)
@@ -0,0 +1,212 @@
+'''
+JSON codec used by the catalog server to parse requests and encode responses.
+
+orjson or ujson is used if installed, otherwise the stdlib json module.  All codecs encode
+sets, frozensets and objects with a toJSONable method the same way as the
+JSONObjectEncoder in Server.py.  Values a native codec can't handle (e.g. integers wider
+than 64 bits) are encoded with the stdlib codec instead.
+
+If the optional msgpack package is installed, clients may also send requests and receive
+responses as MessagePack, selected with the Content-Type and Accept headers.  JSON stays
+the default.
+'''
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # pragma: no cover
+    ujson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from biokbase.catalog.compression import parse_accept_encoding
+
+JSON_CONTENT_TYPE = 'application/json'
+MSGPACK_CONTENT_TYPES = ('application/msgpack', 'application/x-msgpack')
+
+
+def default(obj):
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    if hasattr(obj, 'toJSONable'):
+        return obj.toJSONable()
+    raise TypeError('Object of type {} is not JSON serializable'.format(type(obj).__name__))
+
+
+class _JSONCodec:
+    content_type = JSON_CONTENT_TYPE
+
+    def join(self, parts):
+        ''' returns the encoding of a list from the encodings of its items '''
+        return '[' + ','.join(parts) + ']'
+
+    def splice(self, respond, result):
+        ''' returns the encoding of the dict respond with the encoded result added to it '''
+        head = self.dumps(respond)[:-1]
+        return head + (',' if respond else '') + '"result":' + result + '}'
+
+
+class StdlibCodec(_JSONCodec):
+    name = 'json'
+
+    def loads(self, data):
+        return json.loads(data)
+
+    def dumps(self, obj):
+        return json.dumps(obj, default=default)
+
+
+class OrjsonCodec(_JSONCodec):
+    name = 'orjson'
+
+    def __init__(self):
+        self._fallback = StdlibCodec()
+        self._option = orjson.OPT_NON_STR_KEYS
+
+    def loads(self, data):
+        return orjson.loads(data)
+
+    def dumps(self, obj):
+        try:
+            return orjson.dumps(obj, default=default, option=self._option).decode('utf8')
+        except TypeError:
+            return self._fallback.dumps(obj)
+
+
+class UjsonCodec(_JSONCodec):
+    name = 'ujson'
+
+    def __init__(self):
+        self._fallback = StdlibCodec()
+
+    def loads(self, data):
+        return ujson.loads(data)
+
+    def dumps(self, obj):
+        try:
+            return ujson.dumps(obj, default=default, escape_forward_slashes=False)
+        except (TypeError, OverflowError):
+            return self._fallback.dumps(obj)
+
+
+class MsgpackCodec:
+    name = 'msgpack'
+    content_type = MSGPACK_CONTENT_TYPES[0]
+
+    def loads(self, data):
+        try:
+            return msgpack.unpackb(data, raw=False, strict_map_key=False)
+        except Exception as e:
+            raise ValueError('Invalid MessagePack document: {}'.format(
+                str(e) or type(e).__name__))
+
+    def dumps(self, obj):
+        ''' returns bytes, unlike the JSON codecs '''
+        return msgpack.packb(obj, default=default, use_bin_type=True)
+
+    def join(self, parts):
+        # an array is its header followed by the packed items
+        return msgpack.Packer().pack_array_header(len(parts)) + b''.join(parts)
+
+    def splice(self, respond, result):
+        parts = [msgpack.Packer().pack_map_header(len(respond) + 1)]
+        for k, v in respond.items():
+            parts.append(self.dumps(k))
+            parts.append(self.dumps(v))
+        parts.append(self.dumps('result'))
+        parts.append(result)
+        return b''.join(parts)
+
+
+_CODECS = [('orjson', orjson, OrjsonCodec),
+           ('ujson', ujson, UjsonCodec),
+           ('json', json, StdlibCodec)]
+
+
+def _is_msgpack(content_type):
+    return (content_type or '').split(';')[0].strip().lower() in MSGPACK_CONTENT_TYPES
+
+
+def request_codec(content_type):
+    '''
+    returns the codec for a request body sent with the given Content-Type: MessagePack for
+    application/msgpack, otherwise the JSON codec.  Raises ValueError if the body is
+    MessagePack but msgpack isn't installed.
+    '''
+    if not _is_msgpack(content_type):
+        return _codec
+    if _msgpack is None:
+        raise ValueError('MessagePack requests are not supported by this server')
+    return _msgpack
+
+
+def response_codec(accept, content_type=None):
+    '''
+    returns the codec for a response given the request's Accept and Content-Type headers.
+    MessagePack is used if the client prefers it over JSON in Accept, or sent a MessagePack
+    request without asking for a particular response type.
+    '''
+    if _msgpack is None:
+        return _codec
+    # Accept has the same syntax as Accept-Encoding
+    types = parse_accept_encoding(accept)
+    wildcard_q = types.get('application/*', types.get('*/*', 0.0))
+    json_q = types.get(JSON_CONTENT_TYPE, wildcard_q)
+    msgpack_q = max(types.get(t, wildcard_q) for t in MSGPACK_CONTENT_TYPES)
+    if msgpack_q > json_q:
+        return _msgpack
+    if msgpack_q == json_q and _is_msgpack(content_type):
+        return _msgpack
+    return _codec
+
+
+def available_codecs():
+    return [name for name, module, _ in _CODECS if module is not None]
+
+
+def get_codec(name='auto'):
+    '''
+    returns the named codec, or the fastest installed one if name is 'auto'.  Raises
+    ValueError if the codec is unknown or not installed.
+    '''
+    name = (name or 'auto').strip().lower()
+    for codec_name, module, cls in _CODECS:
+        if module is None:
+            continue
+        if name in ('auto', codec_name):
+            return cls()
+    raise ValueError('JSON codec {} is not available, installed codecs are: {}'.format(
+        name, ', '.join(available_codecs())))
+
+
+_codec = get_codec()
+_msgpack = MsgpackCodec() if msgpack is not None else None
+
+
+def use(name):
+    ''' switches the module level loads and dumps to the named codec '''
+    global _codec
+    _codec = get_codec(name)
+    return _codec
+
+
+def current():
+    return _codec
+
+
+def loads(data):
+    ''' parses a JSON str or utf8 bytes document, raising ValueError if it's invalid '''
+    return _codec.loads(data)
+
+
+def dumps(obj):
+    ''' encodes obj as a JSON str '''
+    return _codec.dumps(obj)
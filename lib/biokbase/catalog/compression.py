@@ -0,0 +1,134 @@
+'''
+Content-Encoding support for the catalog server: negotiates a response coding from the
+client's Accept-Encoding header and decodes compressed request bodies.
+
+gzip is always available.  zstd is used if the optional zstandard package is installed.
+'''
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+GZIP = 'gzip'
+ZSTD = 'zstd'
+IDENTITY = 'identity'
+
+_READ_SIZE = 64 * 1024
+
+
+def supported_encodings():
+    if zstandard is None:
+        return [GZIP]
+    return [ZSTD, GZIP]
+
+
+def parse_accept_encoding(header):
+    ''' returns a dict of coding -> quality value from an Accept-Encoding header '''
+    codings = {}
+    if not header:
+        return codings
+    for item in header.split(','):
+        parts = item.strip().split(';')
+        coding = parts[0].strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for p in parts[1:]:
+            p = p.strip()
+            if p.startswith('q='):
+                try:
+                    q = float(p[2:])
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+class ResponseCompressor:
+    '''
+    encodings - the codings the server may use, in order of preference
+    min_size - responses smaller than this many bytes are sent uncompressed
+    level - compression level, from 1 (fastest) to 9 for gzip or 1 to 22 for zstd
+    '''
+
+    def __init__(self, encodings=(GZIP,), min_size=1024, level=6):
+        available = supported_encodings()
+        self.encodings = [e for e in encodings if e in available]
+        self.min_size = min_size
+        self.level = level
+
+    def negotiate(self, accept_encoding):
+        ''' returns the coding to use for a response, or None to send it uncompressed '''
+        if not self.encodings:
+            return None
+        codings = parse_accept_encoding(accept_encoding)
+        best = None
+        best_q = 0.0
+        for e in self.encodings:
+            q = codings.get(e, codings.get('*', 0.0))
+            if q > best_q:
+                best, best_q = e, q
+        return best
+
+    def compress(self, body, encoding):
+        if encoding == ZSTD:
+            return zstandard.ZstdCompressor(level=self.level).compress(body)
+        compressor = self._gzip_compressor()
+        return compressor.compress(body) + compressor.flush()
+
+    def compress_iter(self, chunks, encoding):
+        ''' compresses an iterable of byte chunks, yielding compressed chunks '''
+        if encoding == ZSTD:
+            compressor = zstandard.ZstdCompressor(level=self.level).compressobj()
+        else:
+            compressor = self._gzip_compressor()
+        for chunk in chunks:
+            out = compressor.compress(chunk)
+            if out:
+                yield out
+        yield compressor.flush()
+
+    def _gzip_compressor(self):
+        return zlib.compressobj(self.level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+def decompress(body, content_encoding, max_size):
+    '''
+    Decodes a request body sent with the given Content-Encoding.  Raises ValueError if the
+    coding is not supported, the data is corrupt or truncated, or the body is or expands to
+    more than max_size bytes.
+    '''
+    if len(body) > max_size:
+        raise ValueError('Request body exceeds {} bytes'.format(max_size))
+    encoding = (content_encoding or IDENTITY).strip().lower()
+    if encoding == IDENTITY:
+        return body
+    if encoding in (GZIP, 'x-gzip'):
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            data = decompressor.decompress(body, max_size + 1)
+        except zlib.error as e:
+            raise ValueError('Invalid gzip request body: ' + str(e))
+        if len(data) <= max_size and not decompressor.eof:
+            raise ValueError('Invalid gzip request body: truncated')
+    elif encoding == ZSTD and zstandard is not None:
+        try:
+            reader = zstandard.ZstdDecompressor().stream_reader(body)
+            parts = []
+            size = 0
+            while size <= max_size:
+                part = reader.read(_READ_SIZE)
+                if not part:
+                    break
+                parts.append(part)
+                size += len(part)
+            data = b''.join(parts)
+        except zstandard.ZstdError as e:
+            raise ValueError('Invalid zstd request body: ' + str(e))
+    else:
+        raise ValueError('Unsupported Content-Encoding: ' + encoding)
+    if len(data) > max_size:
+        raise ValueError('Decompressed request body exceeds {} bytes'.format(max_size))
+    return data
@@ -2,39 +2,137 @@ import codecs
 import functools
 import logging
 import os
-import threading
 import uuid
 import warnings
 from datetime import datetime
 from urllib.parse import urlparse
 
-import requests
 import semantic_version
 
 import biokbase.catalog.version
+from biokbase.catalog import authclient, builds, http_session, metrics, tracing
 from biokbase.catalog.db import MongoCatalogDBI
-from biokbase.catalog.registrar import Registrar
-from biokbase.narrative_method_store.client import NarrativeMethodStore
+
+# The registrar (docker, yaml) and the NMS client are imported on first use, so that
+# processes that only serve reads don't pay for importing them.
 
 
 def log(func):
 
-    ENTRY_MSG = "Entering {}"
+    ENTRY_MSG = "Entering %s"
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
-        logging.info(ENTRY_MSG.format(func.__name__))
-        result = func(*args, **kwargs)
+        logging.info(ENTRY_MSG, func.__name__)
+        with tracing.span('controller.' + func.__name__):
+            result = func(*args, **kwargs)
         return result
 
     return wrapper
 
 
+# Request processing shared by CatalogController and the asyncio handlers in asgi.py
+
+def basic_module_info_query(params):
+    """ returns the mongo query for list_basic_module_info, or None if nothing can match """
+    query = {'state.active': True, 'state.released': True}
+
+    if 'include_disabled' in params:
+        if params['include_disabled'] > 0:
+            query.pop('state.active', None)
+
+    if 'include_released' not in params:
+        params['include_released'] = 1
+    if 'include_unreleased' not in params:
+        params['include_unreleased'] = 0
+
+    if 'include_modules_with_no_name_set' not in params:
+        query['module_name_lc'] = {'$exists': True}
+    elif params['include_modules_with_no_name_set'] != 1:
+        query['module_name_lc'] = {'$exists': True}
+
+    # figure out release/unreleased options so we can get just the unreleased if needed
+    # default (if none of these matches is to list only released)
+    if params['include_released'] <= 0 and params['include_unreleased'] <= 0:
+        return None  # don't include anything...
+    elif params['include_released'] <= 0 and params['include_unreleased'] > 0:
+        # minor change that could be removed eventually: check for released=False or missing
+        query.pop('state.released', None)
+        query['$or'] = [{'state.released': False}, {'state.released': {'$exists': False}}]
+        # query['state.released']=False # include only unreleased (only works if everything has this flag)
+    elif params['include_released'] > 0 and params['include_unreleased'] > 0:
+        query.pop('state.released', None)  # include everything
+
+    if 'owners' in params:
+        if params['owners']:  # might want to filter out empty strings in the future
+            query['owners.kb_username'] = {'$in': params['owners']}
+
+    return query
+
+
+def format_basic_module_info(modList):
+    # now massage data into a nice format for the API
+    final_modList = []
+    for m in modList:
+        if 'owners' in m:
+            owner_list = []
+            for o in m['owners']:
+                owner_list.append(o['kb_username'])
+            m['owners'] = owner_list
+        else:
+            continue
+        if 'current_versions' in m:
+            for tag in ['dev', 'beta', 'release']:
+                m[tag] = None
+                if tag in m['current_versions']:
+                    m[tag] = m['current_versions'][tag]
+            del (m['current_versions'])
+        if 'info' in m:
+            if 'language' in m['info']:
+                m['language'] = m['info']['language']
+            if 'dynamic_service' in m['info']:
+                m['dynamic_service'] = m['info']['dynamic_service']
+            del (m['info'])
+        final_modList.append(m)
+
+    return final_modList
+
+
+def client_group_app_ids(params):
+    app_ids = None
+    if 'app_ids' in params:
+        if not isinstance(params['app_ids'], list):
+            raise ValueError('app_ids parameter must be a list')
+        app_ids = []
+        for a in params['app_ids']:
+            tokens = a.strip().split('/')
+            if len(tokens) == 2:
+                a = tokens[0].lower() + '/' + tokens[1]
+            app_ids.append(a)
+        if len(app_ids) == 0:
+            app_ids = None
+    return app_ids
+
+
+def format_client_groups(groups):
+    # we have to munge the group data to the old structure
+    for g in groups:
+        g['app_id'] = g['module_name'].lower() + '/' + g['function_name']
+
+    return groups
+
+
 class CatalogController:
 
-    def __init__(self, config):
+    def __init__(self, config, setup_db=True):
+        '''
+        setup_db - upgrade the db schema and create the indexes if needed, this can be skipped
+        if another controller in the service (e.g. in the parent process) has done it
+        '''
         self.auth_api = config['auth-service-api']
         self.admin_roles = set(config['admin-roles'].split(','))
+        # seconds the roles of a token are cached for, 0 to fetch them on every check
+        self.admin_role_cache_ttl = int(config.get('admin-role-cache-ttl') or 0)
 
         # make sure the minimal mongo settings are in place
         if 'mongodb-host' not in config:  # pragma: no cover
@@ -62,7 +160,8 @@ class CatalogController:
             config['mongodb-database'],
             config['mongodb-user'],
             config['mongodb-pwd'],
-            config['mongodb-authmechanism'])
+            config['mongodb-authmechanism'],
+            setup=setup_db)
 
         # check for the temp directory and make sure it exists
         if 'temp-dir' not in config:  # pragma: no cover
@@ -114,11 +213,35 @@ class CatalogController:
         else:  # pragma: no cover
             raise ValueError('The nms-admin-token is required but is not '
                              'specified in the config')
-        self.nms = NarrativeMethodStore(self.nms_url, token=self.nms_token)
+        self._nms = None
+
+        # how long a worker that is shutting down waits for running registrations
+        builds.registry.drain_timeout = int(config.get('shutdown-drain-timeout', 60))
+
+    @property
+    def nms(self):
+        ''' the NMS client, created on first use '''
+        if self._nms is None:
+            from biokbase.narrative_method_store.client import NarrativeMethodStore
+            self._nms = NarrativeMethodStore(self.nms_url, token=self.nms_token)
+        return self._nms
+
+    def check_mongo(self):
+        ''' checks that mongo can be reached.  Returns None if it is ok, otherwise an error. '''
+        try:
+            self.db.ping()
+            return None
+        except Exception as e:
+            return str(e)
+
+    def get_data_generation(self, max_age=0):
+        ''' returns the catalog data generation, see MongoCatalogDBI.get_data_generation '''
+        return self.db.get_data_generation(max_age)
 
     @log
     def register_repo(self, params, username, token):
 
+        builds.registry.check_accepting()
         if 'git_url' not in params:
             raise ValueError('git_url not defined, but is required for registering a repository')
         git_url = params['git_url']
@@ -202,13 +325,12 @@ class CatalogController:
 
         # first set the dev current_release timestamp
 
-        t = threading.Thread(target=_start_registration, args=(
+        builds.registry.start(registration_id, git_url, self.db, _start_registration, args=(
         params, registration_id, timestamp, username, self.is_admin(username, token), token, self.db,
         self.temp_dir, self.docker_base_url,
         self.docker_registry_host, self.nms_url, self.nms_token, module_details,
         self.ref_data_base, self.kbase_endpoint,
         prev_dev_version))
-        t.start()
 
         # 4) provide the registration_id
         return registration_id
@@ -696,65 +818,10 @@ class CatalogController:
     # note: maybe a little too mongo centric, but ok for now...
     @log
     def list_basic_module_info(self, params):
-        query = {'state.active': True, 'state.released': True}
-
-        if 'include_disabled' in params:
-            if params['include_disabled'] > 0:
-                query.pop('state.active', None)
-
-        if 'include_released' not in params:
-            params['include_released'] = 1
-        if 'include_unreleased' not in params:
-            params['include_unreleased'] = 0
-
-        if 'include_modules_with_no_name_set' not in params:
-            query['module_name_lc'] = {'$exists': True}
-        elif params['include_modules_with_no_name_set'] != 1:
-            query['module_name_lc'] = {'$exists': True}
-
-        # figure out release/unreleased options so we can get just the unreleased if needed
-        # default (if none of these matches is to list only released)
-        if params['include_released'] <= 0 and params['include_unreleased'] <= 0:
-            return []  # don't include anything...
-        elif params['include_released'] <= 0 and params['include_unreleased'] > 0:
-            # minor change that could be removed eventually: check for released=False or missing
-            query.pop('state.released', None)
-            query['$or'] = [{'state.released': False}, {'state.released': {'$exists': False}}]
-            # query['state.released']=False # include only unreleased (only works if everything has this flag)
-        elif params['include_released'] > 0 and params['include_unreleased'] > 0:
-            query.pop('state.released', None)  # include everything
-
-        if 'owners' in params:
-            if params['owners']:  # might want to filter out empty strings in the future
-                query['owners.kb_username'] = {'$in': params['owners']}
-
-        modList = self.db.find_basic_module_info(query)
-
-        # now massage data into a nice format for the API
-        final_modList = []
-        for m in modList:
-            if 'owners' in m:
-                owner_list = []
-                for o in m['owners']:
-                    owner_list.append(o['kb_username'])
-                m['owners'] = owner_list
-            else:
-                continue
-            if 'current_versions' in m:
-                for tag in ['dev', 'beta', 'release']:
-                    m[tag] = None
-                    if tag in m['current_versions']:
-                        m[tag] = m['current_versions'][tag]
-                del (m['current_versions'])
-            if 'info' in m:
-                if 'language' in m['info']:
-                    m['language'] = m['info']['language']
-                if 'dynamic_service' in m['info']:
-                    m['dynamic_service'] = m['info']['dynamic_service']
-                del (m['info'])
-            final_modList.append(m)
-
-        return final_modList
+        query = basic_module_info_query(params)
+        if query is None:
+            return []
+        return format_basic_module_info(self.db.find_basic_module_info(query))
 
     @log
     def list_local_functions(self, params):
@@ -1206,22 +1273,40 @@ class CatalogController:
 
     # always true if the user is in the admin list
     def has_permission(self, username, token, owners):
-        if self.is_admin(username, token):
-            return True
+        # owners don't need the remote admin check
         for owner in owners:
             if username == owner['kb_username']:
                 return True
-        return False
+        return self.is_admin(username, token)
 
     @log
     def is_admin(self, username, token):
-        logging.info("URL:" + self.auth_api + '/api/V2/me')
-        r = requests.get(self.auth_api + '/api/V2/me', headers={'Authorization': token})
-        logging.info(r.json())
-        roles = r.json().get('customroles', [])
-        if any((r in self.admin_roles for r in roles)):
-            return True
-        return False
+        if not token:
+            return False
+        roles = None
+        if self.admin_role_cache_ttl > 0:
+            roles = authclient.token_cache.get_roles(token, self.admin_role_cache_ttl)
+            if roles is None:
+                authclient.ROLE_CACHE_MISSES.inc()
+            else:
+                authclient.ROLE_CACHE_HITS.inc()
+        if roles is None:
+            roles = self._get_roles(token)
+        return any((r in self.admin_roles for r in roles))
+
+    def _get_roles(self, token):
+        logging.debug('URL: %s/api/V2/me', self.auth_api)
+        with tracing.span('auth.roles'):
+            r = http_session.get(self.auth_api + '/api/V2/me', headers={'Authorization': token})
+        if r.status_code == 401:
+            # the token was revoked or expired, don't keep accepting it
+            authclient.token_cache.invalidate(token)
+        me = r.json()
+        logging.debug('auth service response: %s', me)
+        roles = me.get('customroles', [])
+        if r.ok and self.admin_role_cache_ttl > 0:
+            authclient.token_cache.add_roles(token, roles)
+        return roles
 
     def version(self):
         return biokbase.catalog.version.CATALOG_VERSION
@@ -1357,24 +1442,8 @@ class CatalogController:
 
     @log
     def get_client_groups(self, params):
-        app_ids = None
-        if 'app_ids' in params:
-            if not isinstance(params['app_ids'], list):
-                raise ValueError('app_ids parameter must be a list')
-            app_ids = []
-            for a in params['app_ids']:
-                tokens = a.strip().split('/')
-                if len(tokens) == 2:
-                    a = tokens[0].lower() + '/' + tokens[1]
-                app_ids.append(a)
-            if len(app_ids) == 0:
-                app_ids = None
-        groups = self.db.list_client_groups(app_ids)
-        # we have to munge the group data to the old structure
-        for g in groups:
-            g['app_id'] = g['module_name'].lower() + '/' + g['function_name']
-
-        return groups
+        groups = self.db.list_client_groups(client_group_app_ids(params))
+        return format_client_groups(groups)
 
     @log
     def set_volume_mount(self, username, token, config):
@@ -1571,8 +1640,10 @@ class CatalogController:
 def _start_registration(params, registration_id, timestamp, username, is_admin, token, db,
                         temp_dir, docker_base_url, docker_registry_host, nms_url, nms_admin_token,
                         module_details, ref_data_base, kbase_endpoint, prev_dev_version):
+    from biokbase.catalog.registrar import Registrar
     registrar = Registrar(params, registration_id, timestamp, username, is_admin, token, db,
                           temp_dir, docker_base_url, docker_registry_host, nms_url,
                           nms_admin_token, module_details, ref_data_base, kbase_endpoint,
                           prev_dev_version)
-    registrar.start_registration()
+    with metrics.REGISTRATION_THREADS.track_inprogress():
+        registrar.start_registration()
@@ -1,9 +1,15 @@
 import copy
+import functools
+import logging
 import pprint
+import time
 
 from pymongo import ASCENDING
 from pymongo import DESCENDING
 from pymongo import MongoClient
+from pymongo import ReturnDocument
+
+from biokbase.catalog import deadline, tracing
 
 '''
 
@@ -98,10 +104,208 @@ LOCAL_FUNCTIONS
 '''
 
 
+# Queries and helpers shared by the synchronous and asyncio (async_db.py) db interfaces
+
+BASIC_MODULE_INFO_FIELDS = {
+    '_id': 0,
+    'module_name': 1,
+    'git_url': 1,
+    'info': 1,
+    'current_versions': 1,
+    'release_version_list': 1,
+    'owners': 1
+}
+
+RELEASED_SERVICE_VERSIONS_QUERY = {
+    'dynamic_service': 1,
+    'released': 1
+}
+
+RELEASED_SERVICE_VERSIONS_FIELDS = {
+    'module_name': 1,
+    'version': 1,
+    'git_commit_hash': 1,
+    'docker_img_name': 1,
+    '_id': 0
+}
+
+SERVICE_MODULES_QUERY = {'info.dynamic_service': 1}
+
+
+def service_module_fields(tag):
+    return {'module_name_lc': 1, 'module_name': 1, 'current_versions.' + tag: 1}
+
+
+def client_group_fields(app_ids):
+    selection = {
+        '_id': 0,
+        'function_name': 1,
+        'client_groups': 1,
+        'module_name': 1
+    }
+    if app_ids is not None:
+        selection['module_name_lc'] = 1
+    return selection
+
+
+def versions_query(module_list):
+    return {'git_commit_hash': {'$in': version_hashes(module_list)}}
+
+
+def module_query(module_name='', git_url=''):
+    query = {}
+    if module_name:
+        query['module_name_lc'] = module_name.strip().lower()
+    if git_url:
+        query['git_url'] = git_url.strip()
+    return query
+
+
+def version_hashes(module_list):
+    # get all the version commit hashes
+    hash_list = []
+    for mod in module_list:
+        if 'module_name_lc' not in mod:
+            raise ValueError(
+                'DB Error: module_name_lc must be specified to get version documents')
+
+        if 'current_versions' in mod:
+            for tag in ['release', 'beta', 'dev']:
+                if tag in mod['current_versions'] and mod['current_versions'][tag] is not None:
+                    if 'git_commit_hash' in mod['current_versions'][tag]:
+                        hash_list.append(mod['current_versions'][tag]['git_commit_hash'])
+
+        if 'release_version_list' in mod:
+            for r in mod['release_version_list']:
+                if 'git_commit_hash' in r:
+                    hash_list.append(r['git_commit_hash'])
+    return hash_list
+
+
+def apply_version_info(module_list, versions):
+    # save the version documents to a dict
+    ver_lookup = {}
+    for ver in versions:
+        if ver['module_name_lc'] not in ver_lookup:
+            ver_lookup[ver['module_name_lc']] = {}
+        ver_lookup[ver['module_name_lc']][ver['git_commit_hash']] = ver
+
+    # replace them
+    for mod in module_list:
+        if 'current_versions' in mod:
+            for tag in ['release', 'beta', 'dev']:
+                if tag in mod['current_versions'] and mod['current_versions'][tag] is not None:
+                    if 'git_commit_hash' in mod['current_versions'][tag]:
+                        mod['current_versions'][tag] = ver_lookup[mod['module_name_lc']][
+                            mod['current_versions'][tag]['git_commit_hash']]
+
+        if 'release_version_list' in mod:
+            new_release_version_list = []
+            for r in mod['release_version_list']:
+                if 'git_commit_hash' in r:
+                    new_release_version_list.append(
+                        ver_lookup[mod['module_name_lc']][r['git_commit_hash']])
+            mod['release_version_list'] = new_release_version_list
+
+    return module_list
+
+
+def service_versions_with_tag(mods, tag):
+    result = []
+    for m in mods:
+        if m['current_versions'].get(tag) is not None:
+            if m['current_versions'][tag].get('dynamic_service') == 1:
+                result.append({
+                    'module_name': m['module_name'],
+                    'version': m['current_versions'][tag]['version'],
+                    'git_commit_hash': m['current_versions'][tag]['git_commit_hash'],
+                    'docker_img_name': m['current_versions'][tag]['docker_img_name']
+
+                })
+    return result
+
+
+def filter_client_groups(groups, app_ids):
+    filteredGList = []
+    for g in groups:
+        for a in app_ids:
+            if g['module_name_lc'] + '/' + g['function_name'] == a:
+                filteredGList.append(g)
+    for g in filteredGList:
+        del [g['module_name_lc']]
+    return filteredGList
+
+
+def _mutates(method):
+    '''
+    marks a method that writes catalog data, bumping the data generation after the write so
+    that cached responses computed from the old data are no longer used.  The request's
+    deadline is lifted first: a write, or a change made of several writes, must not be
+    stopped half done, and the generation must be bumped after it.
+    '''
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        deadline.disarm()
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException:
+            # the write may have been partly made; don't hide its error if the bump fails
+            try:
+                self.bump_data_generation()
+            except Exception:
+                logging.exception('Could not bump the data generation')
+            raise
+        self.bump_data_generation()
+        return result
+    return wrapper
+
+
+class DeadlineCollection:
+    '''
+    a pymongo or motor collection whose queries get the time left before the request deadline
+    as their maxTimeMS, so that mongo cancels them once the client has stopped waiting.  Writes
+    are never limited by the deadline.
+    '''
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def find(self, *args, **kwargs):
+        max_time_ms = deadline.max_time_ms()
+        cursor = self._collection.find(*args, **kwargs)
+        return cursor if max_time_ms is None else cursor.max_time_ms(max_time_ms)
+
+    def find_one(self, *args, **kwargs):
+        max_time_ms = deadline.max_time_ms()
+        if max_time_ms is not None:
+            kwargs['max_time_ms'] = max_time_ms
+        return self._collection.find_one(*args, **kwargs)
+
+    def _command(self, name, *args, **kwargs):
+        max_time_ms = deadline.max_time_ms()
+        if max_time_ms is not None:
+            kwargs['maxTimeMS'] = max_time_ms
+        return getattr(self._collection, name)(*args, **kwargs)
+
+    def aggregate(self, *args, **kwargs):
+        return self._command('aggregate', *args, **kwargs)
+
+    def count_documents(self, *args, **kwargs):
+        return self._command('count_documents', *args, **kwargs)
+
+    def distinct(self, *args, **kwargs):
+        return self._command('distinct', *args, **kwargs)
+
+
+@tracing.trace_methods('db')
 class MongoCatalogDBI:
     # Collection Names
 
     _DB_VERSION = 'db_version'  # single
+    _DATA_GENERATION = 'data_generation'  # single
 
     _MODULES = 'modules'
 
@@ -118,10 +322,12 @@ class MongoCatalogDBI:
     _EXEC_STATS_USERS = 'exec_stats_users'
     _SECURE_CONFIG_PARAMS = 'secure_config_params'
 
-    def __init__(self, mongo_host, mongo_db, mongo_user, mongo_psswd, mongo_authMechanism):
+    def __init__(self, mongo_host, mongo_db, mongo_user, mongo_psswd, mongo_authMechanism,
+                 setup=True):
 
-        # create the client
-        self.mongo = MongoClient('mongodb://' + mongo_host)
+        # create the client, connecting on first use so that it is safe to create one before
+        # a fork as long as the parent doesn't use it
+        self.mongo = MongoClient('mongodb://' + mongo_host, connect=False)
 
         # Try to authenticate, will throw an exception if the user/psswd is not valid for the db
         # the pymongo docs say authenticate() is deprecated, but testing putting auth in
@@ -130,24 +336,37 @@ class MongoCatalogDBI:
         if (mongo_user and mongo_psswd):
             self.mongo[mongo_db].authenticate(mongo_user, mongo_psswd, mechanism=mongo_authMechanism)
 
-        # Grab a handle to the database and collections
+        # Grab a handle to the database and collections, queries are limited to the
+        # request deadline
         self.db = self.mongo[mongo_db]
-        self.modules = self.db[MongoCatalogDBI._MODULES]
-        self.module_versions = self.db[MongoCatalogDBI._MODULE_VERSIONS]
+        self.modules = self._collection(MongoCatalogDBI._MODULES)
+        self.module_versions = self._collection(MongoCatalogDBI._MODULE_VERSIONS)
+
+        self.local_functions = self._collection(MongoCatalogDBI._LOCAL_FUNCTIONS)
+        self.developers = self._collection(MongoCatalogDBI._DEVELOPERS)
+        self.build_logs = self._collection(MongoCatalogDBI._BUILD_LOGS)
+        self.favorites = self._collection(MongoCatalogDBI._FAVORITES)
+        self.client_groups = self._collection(MongoCatalogDBI._CLIENT_GROUPS)
+        self.volume_mounts = self._collection(MongoCatalogDBI._VOLUME_MOUNTS)
 
-        self.local_functions = self.db[MongoCatalogDBI._LOCAL_FUNCTIONS]
-        self.developers = self.db[MongoCatalogDBI._DEVELOPERS]
-        self.build_logs = self.db[MongoCatalogDBI._BUILD_LOGS]
-        self.favorites = self.db[MongoCatalogDBI._FAVORITES]
-        self.client_groups = self.db[MongoCatalogDBI._CLIENT_GROUPS]
-        self.volume_mounts = self.db[MongoCatalogDBI._VOLUME_MOUNTS]
+        self.exec_stats_raw = self._collection(MongoCatalogDBI._EXEC_STATS_RAW)
+        self.exec_stats_apps = self._collection(MongoCatalogDBI._EXEC_STATS_APPS)
+        self.exec_stats_users = self._collection(MongoCatalogDBI._EXEC_STATS_USERS)
 
-        self.exec_stats_raw = self.db[MongoCatalogDBI._EXEC_STATS_RAW]
-        self.exec_stats_apps = self.db[MongoCatalogDBI._EXEC_STATS_APPS]
-        self.exec_stats_users = self.db[MongoCatalogDBI._EXEC_STATS_USERS]
+        self.secure_config_params = self._collection(MongoCatalogDBI._SECURE_CONFIG_PARAMS)
 
-        self.secure_config_params = self.db[MongoCatalogDBI._SECURE_CONFIG_PARAMS]
+        self.data_generation = self._collection(MongoCatalogDBI._DATA_GENERATION)
+        # (generation, time.monotonic() when it was read)
+        self._data_generation = (None, 0)
 
+        if setup:
+            self.setup_db()
+
+    def _collection(self, name):
+        return DeadlineCollection(self.db[name])
+
+    def setup_db(self):
+        ''' upgrades the db schema if needed and makes sure the indexes exist '''
         # check the db schema
         self.check_db_schema()
 
@@ -245,6 +464,31 @@ class MongoCatalogDBI:
             ('param_name', ASCENDING)],
             unique=True, sparse=False)
 
+    def ping(self):
+        self.mongo.admin.command('ping')
+
+    # The data generation is a counter bumped by every write of catalog data, except for
+    # build log lines and execution stats, which are written too often.  Responses of methods
+    # that read those must not be cached.
+    def get_data_generation(self, max_age=0):
+        '''
+        returns the data generation, reading it from mongo if the last value read (or
+        written) by this process is more than max_age seconds old
+        '''
+        generation, checked = self._data_generation
+        if generation is None or time.monotonic() - checked > max_age:
+            doc = self.data_generation.find_one({'_id': 'generation'})
+            generation = doc['generation'] if doc else 0
+            self._data_generation = (generation, time.monotonic())
+        return generation
+
+    def bump_data_generation(self):
+        doc = self.data_generation.find_one_and_update(
+            {'_id': 'generation'}, {'$inc': {'generation': 1}}, upsert=True,
+            return_document=ReturnDocument.AFTER)
+        self._data_generation = (doc['generation'], time.monotonic())
+        return doc['generation']
+
     def is_registered(self, module_name='', git_url=''):
         if not module_name and not git_url:
             return False
@@ -263,6 +507,7 @@ class MongoCatalogDBI:
         return False
 
     #### SET methods
+    @_mutates
     def create_new_build_log(self, registration_id, timestamp, registration_state, git_url):
         build_log = {
             'registration_id': registration_id,
@@ -274,6 +519,7 @@ class MongoCatalogDBI:
         }
         self.build_logs.insert_one(build_log)
 
+    @_mutates
     def delete_build_log(self, registration_id):
         self.build_logs.delete_one({'registration_id': registration_id})
 
@@ -284,12 +530,14 @@ class MongoCatalogDBI:
                                             {'$push': {'log': {'$each': new_lines}}})
         return self._check_update_result(result)
 
+    @_mutates
     def set_build_log_state(self, registration_id, registration_state, error_message=''):
         result = self.build_logs.update_one({'registration_id': registration_id},
                                             {'$set': {'registration': registration_state,
                                                       'error_message': error_message}})
         return self._check_update_result(result)
 
+    @_mutates
     def set_build_log_module_name(self, registration_id, module_name):
         result = self.build_logs.update_one({'registration_id': registration_id},
                                             {'$set': {'module_name_lc': module_name.lower()}})
@@ -357,6 +605,7 @@ class MongoCatalogDBI:
 
         return self.build_logs.find_one({'registration_id': registration_id}, selection)
 
+    @_mutates
     def register_new_module(self, git_url, username, timestamp, registration_state,
                             registration_id):
         # get current time since epoch in ms in utc
@@ -382,6 +631,7 @@ class MongoCatalogDBI:
 
     # last_state is for concurency control.  If set, it will match on state as well, and will fail
     # if the last_state does not match indicating another process changed the state
+    @_mutates
     def set_module_registration_state(self, module_name='', git_url='', new_state=None,
                                       last_state=None, error_message=''):
         if new_state:
@@ -393,6 +643,7 @@ class MongoCatalogDBI:
             return self._check_update_result(result)
         return False
 
+    @_mutates
     def set_module_release_state(self, module_name='', git_url='', new_state=None, last_state=None,
                                  review_message=''):
         if new_state:
@@ -404,6 +655,7 @@ class MongoCatalogDBI:
             return self._check_update_result(result)
         return False
 
+    @_mutates
     def push_beta_to_release(self, module_name='', git_url='', release_timestamp=None):
 
         current_versions = self.get_module_current_versions(module_name=module_name,
@@ -432,6 +684,7 @@ class MongoCatalogDBI:
             }})
         return self._check_update_result(result)
 
+    @_mutates
     def push_dev_to_beta(self, module_name='', git_url=''):
         current_versions = self.get_module_current_versions(module_name=module_name,
                                                             git_url=git_url,
@@ -442,6 +695,7 @@ class MongoCatalogDBI:
 
         return self._check_update_result(result)
 
+    @_mutates
     def update_dev_version(self, version_info):
         if version_info:
             if 'git_commit_hash' in version_info and 'module_name_lc' in version_info:
@@ -470,6 +724,7 @@ class MongoCatalogDBI:
                 raise ValueError('git_commit_hash is required to register a new version')
         return False
 
+    @_mutates
     def save_local_function_specs(self, local_functions):
         # just using insert doesn't accept a list of docs in mongo 2.6, so loop for now
         for l in local_functions:
@@ -674,6 +929,7 @@ class MongoCatalogDBI:
 
         return result_list
 
+    @_mutates
     def set_module_name(self, git_url, module_name):
         if not module_name:
             raise ValueError('module_name must be defined to set a module name')
@@ -682,6 +938,7 @@ class MongoCatalogDBI:
             '$set': {'module_name': module_name, 'module_name_lc': module_name.lower()}})
         return self._check_update_result(result)
 
+    @_mutates
     def set_module_info(self, info, module_name='', git_url=''):
         if not info:
             raise ValueError('info must be defined to set the info for a module')
@@ -691,6 +948,7 @@ class MongoCatalogDBI:
         result = self.modules.update_one(query, {'$set': {'info': info}})
         return self._check_update_result(result)
 
+    @_mutates
     def set_module_owners(self, owners, module_name='', git_url=''):
         if not owners:
             raise ValueError('owners must be defined to set the owners for a module')
@@ -701,6 +959,7 @@ class MongoCatalogDBI:
         return self._check_update_result(result)
 
     # active = True | False
+    @_mutates
     def set_module_active_state(self, active, module_name='', git_url=''):
         query = self._get_mongo_query(git_url=git_url, module_name=module_name)
         result = self.modules.update_one(query, {'$set': {'state.active': active}})
@@ -741,16 +1000,7 @@ class MongoCatalogDBI:
     #### LIST / SEARCH methods
 
     def find_basic_module_info(self, query):
-        selection = {
-            '_id': 0,
-            'module_name': 1,
-            'git_url': 1,
-            'info': 1,
-            'current_versions': 1,
-            'release_version_list': 1,
-            'owners': 1
-        }
-        return list(self.modules.find(query, selection))
+        return list(self.modules.find(query, BASIC_MODULE_INFO_FIELDS))
 
     def find_current_versions_and_owners(self, query):
         result = list(self.modules.find(query,
@@ -760,95 +1010,31 @@ class MongoCatalogDBI:
         return result
 
     def substitute_hashes_for_version_info(self, module_list):
-
-        # get all the version commit hashes
-        hash_list = []
-        for mod in module_list:
-            if 'module_name_lc' not in mod:
-                raise ValueError(
-                    'DB Error: module_name_lc must be specified to get version documents')
-
-            if 'current_versions' in mod:
-                for tag in ['release', 'beta', 'dev']:
-                    if tag in mod['current_versions'] and mod['current_versions'][tag] is not None:
-                        if 'git_commit_hash' in mod['current_versions'][tag]:
-                            hash_list.append(mod['current_versions'][tag]['git_commit_hash'])
-
-            if 'release_version_list' in mod:
-                for r in mod['release_version_list']:
-                    if 'git_commit_hash' in r:
-                        hash_list.append(r['git_commit_hash'])
-
-        # lookup the info, save it to a dict
-        ver_lookup = {}
-        for ver in self.module_versions.find({'git_commit_hash': {'$in': hash_list}}, {'_id': 0}):
-            if ver['module_name_lc'] not in ver_lookup:
-                ver_lookup[ver['module_name_lc']] = {}
-            ver_lookup[ver['module_name_lc']][ver['git_commit_hash']] = ver
-
-        # replace them
-        for mod in module_list:
-            if 'current_versions' in mod:
-                for tag in ['release', 'beta', 'dev']:
-                    if tag in mod['current_versions'] and mod['current_versions'][tag] is not None:
-                        if 'git_commit_hash' in mod['current_versions'][tag]:
-                            mod['current_versions'][tag] = ver_lookup[mod['module_name_lc']][
-                                mod['current_versions'][tag]['git_commit_hash']]
-
-            if 'release_version_list' in mod:
-                new_release_version_list = []
-                for r in mod['release_version_list']:
-                    if 'git_commit_hash' in r:
-                        new_release_version_list.append(
-                            ver_lookup[mod['module_name_lc']][r['git_commit_hash']])
-                mod['release_version_list'] = new_release_version_list
-
-        return module_list
+        versions = self.module_versions.find(versions_query(module_list), {'_id': 0})
+        return apply_version_info(module_list, versions)
 
     # tag should be one of dev, beta, release - do checking outside of this method
     def list_service_module_versions_with_tag(self, tag):
 
-        mods = list(self.modules.find({'info.dynamic_service': 1},
-                                      {'module_name_lc': 1, 'module_name': 1,
-                                       'current_versions.' + tag: 1}))
+        mods = list(self.modules.find(SERVICE_MODULES_QUERY, service_module_fields(tag)))
         self.substitute_hashes_for_version_info(mods)
-
-        result = []
-        for m in mods:
-            if m['current_versions'].get(tag) is not None:
-                if m['current_versions'][tag].get('dynamic_service') == 1:
-                    result.append({
-                        'module_name': m['module_name'],
-                        'version': m['current_versions'][tag]['version'],
-                        'git_commit_hash': m['current_versions'][tag]['git_commit_hash'],
-                        'docker_img_name': m['current_versions'][tag]['docker_img_name']
-
-                    })
-        return result
+        return service_versions_with_tag(mods, tag)
 
     # all released service module versions
     def list_all_released_service_module_versions(self):
-        return list(self.module_versions.find(
-            {
-                'dynamic_service': 1,
-                'released': 1
-            },
-            {
-                'module_name': 1,
-                'version': 1,
-                'git_commit_hash': 1,
-                'docker_img_name': 1,
-                '_id': 0
-            }))
+        return list(self.module_versions.find(RELEASED_SERVICE_VERSIONS_QUERY,
+                                              RELEASED_SERVICE_VERSIONS_FIELDS))
 
     #### developer check methods
 
+    @_mutates
     def approve_developer(self, developer):
         # if the developer is already on the list, just return
         if self.is_approved_developer([developer])[0]:
             return
         self.developers.insert_one({'kb_username': developer})
 
+    @_mutates
     def revoke_developer(self, developer):
         # if the developer is not on the list, throw an error (maybe a typo, so let's catch it)
         if not self.is_approved_developer([developer])[0]:
@@ -870,6 +1056,7 @@ class MongoCatalogDBI:
     def list_approved_developers(self):
         return list(self.developers.find({}, {'kb_username': 1, '_id': 0}))
 
+    @_mutates
     def migrate_module_to_new_git_url(self, module_name, current_git_url, new_git_url):
         if not new_git_url.strip():
             raise ValueError('New git url is required to migrate_module_to_new_git_url.')
@@ -881,6 +1068,7 @@ class MongoCatalogDBI:
         result = self.modules.update_one(query, {'$set': {'git_url': new_git_url.strip()}})
         return self._check_update_result(result)
 
+    @_mutates
     def delete_module(self, module_name, git_url):
         if not module_name and not git_url:
             raise ValueError('Module name or git url is required to delete a module.')
@@ -900,6 +1088,7 @@ class MongoCatalogDBI:
         result = self.modules.delete_one({'_id': module_details['_id']})
         return self._check_update_result(result)
 
+    @_mutates
     def add_favorite(self, module_name, app_id, username, timestamp):
         favoriteAddition = {
             'user': username,
@@ -914,6 +1103,7 @@ class MongoCatalogDBI:
         favoriteAddition['timestamp'] = timestamp
         self.favorites.insert_one(favoriteAddition)
 
+    @_mutates
     def remove_favorite(self, module_name, app_id, username):
         favoriteAddition = {
             'user': username,
@@ -986,32 +1176,12 @@ class MongoCatalogDBI:
 
     # DEPRECATED! temporary function until everything is migrated to new client group structure
     def list_client_groups(self, app_ids):
+        groups = self.client_groups.find({}, client_group_fields(app_ids))
         if app_ids is not None:
-            selection = {
-                '_id': 0,
-                'function_name': 1,
-                'client_groups': 1,
-                'module_name': 1,
-                'module_name_lc': 1
-            }
-            gList = list(self.client_groups.find({}, selection))
-            filteredGList = []
-            for g in gList:
-                for a in app_ids:
-                    if g['module_name_lc'] + '/' + g['function_name'] == a:
-                        filteredGList.append(g)
-            for g in filteredGList:
-                del [g['module_name_lc']]
-            return filteredGList
-
-        selection = {
-            '_id': 0,
-            'function_name': 1,
-            'client_groups': 1,
-            'module_name': 1
-        }
-        return list(self.client_groups.find({}, selection))
+            return filter_client_groups(groups, app_ids)
+        return list(groups)
 
+    @_mutates
     def set_client_group_config(self, config):
         config['module_name_lc'] = config['module_name'].lower()
         return self._check_update_result(self.client_groups.replace_one(
@@ -1023,6 +1193,7 @@ class MongoCatalogDBI:
             upsert=True
         ))
 
+    @_mutates
     def remove_client_group_config(self, config):
         config['module_name_lc'] = config['module_name'].lower()
         return self._check_update_result(self.client_groups.delete_one(
@@ -1039,6 +1210,7 @@ class MongoCatalogDBI:
             del (filter['module_name'])
         return list(self.client_groups.find(filter, selection))
 
+    @_mutates
     def set_volume_mount(self, volume_mount):
         volume_mount['module_name_lc'] = volume_mount['module_name'].lower()
         return self._check_update_result(self.volume_mounts.replace_one(
@@ -1051,6 +1223,7 @@ class MongoCatalogDBI:
             upsert=True
         ))
 
+    @_mutates
     def remove_volume_mount(self, volume_mount):
         volume_mount['module_name_lc'] = volume_mount['module_name'].lower()
         return self._check_update_result(self.volume_mounts.delete_one(
@@ -1069,12 +1242,7 @@ class MongoCatalogDBI:
 
     #### utility methods
     def _get_mongo_query(self, module_name='', git_url=''):
-        query = {}
-        if module_name:
-            query['module_name_lc'] = module_name.strip().lower()
-        if git_url:
-            query['git_url'] = git_url.strip()
-        return query
+        return module_query(module_name=module_name, git_url=git_url)
 
     # if it worked, return None.  If it didn't return something indicating an error
     def _check_update_result(self, result):
@@ -1239,6 +1407,7 @@ class MongoCatalogDBI:
 
         return list(self.exec_stats_raw.find(filter, {'_id': 0}))
 
+    @_mutates
     def set_secure_config_params(self, data_list):
         for param_data in data_list:
             param_data['module_name_lc'] = param_data['module_name'].lower()
@@ -1252,6 +1421,7 @@ class MongoCatalogDBI:
                 param_data,
                 upsert=True)
 
+    @_mutates
     def remove_secure_config_params(self, data_list):
         for param_data in data_list:
             param_data['module_name_lc'] = param_data['module_name'].lower()
@@ -0,0 +1,150 @@
+'''
+Request deadlines.  Each request runs with a deadline: the method's default from the config,
+shortened by the client if it asks for less with an X-Catalog-Deadline-Ms header or a
+deadline_ms field in the JSON-RPC context.  The time left is sent to mongo as the maxTimeMS
+of every MongoCatalogDBI query, so that mongo cancels a query the client has stopped waiting
+for, and is used as the timeout of the auth and NMS calls made for the request.  A request
+that runs out of time gets a DeadlineExceededError.  Once a request starts changing catalog
+data its deadline is lifted, so that a change made in several steps is never stopped part
+way through.
+
+The deadline is held in a context variable, so it follows the request into copied contexts
+(e.g. the batch executor) but not into the module registration threads.
+
+Configured with:
+    deadline-default-ms = <milliseconds>
+        deadline of the methods not listed in deadline-methods, 0 (the default) for none
+    deadline-methods = <method>=<milliseconds>, ...
+        per method deadlines, 0 for none
+'''
+import contextvars
+import math
+import time
+
+from jsonrpcbase import JSONRPCError
+
+from biokbase.catalog import metrics
+from biokbase.catalog.admission import parse_method_limits
+
+try:
+    from pymongo.errors import ExecutionTimeout as _ExecutionTimeout
+except ImportError:  # pragma: no cover
+    _ExecutionTimeout = ()
+from requests.exceptions import Timeout as _HTTPTimeout
+
+HEADER = 'HTTP_X_CATALOG_DEADLINE_MS'
+CONTEXT_FIELD = 'deadline_ms'
+
+EXCEEDED = metrics.Counter('catalog_rpc_deadline_exceeded_total',
+                           'JSON-RPC requests that ran out of time', ['method'])
+
+# time.monotonic() by which the current request must be done
+_deadline = contextvars.ContextVar('catalog_deadline', default=None)
+
+
+class DeadlineExceededError(JSONRPCError):
+    code = -32008
+    message = 'Deadline exceeded'
+
+    def __init__(self, data):
+        super().__init__()
+        self.data = data
+
+
+def start(seconds):
+    '''
+    sets a deadline seconds from now (None for no deadline), never later than a deadline
+    already set.  Returns a token for end().
+    '''
+    if seconds is None:
+        return None
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    return _deadline.set(deadline)
+
+
+def end(token):
+    ''' restores the deadline from before the start() that returned token '''
+    if token is not None:
+        _deadline.reset(token)
+
+
+def disarm():
+    ''' lifts the deadline for the rest of the current context '''
+    if _deadline.get() is not None:
+        _deadline.set(None)
+
+
+def remaining():
+    ''' returns the seconds left before the deadline, None if there is none '''
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def check():
+    ''' raises DeadlineExceededError if the deadline has passed '''
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceededError('The request deadline was exceeded')
+
+
+def max_time_ms():
+    ''' returns the time left as a mongo maxTimeMS, None if there is no deadline '''
+    check()
+    left = remaining()
+    return None if left is None else max(1, int(left * 1000))
+
+
+def timeout(default=None):
+    ''' returns an HTTP timeout in seconds: the time left, if it is shorter than default '''
+    check()
+    left = remaining()
+    if left is None:
+        return default
+    return left if default is None else min(default, left)
+
+
+def is_timeout(error):
+    ''' returns True if error is a mongo or HTTP timeout caused by the deadline '''
+    if isinstance(error, DeadlineExceededError):
+        return True
+    if isinstance(error, _ExecutionTimeout):
+        return remaining() is not None
+    left = remaining()
+    return isinstance(error, _HTTPTimeout) and left is not None and left <= 0
+
+
+def _milliseconds(value):
+    ms = int(value)
+    if ms < 0:
+        raise ValueError('Invalid deadline: ' + str(value))
+    return ms / 1000.0 if ms else None
+
+
+class Deadlines:
+    ''' the configured deadlines of the methods '''
+
+    def __init__(self, config):
+        config = config or {}
+        self.default = _milliseconds(config.get('deadline-default-ms') or 0)
+        self.methods = parse_method_limits(config.get('deadline-methods'), _milliseconds)
+
+    def seconds(self, method, requested_ms=None):
+        '''
+        returns the deadline of a call in seconds from now, None for no deadline.
+        requested_ms is the deadline asked for by the client, which can only shorten the
+        method's deadline.  Raises ValueError if it is not a positive number.
+        '''
+        seconds = self.methods.get(method, self.default)
+        if requested_ms is None or requested_ms == '':
+            return seconds
+        try:
+            requested = float(requested_ms)
+        except (TypeError, ValueError):
+            requested = 0
+        if not (requested > 0 and math.isfinite(requested)):
+            raise ValueError('Invalid deadline: {}'.format(requested_ms))
+        requested /= 1000.0
+        return requested if seconds is None else min(seconds, requested)
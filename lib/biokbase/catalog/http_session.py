@@ -0,0 +1,119 @@
+'''
+Pooled keep-alive HTTP connections for the calls the catalog makes to the auth service, NMS
+and the other services it talks to.  Calls made with the module functions of requests open
+a new TCP (and TLS) connection every time; the functions here send them through one
+requests.Session per process instead, so the connections to each host are kept open and
+reused by the following calls.  The session is created on first use in every process, as
+uwsgi workers must not share the sockets of the master.
+
+Every call gets a connect and a read timeout, both limited to the deadline of the current
+request.  Connection failures are retried, as the request never reached the server, and
+GET requests are also retried on read errors and on 502, 503 and 504 responses; other
+requests, which may change the server's state, are not.
+
+Configured with:
+    http-pool-hosts = <hosts to keep connections to>
+    http-pool-size = <connections kept per host>
+    http-connect-timeout-ms = <milliseconds>
+    http-read-timeout-ms = <milliseconds>
+    http-retries = <count>
+    http-retry-backoff-ms = <milliseconds>
+'''
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from biokbase.catalog import deadline
+
+_config = {'pool_hosts': 10, 'pool_size': 10, 'connect_timeout': None, 'read_timeout': None,
+           'retries': 0, 'backoff': 0}
+
+_lock = threading.Lock()
+_session = None
+_pid = None
+
+
+def _get_int(config, key, default):
+    value = int(config.get(key) or default)
+    if value < 0:
+        raise ValueError('{} must not be negative'.format(key))
+    return value
+
+
+def configure(config):
+    ''' reads the http-* keys of the service configuration '''
+    connect = _get_int(config, 'http-connect-timeout-ms', 0)
+    read = _get_int(config, 'http-read-timeout-ms', 0)
+    _config['pool_hosts'] = _get_int(config, 'http-pool-hosts', 10) or 1
+    _config['pool_size'] = _get_int(config, 'http-pool-size', 10) or 1
+    _config['connect_timeout'] = connect / 1000 if connect else None
+    _config['read_timeout'] = read / 1000 if read else None
+    _config['retries'] = _get_int(config, 'http-retries', 0)
+    _config['backoff'] = _get_int(config, 'http-retry-backoff-ms', 0) / 1000
+    reset()
+
+
+def reset():
+    ''' closes the session, so that the next call starts a new one with the current settings '''
+    global _session
+    with _lock:
+        if _session is not None and _pid == os.getpid():
+            _session.close()
+        _session = None
+
+
+def _new_session():
+    retries = _config['retries']
+    retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                  backoff_factor=_config['backoff'], status_forcelist=(502, 503, 504),
+                  allowed_methods=frozenset(['GET', 'HEAD', 'OPTIONS']),
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=_config['pool_hosts'],
+                          pool_maxsize=_config['pool_size'], max_retries=retry)
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def session():
+    ''' returns the session of this process '''
+    global _session, _pid
+    s = _session
+    if s is not None and _pid == os.getpid():
+        return s
+    with _lock:
+        if _session is None or _pid != os.getpid():
+            # a session inherited from the parent process is dropped, not closed, as its
+            # connections are still the parent's
+            _session = _new_session()
+            _pid = os.getpid()
+        return _session
+
+
+def get_timeout(read=None):
+    '''
+    returns the (connect, read) timeout for a call, given its own read timeout in seconds,
+    limited to the remaining time of the current request
+    '''
+    read = deadline.timeout(_config['read_timeout'] if read is None else read)
+    connect = _config['connect_timeout']
+    if read is not None and (connect is None or read < connect):
+        connect = read
+    return connect, read
+
+
+def request(method, url, timeout=None, **kwargs):
+    ''' makes a request like requests.request, over the pooled connections '''
+    return session().request(method, url, timeout=get_timeout(timeout), **kwargs)
+
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+
+def post(url, data=None, **kwargs):
+    return request('POST', url, data=data, **kwargs)
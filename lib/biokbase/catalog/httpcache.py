@@ -0,0 +1,75 @@
+'''
+HTTP caching of the read-only catalog methods.  The methods that need no authentication can be
+called with a GET, so that browsers, proxies and CDNs can cache their responses:
+
+    GET /rpc/Catalog.get_module_info?params=[{"module_name":"onerepotest"}]
+
+params is the URL encoded JSON list of the method parameters and may be omitted if there are
+none.  The response is the same JSON-RPC response a POST would get (with the id 'get').
+
+Responses carry an ETag made from the catalog data generation, which every write of catalog
+data bumps (see MongoCatalogDBI.get_data_generation), and the representation, and a
+Cache-Control header.  A request with a matching If-None-Match gets a 304 without the method
+running.  The generation is polled from mongo at most once per response-cache-poll-ms, so a
+write may take that long to change the ETags served by other worker processes.
+
+Build logs and execution stats are written without bumping the generation, so the methods
+returning them are served with Cache-Control: no-store and no ETag.
+
+Configured with:
+    http-cache-max-age = <seconds>
+        how long caches may use a response without revalidating it, 0 (the default) to
+        revalidate every time
+'''
+import json
+from urllib.parse import parse_qs
+
+PREFIX = '/rpc/'
+
+# methods whose results can change without the data generation changing
+UNVERSIONED_METHODS = frozenset([
+    'Catalog.get_build_log',
+    'Catalog.get_parsed_build_log',
+    'Catalog.list_builds',
+    'Catalog.get_exec_aggr_stats',
+])
+
+NO_STORE = 'no-store'
+
+
+def parse_request(path, query_string):
+    '''
+    returns the JSON-RPC request for a GET of path (starting with PREFIX) and query string.
+    Raises ValueError if the params are not valid JSON.
+    '''
+    method = path[len(PREFIX):]
+    params = parse_qs(query_string or '').get('params')
+    params = json.loads(params[0]) if params else []
+    return {'method': method, 'params': params, 'version': '1.1', 'id': 'get'}
+
+
+def etag(generation, codec_name, encoding=None):
+    ''' returns the ETag of a response computed at a data generation '''
+    tag = '{}-{}'.format(generation, codec_name)
+    if encoding:
+        tag += '-' + encoding
+    return '"' + tag + '"'
+
+
+def matches(if_none_match, tag):
+    ''' returns True if the If-None-Match header value lists the ETag tag '''
+    if not if_none_match:
+        return False
+    for t in if_none_match.split(','):
+        t = t.strip()
+        if t.startswith('W/'):
+            t = t[2:]
+        if t == '*' or t == tag:
+            return True
+    return False
+
+
+def cache_control(max_age):
+    if max_age > 0:
+        return 'public, max-age={}'.format(max_age)
+    return 'public, no-cache'
@@ -0,0 +1,143 @@
+'''
+Priority lanes.  Methods can be assigned to a lane, which runs them on its own bounded pool
+of threads with a bounded queue.  The request's thread waits for the lane to run the call,
+so a lane caps how many request threads its methods can hold: a request that finds its lane
+full is rejected right away with a RateLimitedError (http status 429) instead of waiting.
+That keeps a burst of slow stats or admin calls from taking every thread of the worker and
+starving the cheap reads.  Methods not assigned to a lane run on the request's thread as
+before.
+
+As every call admitted to a lane, running or queued, holds a request thread, the lanes
+together must admit fewer calls than the worker has request threads, so that methods
+outside the lanes always find a thread.  Lanes checks that against the threads setting
+(uwsgi's threads per worker, or the --threads of the pre-forking server).
+
+Each lane reports its queue depth, the calls running and the time calls wait for a thread.
+
+Configured with:
+    lanes = <lane>=<threads>/<queue size>, ...
+    lane-methods = <method>=<lane>, ...
+'''
+import contextvars
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from biokbase.catalog import deadline, metrics
+from biokbase.catalog.admission import RateLimitedError, parse_method_limits
+
+QUEUED = metrics.Gauge('catalog_lane_queued', 'Calls waiting for a thread of a lane', ['lane'])
+RUNNING = metrics.Gauge('catalog_lane_running', 'Calls running on a lane', ['lane'])
+WAIT = metrics.Histogram('catalog_lane_wait_seconds',
+                         'Time calls waited for a thread of a lane', ['lane'])
+REJECTED = metrics.Counter('catalog_lane_rejections_total',
+                           'Calls rejected because their lane was full', ['lane'])
+
+
+def parse_lane(value):
+    ''' parses <threads>/<queue size> '''
+    threads, _, queue_size = value.partition('/')
+    threads = int(threads)
+    queue_size = int(queue_size) if queue_size else 0
+    if threads < 1 or queue_size < 0:
+        raise ValueError('Invalid lane: ' + value)
+    return threads, queue_size
+
+
+class Lane:
+
+    def __init__(self, name, threads, queue_size=0):
+        self.name = name
+        self.threads = threads
+        self.queue_size = queue_size
+        # calls admitted to the lane, running or queued
+        self._slots = threading.BoundedSemaphore(threads + queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def _get_executor(self):
+        # created on first use so that uwsgi workers don't inherit threads
+        # from the master process
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.threads, thread_name_prefix='lane-' + self.name)
+        return self._executor
+
+    def run(self, fn, *args):
+        '''
+        runs fn(*args) on the lane, in a copy of the caller's context, and returns its result.
+        Raises RateLimitedError if the lane is full.
+        '''
+        if not self._slots.acquire(blocking=False):
+            REJECTED.inc(lane=self.name)
+            raise RateLimitedError('Too many calls waiting in the {} lane'.format(self.name), 1)
+        try:
+            context = contextvars.copy_context()
+            queued = time.perf_counter()
+            QUEUED.inc(lane=self.name)
+
+            def call():
+                QUEUED.dec(lane=self.name)
+                WAIT.observe(time.perf_counter() - queued, lane=self.name)
+                with RUNNING.track_inprogress(lane=self.name):
+                    # don't start a call whose client has given up while it was queued
+                    deadline.check()
+                    return fn(*args)
+
+            try:
+                future = self._get_executor().submit(context.run, call)
+            except RuntimeError:
+                QUEUED.dec(lane=self.name)
+                raise
+            return future.result()
+        finally:
+            self._slots.release()
+
+
+class Lanes:
+    ''' the configured lanes and the methods assigned to them '''
+
+    def __init__(self, config):
+        config = config or {}
+        self.lanes = {name: Lane(name, *size) for name, size in parse_method_limits(
+            config.get('lanes'), parse_lane).items()}
+        self.methods = parse_method_limits(config.get('lane-methods'), str)
+        for method, lane in self.methods.items():
+            if lane not in self.lanes:
+                raise ValueError('Method {} is assigned to an unknown lane {}'.format(
+                    method, lane))
+        self.check_threads(int(config.get('threads') or 0))
+
+    def check_threads(self, request_threads):
+        '''
+        raises a ValueError if the lanes can hold all of request_threads threads.  0 skips the
+        check.
+        '''
+        admitted = sum(lane.threads + lane.queue_size for lane in self.lanes.values())
+        if request_threads and admitted >= request_threads:
+            raise ValueError(
+                'The lanes admit {} calls, which must be fewer than the {} request threads '
+                'so that methods outside the lanes always get a thread'.format(
+                    admitted, request_threads))
+
+    def check_limits(self, concurrency_limits):
+        '''
+        raises a ValueError if a lane admits fewer calls than the concurrency-limits of its
+        methods, given as a dict of method to limit, allow to run at once.  Those calls would
+        be rejected by the lane although admission control let them through.
+        '''
+        for name, lane in self.lanes.items():
+            limit = sum(concurrency_limits.get(m, 0) for m, n in self.methods.items()
+                        if n == name)
+            if limit > lane.threads + lane.queue_size:
+                raise ValueError(
+                    'Lane {} admits {} calls, fewer than the {} the concurrency-limits of '
+                    'its methods allow'.format(name, lane.threads + lane.queue_size, limit))
+
+    def run(self, method, fn, *args):
+        ''' runs fn(*args) on the lane of method, or on this thread if it has none '''
+        lane = self.methods.get(method)
+        if lane is None:
+            return fn(*args)
+        return self.lanes[lane].run(fn, *args)
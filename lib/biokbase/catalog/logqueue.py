@@ -0,0 +1,171 @@
+'''
+Asynchronous logging for the request path.  Log records are put on a bounded queue and
+written by a background thread, so a slow log sink (syslog, a log file on a network drive)
+doesn't add to request latency.  When the queue is full records are dropped and counted
+instead of blocking the request.
+
+The biokbase.log loggers of the server are wrapped with AsyncLog, and configure_root_logger
+puts the handlers of the root logger of the logging module behind the same queue, so
+records of both are written in the order they were logged.
+
+Configured with:
+    log-queue-size = <records>
+        0 writes log records synchronously
+    log-format = text|json
+        the format of the records of the logging module
+'''
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+
+from biokbase.catalog import metrics, tracing
+
+DROPPED = metrics.Counter('catalog_log_records_dropped_total',
+                          'Log records dropped because the log queue was full', ['sink'])
+
+
+class LogQueue:
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._reset()
+        # the writer thread doesn't survive a fork, a child process starts its own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._queue = queue.Queue(self.maxsize)
+        self._pid = None
+
+    def submit(self, sink, fn, *args):
+        '''
+        runs fn(*args) on the writer thread.  Returns False if the queue is full and the
+        record was dropped.
+        '''
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            self._queue.put_nowait((fn, args))
+        except queue.Full:
+            DROPPED.inc(sink=sink)
+            return False
+        return True
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run, args=(self._queue,), name='catalog-log-writer',
+                             daemon=True).start()
+            self._pid = os.getpid()
+
+    def _run(self, q):
+        while True:
+            fn, args = q.get()
+            try:
+                fn(*args)
+            except Exception:
+                # there's nowhere else to report a failing log sink
+                traceback.print_exc(file=sys.stderr)
+            finally:
+                q.task_done()
+
+    def pending(self):
+        return self._queue.unfinished_tasks
+
+    def flush(self, timeout=5):
+        '''
+        waits up to timeout seconds for the queued records to be written.  Returns False if
+        some are still queued.
+        '''
+        deadline = time.monotonic() + timeout
+        q = self._queue
+        with q.all_tasks_done:
+            while q.unfinished_tasks:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                q.all_tasks_done.wait(remaining)
+        return True
+
+
+class AsyncLog:
+    ''' wraps a biokbase.log.log, writing its messages on the writer thread of a LogQueue '''
+
+    def __init__(self, logger, log_queue, sink):
+        self._logger = logger
+        self._log_queue = log_queue
+        self._sink = sink
+
+    def log_message(self, *args):
+        self._log_queue.submit(self._sink, self._logger.log_message, *args)
+
+    def __getattr__(self, name):
+        return getattr(self._logger, name)
+
+
+class _QueueHandler(logging.Handler):
+    ''' passes records to handlers on the writer thread of a LogQueue '''
+
+    def __init__(self, log_queue, handlers):
+        super().__init__()
+        self.log_queue = log_queue
+        self.handlers = handlers
+
+    def emit(self, record):
+        try:
+            # format the message now, its arguments may change once the caller continues
+            record.msg = record.getMessage()
+            record.args = None
+            trace = tracing.current_trace()
+            if trace is not None:
+                record.trace_id = trace.trace_id
+        except Exception:
+            self.handleError(record)
+            return
+        self.log_queue.submit('logging', self._dispatch, record)
+
+    def _dispatch(self, record):
+        for h in self.handlers:
+            if record.levelno >= h.level:
+                h.handle(record)
+
+
+class JSONFormatter(logging.Formatter):
+    ''' formats a record as a single line JSON object '''
+
+    def format(self, record):
+        doc = {'time': record.created,
+               'level': record.levelname,
+               'logger': record.name,
+               'message': record.getMessage(),
+               'pid': record.process,
+               'thread': record.threadName}
+        if getattr(record, 'trace_id', None):
+            doc['trace_id'] = record.trace_id
+        if record.exc_info:
+            doc['exception'] = self.formatException(record.exc_info)
+        return json.dumps(doc, default=str)
+
+
+def configure_root_logger(log_format='text', log_queue=None):
+    '''
+    sets the format of the handlers of the root logger, and if a log queue is given moves the
+    handlers behind it
+    '''
+    if log_format not in ('text', 'json'):
+        raise ValueError('Unknown log-format {}, expected text or json'.format(log_format))
+    root = logging.getLogger()
+    handlers = []
+    for h in root.handlers:
+        handlers.extend(h.handlers if isinstance(h, _QueueHandler) else [h])
+    if log_format == 'json':
+        for h in handlers:
+            h.setFormatter(JSONFormatter())
+    if log_queue is not None:
+        root.handlers = [_QueueHandler(log_queue, handlers)]
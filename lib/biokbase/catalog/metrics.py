@@ -0,0 +1,417 @@
+'''
+Prometheus style metrics for the catalog server, exposed in the text exposition format at
+the /metrics endpoint of the WSGI Application.
+
+Under uwsgi every worker process keeps its own values.  If a metrics directory is
+configured, each process periodically writes a snapshot of its values to
+<metrics-dir>/<pid>-<start time>.json and a scrape of any worker merges all of the snapshots:
+counters and histograms are summed over every process that has run (so values survive worker
+restarts), gauges are summed over the processes that are still alive.  A scrape folds the
+counters and histograms of the processes that have exited into <metrics-dir>/archive.json and
+removes their snapshots, so recycled workers don't leave snapshots behind.
+'''
+import contextlib
+import fcntl
+import glob
+import json
+import math
+import os
+import threading
+import time
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+                   math.inf)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+_ARCHIVE = 'archive.json'
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+        self._registry = registry if registry is not None else REGISTRY
+        self._registry.register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError('{} expects labels {}, got {}'.format(
+                self.name, list(self.labelnames), sorted(labels)))
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def _add(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        self._registry.changed()
+
+    def get(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(k), v] for k, v in self._values.items()]
+        return {'type': self.type, 'help': self.documentation,
+                'labelnames': list(self.labelnames), 'values': values}
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError('Counters can only be incremented')
+        self._add(self._key(labels), amount)
+
+
+class Gauge(_Metric):
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        super().__init__(name, documentation, labelnames, registry)
+        self._function = None
+
+    def set_function(self, function):
+        '''
+        reports the values returned by function, a dict of label values tuple to value,
+        whenever the metrics are collected instead of the values set
+        '''
+        self._function = function
+
+    def get(self, **labels):
+        if self._function is not None:
+            return self._function().get(self._key(labels), 0)
+        return super().get(**labels)
+
+    def snapshot(self):
+        if self._function is None:
+            return super().snapshot()
+        return {'type': self.type, 'help': self.documentation,
+                'labelnames': list(self.labelnames),
+                'values': [[list(k), v] for k, v in self._function().items()]}
+
+    def inc(self, amount=1, **labels):
+        self._add(self._key(labels), amount)
+
+    def dec(self, amount=1, **labels):
+        self._add(self._key(labels), -amount)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+        self._registry.changed()
+
+    @contextlib.contextmanager
+    def track_inprogress(self, **labels):
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS,
+                 registry=None):
+        buckets = sorted(float(b) for b in buckets)
+        if buckets[-1] != math.inf:
+            buckets.append(math.inf)
+        self.buckets = buckets
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+        self._registry.changed()
+
+    def get(self, **labels):
+        ''' returns (count, sum) for the labels '''
+        state = self._values.get(self._key(labels))
+        if state is None:
+            return 0, 0.0
+        return state[2], state[1]
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        with self._lock:
+            values = [[list(k), [list(s[0]), s[1], s[2]]] for k, s in self._values.items()]
+        return {'type': self.type, 'help': self.documentation,
+                'labelnames': list(self.labelnames), 'buckets': self.buckets,
+                'values': values}
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = {}
+        self.directory = None
+        self.flush_interval = 1.0
+        self._lock = threading.Lock()
+        self._collect_lock = threading.Lock()
+        self._dirty = False
+        self._flusher_pid = None
+        # tells apart the snapshots of processes that had the same pid
+        self._started = time.time()
+        os.register_at_fork(after_in_child=self._after_fork)
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError('Duplicate metric ' + metric.name)
+        self._metrics[metric.name] = metric
+
+    def configure(self, directory, flush_interval=1.0):
+        '''
+        enables multi-process aggregation through snapshot files in directory.  Snapshots of
+        processes that are no longer running and the archive, left by a previous run of the
+        service, are removed.
+        '''
+        self.directory = directory or None
+        self.flush_interval = flush_interval
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            pid = _pid_of(path)
+            if os.path.basename(path) == _ARCHIVE or (
+                    pid is not None and pid != os.getpid() and not _pid_alive(pid)):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _after_fork(self):
+        # the parent's values are already reported in its own snapshot
+        if self.directory is None:
+            return
+        self._lock = threading.Lock()
+        self._collect_lock = threading.Lock()
+        self._started = time.time()
+        for m in self._metrics.values():
+            m._lock = threading.Lock()
+            m._values = {}
+
+    def changed(self):
+        if self.directory is None:
+            return
+        self._dirty = True
+        if self._flusher_pid != os.getpid():
+            # threads don't survive a fork, so start one per (uwsgi worker) process
+            with self._lock:
+                if self._flusher_pid != os.getpid():
+                    self._flusher_pid = os.getpid()
+                    threading.Thread(target=self._flush_loop, name='metrics-flush',
+                                     daemon=True).start()
+
+    def _flush_loop(self):
+        pid = os.getpid()
+        while self._flusher_pid == pid:
+            time.sleep(self.flush_interval)
+            if self._dirty:
+                self.flush()
+
+    def snapshot(self):
+        return {name: m.snapshot() for name, m in self._metrics.items()}
+
+    def flush(self):
+        if self.directory is None:
+            return
+        self._dirty = False
+        pid = os.getpid()
+        path = os.path.join(self.directory, '{}-{}.json'.format(pid, int(self._started * 1000)))
+        _write_json(path, {'pid': pid, 'started': self._started, 'metrics': self.snapshot()})
+
+    def collect(self):
+        ''' returns the merged snapshot of every process, or of this process only '''
+        if self.directory is None:
+            return self.snapshot()
+        self.flush()
+        with self._collect_lock, _locked(self.directory):
+            snapshots = []
+            for path in glob.glob(os.path.join(self.directory, '*.json')):
+                if os.path.basename(path) == _ARCHIVE:
+                    continue
+                data = _read_json(path)
+                if data is not None:
+                    snapshots.append((path, data))
+            # a process whose pid was reused by a newer one has exited too
+            newest = {}
+            for _, data in snapshots:
+                newest[data['pid']] = max(newest.get(data['pid'], 0), data.get('started', 0))
+            archive = {}
+            for name, m in (_read_json(os.path.join(self.directory, _ARCHIVE)) or {}).items():
+                _merge(archive, name, m)
+            live = []
+            exited = []
+            for path, data in snapshots:
+                if (data.get('started', 0) == newest[data['pid']]
+                        and _pid_alive(data['pid'])):
+                    live.append(data)
+                    continue
+                exited.append(path)
+                for name, m in data['metrics'].items():
+                    if m['type'] != 'gauge':
+                        _merge(archive, name, m)
+            if exited:
+                _write_json(os.path.join(self.directory, _ARCHIVE),
+                            {name: {k: v for k, v in m.items() if k != '_index'}
+                             for name, m in archive.items()})
+                for path in exited:
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+        merged = archive
+        for data in live:
+            for name, m in data['metrics'].items():
+                _merge(merged, name, m)
+        return merged
+
+    def render(self):
+        return render(self.collect())
+
+
+def _merge(merged, name, m):
+    target = merged.get(name)
+    if target is None:
+        target = merged[name] = dict(m, values=[])
+        target['_index'] = {}
+    index = target['_index']
+    for key, value in m['values']:
+        key = tuple(key)
+        if key not in index:
+            index[key] = len(target['values'])
+            target['values'].append([list(key), value])
+            continue
+        existing = target['values'][index[key]]
+        if m['type'] == 'histogram':
+            old = existing[1]
+            existing[1] = [[a + b for a, b in zip(old[0], value[0])], old[1] + value[1],
+                           old[2] + value[2]]
+        else:
+            existing[1] += value
+
+
+def _pid_of(path):
+    try:
+        return int(os.path.basename(path).split('.')[0].split('-')[0])
+    except ValueError:
+        return None
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_json(path, data):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    ''' holds an exclusive lock on directory, shared by every process that collects '''
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=None):
+    pairs = ['{}="{}"'.format(n, _escape(v)) for n, v in zip(names, values)]
+    if extra:
+        pairs.append('{}="{}"'.format(*extra))
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == math.inf:
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render(snapshot):
+    ''' formats a snapshot in the Prometheus text exposition format '''
+    lines = []
+    for name in sorted(snapshot):
+        m = snapshot[name]
+        lines.append('# HELP {} {}'.format(name, m['help']))
+        lines.append('# TYPE {} {}'.format(name, m['type']))
+        names = m['labelnames']
+        for key, value in sorted(m['values']):
+            if m['type'] != 'histogram':
+                lines.append('{}{} {}'.format(name, _labels(names, key), _number(value)))
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, c in zip(m['buckets'], counts):
+                cumulative += c
+                lines.append('{}_bucket{} {}'.format(
+                    name, _labels(names, key, ('le', _number(bound))), cumulative))
+            lines.append('{}_sum{} {}'.format(name, _labels(names, key), _number(total)))
+            lines.append('{}_count{} {}'.format(name, _labels(names, key), count))
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+RPC_REQUESTS = Counter('catalog_rpc_requests_total', 'JSON-RPC requests by method',
+                       ['method'])
+RPC_ERRORS = Counter('catalog_rpc_errors_total', 'JSON-RPC requests that returned an error',
+                     ['method'])
+RPC_LATENCY = Histogram('catalog_rpc_request_duration_seconds',
+                        'Time to run a JSON-RPC request', ['method'])
+RPC_IN_FLIGHT = Gauge('catalog_rpc_requests_in_flight', 'JSON-RPC requests being processed')
+RPC_COALESCED = Counter('catalog_rpc_coalesced_total',
+                        'JSON-RPC requests that shared the result of an identical request',
+                        ['method'])
+RPC_NOT_MODIFIED = Counter('catalog_rpc_not_modified_total',
+                           'GET requests answered with 304 Not Modified', ['method'])
+REGISTRATION_THREADS = Gauge('catalog_registration_threads',
+                             'Module registration (build) threads that are running')
@@ -0,0 +1,238 @@
+'''
+A pre-forking WSGI server for running the catalog without uwsgi, e.g. for load tests and
+small deployments:
+
+    python lib/biokbase/catalog/Server.py --port 5000 --workers 4 --threads 16
+
+The master process forks the workers and restarts any that die.  Where the platform has
+SO_REUSEPORT each worker listens on its own socket bound to the same port and the kernel
+spreads the connections over them; otherwise the workers accept from a socket created by
+the master.  Each worker serves requests on a bounded pool of threads and stops accepting
+connections while all of them are busy.
+
+On SIGTERM or SIGINT the master asks the workers to stop.  A worker stops accepting
+connections, finishes the requests it is serving and the running module registrations,
+and exits.  Workers still running after the graceful timeout are killed.
+'''
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from biokbase.catalog import builds
+
+
+def reuseport_supported():
+    return hasattr(socket, 'SO_REUSEPORT')
+
+
+def _socket(host, port, reuseport):
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET,
+                         socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    return sock
+
+
+class _RequestHandler(WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        # the application logs its requests
+        pass
+
+
+class WorkerServer(WSGIServer):
+    ''' a WSGI server handling each connection on a bounded thread pool '''
+
+    def __init__(self, sock, app, threads):
+        # the socket is already bound and listening
+        super().__init__(sock.getsockname()[:2], _RequestHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = sock
+        self.server_name = socket.getfqdn(self.server_address[0])
+        self.server_port = self.server_address[1]
+        self.setup_environ()
+        self.set_app(app)
+        self.executor = ThreadPoolExecutor(max_workers=threads,
+                                           thread_name_prefix='http-worker')
+        self._slots = threading.BoundedSemaphore(threads)
+
+    def process_request(self, request, client_address):
+        # wait for a free thread, leaving new connections in the listen backlog meanwhile
+        self._slots.acquire()
+        try:
+            self.executor.submit(self._process, request, client_address)
+        except RuntimeError:
+            self._slots.release()
+            self.shutdown_request(request)
+
+    def _process(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._slots.release()
+
+    def drain(self):
+        ''' waits for the requests being served to finish '''
+        self.executor.shutdown(wait=True)
+
+
+def _worker(app, sock, threads, on_start, on_stop):
+    # a ctrl-c reaches the whole process group, the master stops the workers
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    server = WorkerServer(sock, app, threads)
+
+    def stop(signum, frame):
+        # shutdown() waits for serve_forever to return, so it can't run in this thread
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    if on_start is not None:
+        on_start()
+    try:
+        server.serve_forever(poll_interval=0.2)
+    finally:
+        server.socket.close()
+        server.drain()
+        builds.registry.shutdown()
+        if on_stop is not None:
+            on_stop()
+
+
+class PreforkServer:
+    '''
+    app - the WSGI application
+    workers - the number of worker processes
+    threads - the number of request threads in each worker
+    graceful_timeout - seconds the workers get to finish their requests on shutdown
+    on_worker_start - called in each worker after the fork
+    on_worker_stop - called in each worker once it has finished its requests; workers exit
+        without running the atexit handlers
+    '''
+
+    def __init__(self, app, host='localhost', port=9999, workers=2, threads=8,
+                 graceful_timeout=30, backlog=128, on_worker_start=None, on_worker_stop=None):
+        if workers < 1 or threads < 1:
+            raise ValueError('workers and threads must be at least 1')
+        self.app = app
+        self.host = host
+        self.port = port
+        self.workers = workers
+        self.threads = threads
+        self.graceful_timeout = graceful_timeout
+        self.backlog = backlog
+        self.on_worker_start = on_worker_start
+        self.on_worker_stop = on_worker_stop
+        self.reuseport = reuseport_supported()
+        self._pids = set()
+        self._stopping = False
+        self._socket = None
+
+    def bind(self):
+        '''
+        binds the socket before the workers start, so that a system assigned port is known.
+        With SO_REUSEPORT the master's socket only reserves the port and doesn't listen, so
+        no connections are queued on it.  Returns the port.
+        '''
+        self._socket = _socket(self.host, self.port, self.reuseport)
+        if not self.reuseport:
+            self._socket.listen(self.backlog)
+        self.port = self._socket.getsockname()[1]
+        return self.port
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid:
+            self._pids.add(pid)
+            return
+        code = 0
+        try:
+            if self.reuseport:
+                # each worker has its own queue of connections
+                self._socket.close()
+                sock = _socket(self.host, self.port, True)
+                sock.listen(self.backlog)
+            else:
+                sock = self._socket
+            _worker(self.app, sock, self.threads, self.on_worker_start, self.on_worker_stop)
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    def _stop(self, signum, frame):
+        self._stopping = True
+
+    def serve(self):
+        ''' runs the master process until it is sent SIGTERM or SIGINT '''
+        if self._socket is None:
+            self.bind()
+        signal.signal(signal.SIGTERM, self._stop)
+        signal.signal(signal.SIGINT, self._stop)
+        print('Listening on {}:{} with {} workers of {} threads{}'.format(
+            self.host, self.port, self.workers, self.threads,
+            ' (SO_REUSEPORT)' if self.reuseport else ''))
+        sys.stdout.flush()
+        for _ in range(self.workers):
+            self._spawn()
+        while not self._stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self._pids:
+                self._pids.discard(pid)
+                if not self._stopping:
+                    print('Worker {} exited with status {}, restarting it'.format(pid, status))
+                    # don't fork as fast as we can if workers fail on startup
+                    time.sleep(1)
+                    self._spawn()
+            else:
+                time.sleep(0.1)
+        self.shutdown()
+
+    def shutdown(self):
+        ''' stops the workers, killing those still running after the graceful timeout '''
+        for pid in self._pids:
+            _kill(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout
+        while self._pids and time.monotonic() < deadline:
+            for pid in list(self._pids):
+                if _reap(pid, os.WNOHANG):
+                    self._pids.discard(pid)
+            time.sleep(0.05)
+        for pid in self._pids:
+            print('Worker {} did not stop in {}s, killing it'.format(pid, self.graceful_timeout))
+            _kill(pid, signal.SIGKILL)
+            _reap(pid, 0)
+        self._pids = set()
+        if self._socket is not None:
+            self._socket.close()
+
+
+def _kill(pid, sig):
+    try:
+        os.kill(pid, sig)
+    except ProcessLookupError:
+        pass
+
+
+def _reap(pid, options):
+    ''' returns True if the process has exited (or was already reaped) '''
+    try:
+        return os.waitpid(pid, options)[0] != 0
+    except ChildProcessError:
+        return True
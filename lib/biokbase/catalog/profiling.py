@@ -0,0 +1,95 @@
+'''
+Per request profiling.  An admin can send a request with the X-Catalog-Profile header to run
+that call under cProfile.  The profile is stored in the profile directory and its id is
+returned in the X-Catalog-Profile-Id response header; GET /profiles/<id> returns a report of
+the profile, or the pstats file with ?format=pstats (for snakeviz, pstats etc).
+
+Only the newest max_profiles profiles are kept.
+
+Configured with:
+    profile-dir = <directory>
+        profiling is disabled if not set
+    profile-max-count = <profiles>
+'''
+import cProfile
+import io
+import json
+import os
+import pstats
+import re
+import threading
+import time
+import uuid
+
+HEADER = 'HTTP_X_CATALOG_PROFILE'
+ID_HEADER = 'X-Catalog-Profile-Id'
+
+_ID = re.compile('^[0-9a-f]{32}$')
+
+# cProfile can only profile one call at a time in a process
+_lock = threading.Lock()
+
+
+class ProfileStore:
+
+    def __init__(self, directory, max_profiles=100):
+        self.directory = directory
+        self.max_profiles = max_profiles
+        os.makedirs(directory, exist_ok=True)
+
+    def run(self, info, fn, *args):
+        '''
+        runs fn(*args) under the profiler and stores the profile with the dict info.  Returns
+        the result of fn and the profile id; the profile is stored even if fn raises.
+        '''
+        profile_id = uuid.uuid4().hex
+        profiler = cProfile.Profile()
+        with _lock:
+            start = time.time()
+            try:
+                return profiler.runcall(fn, *args), profile_id
+            finally:
+                info = dict(info, id=profile_id, start=start, duration=time.time() - start)
+                self._save(profile_id, profiler, info)
+
+    def _save(self, profile_id, profiler, info):
+        path = os.path.join(self.directory, profile_id)
+        profiler.dump_stats(path + '.prof')
+        with open(path + '.json', 'w') as f:
+            json.dump(info, f)
+        self._prune()
+
+    def _prune(self):
+        profiles = [os.path.join(self.directory, f) for f in os.listdir(self.directory)
+                    if f.endswith('.prof')]
+        if len(profiles) <= self.max_profiles:
+            return
+        profiles.sort(key=os.path.getmtime)
+        for p in profiles[:len(profiles) - self.max_profiles]:
+            for path in (p, p[:-len('.prof')] + '.json'):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def path(self, profile_id):
+        ''' returns the path of the pstats file of a profile, or None if there is none '''
+        if not _ID.match(profile_id):
+            return None
+        path = os.path.join(self.directory, profile_id + '.prof')
+        return path if os.path.exists(path) else None
+
+    def report(self, profile_id, sort='cumulative', limit=60):
+        ''' returns a text report of a profile, or None if there is none '''
+        path = self.path(profile_id)
+        if path is None:
+            return None
+        out = io.StringIO()
+        with open(path[:-len('.prof')] + '.json') as f:
+            info = json.load(f)
+        for k in sorted(info):
+            out.write('{}: {}\n'.format(k, info[k]))
+        out.write('\n')
+        stats = pstats.Stats(path, stream=out)
+        stats.strip_dirs().sort_stats(sort).print_stats(limit)
+        return out.getvalue()
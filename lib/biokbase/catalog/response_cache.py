@@ -0,0 +1,105 @@
+'''
+Cache of the encoded results of read only JSON-RPC methods, so that the server doesn't
+repeat the query and the serialization of the same result for every caller.
+
+Entries are keyed by method, canonical params and response codec, and are only valid for
+the catalog data generation they were computed at: every write of catalog data bumps the
+generation, and the first lookup that sees a new generation empties the cache.  Each
+worker process polls the generation from mongo at most once per poll interval, so a write
+made through another worker is seen within that interval.
+
+The cached bytes hold only the result; the envelope with the request's id and version is
+added around them for each response.  Least recently used entries are evicted to keep the
+cache under max_bytes.
+
+Configured with:
+    response-cache-methods = <method>, ...
+    response-cache-max-bytes = <bytes>
+    response-cache-poll-ms = <milliseconds>
+'''
+import collections
+import threading
+
+from biokbase.catalog import metrics
+
+HITS = metrics.Counter('catalog_response_cache_hits_total',
+                       'JSON-RPC requests answered from the response cache', ['method'])
+MISSES = metrics.Counter('catalog_response_cache_misses_total',
+                         'JSON-RPC requests for a cached method that missed the cache',
+                         ['method'])
+SIZE = metrics.Gauge('catalog_response_cache_bytes', 'Size of the cached responses')
+
+
+class ResponseCache:
+    '''
+    methods - the methods whose results are cached
+    generation - a function returning the current data generation
+    max_bytes - the maximum total size of the cached results
+    '''
+
+    def __init__(self, methods, generation, max_bytes=64 * 1024 * 1024):
+        self.methods = frozenset(methods)
+        self.max_bytes = max_bytes
+        self._get_generation = generation
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()
+        self._size = 0
+        self._generation = None
+
+    def generation(self):
+        ''' returns the current data generation, to be read before computing a result '''
+        return self._get_generation()
+
+    def get(self, method, key, generation):
+        ''' returns the cached result for key at generation, or None '''
+        with self._lock:
+            self._check_generation(generation)
+            value = self._entries.get(key)
+            if value is not None and generation == self._generation:
+                self._entries.move_to_end(key)
+            else:
+                value = None
+        if value is None:
+            MISSES.inc(method=method)
+        else:
+            HITS.inc(method=method)
+        return value
+
+    def put(self, key, generation, value):
+        '''
+        caches value for key if generation is still current, i.e. the data didn't change
+        while the value was computed
+        '''
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            self._check_generation(generation)
+            if generation != self._generation:
+                return
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= len(old)
+            self._entries[key] = value
+            self._size += len(value)
+            while self._size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._size -= len(evicted)
+            SIZE.set(self._size)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+            SIZE.set(0)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _check_generation(self, generation):
+        # generations only go up, an older one is from a request that started before a write
+        if self._generation is None or generation > self._generation:
+            self._generation = generation
+            self._entries.clear()
+            self._size = 0
+            SIZE.set(0)
@@ -0,0 +1,236 @@
+'''
+A token and role cache shared by the worker processes of a host.  Each process otherwise
+keeps its own TokenCache, so a token is validated against the auth service once per
+process per TTL window; with this cache a token validated by one worker is known to all of
+them.
+
+The cache is a fixed size hash table in a memory mapped file.  The table is made of buckets
+of a few slots each, and every bucket is guarded by an fcntl lock on its byte range (shared
+for lookups, exclusive for changes) together with a thread lock, since fcntl locks don't
+exclude the threads of one process.  A full bucket replaces its expired entries first and
+then its oldest one.  Entries have the same lifetimes as in the TokenCache, measured with
+the wall clock so that they can be compared across processes; an entry that appears to be
+from the future is treated as expired.
+
+Keys are hashes of the token and the auth service url, so the file never holds a token, and
+servers using different auth services can't see each other's users.  Values too large for a
+slot, and any operation the file fails, fall back to a per-process TokenCache.  Rejected
+tokens are only cached in that per-process cache, so that a client sending random tokens
+can't push the valid ones out of the shared table.
+
+The file and its directory must only be writable by the user running the server, as anyone
+who can write to the table can log in as any user.  A missing directory is created with
+mode 0700, and a file that is a symbolic link is refused.
+
+Configured with:
+    token-cache-file = <path>
+    token-cache-size = <entries>
+'''
+import contextlib
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import struct
+import threading
+import time
+
+from biokbase.catalog import metrics
+from biokbase.catalog.authclient import TokenCache
+
+ERRORS = metrics.Counter('catalog_shared_token_cache_errors_total',
+                         'Shared token cache operations that failed and used the '
+                         'per-process cache')
+
+_MAGIC = b'KBCTC001'
+_HEADER = struct.Struct('<8sII')  # magic, buckets, slots per bucket
+_HEADER_SIZE = mmap.PAGESIZE
+_WAYS = 8
+_SLOT_SIZE = 256
+_SLOT = struct.Struct('<32sBdH')  # key, kind, time added, value length
+_MAX_VALUE = _SLOT_SIZE - _SLOT.size
+_KIND = 32  # offset of the kind in a slot
+_EMPTY, _USER, _ROLES = 0, 1, 2
+_THREAD_LOCKS = 64
+
+
+def _open(path, length, header):
+    '''
+    Opens the cache file, creating it if needed, and returns its descriptor.  A file left
+    by a different configuration is replaced rather than resized, as processes still using
+    it have it mapped.
+    '''
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, 0o700, exist_ok=True)
+    stat = os.stat(directory)
+    if stat.st_uid != os.getuid() or stat.st_mode & 0o022:
+        raise ValueError('Token cache directory {} must only be writable by its owner'
+                         .format(directory))
+    for _ in range(5):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+        try:
+            stat = os.fstat(fd)
+            if stat.st_uid != os.getuid() or stat.st_mode & 0o077:
+                raise ValueError('Token cache file {} must only be accessible by its owner'
+                                 .format(path))
+            fcntl.lockf(fd, fcntl.LOCK_EX, _HEADER_SIZE, 0)
+            try:
+                # the file may have been replaced while we waited for the lock
+                if os.stat(path).st_ino == stat.st_ino:
+                    size = os.fstat(fd).st_size
+                    if size == 0:
+                        os.ftruncate(fd, length)
+                        os.pwrite(fd, header, 0)
+                        return fd
+                    if size == length and os.pread(fd, len(header), 0) == header:
+                        return fd
+                    os.unlink(path)
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN, _HEADER_SIZE, 0)
+        except BaseException:
+            os.close(fd)
+            raise
+        os.close(fd)
+    raise OSError('Could not open the token cache file ' + path)
+
+
+class SharedTokenCache(object):
+    '''
+    A TokenCache kept in the file at path, holding up to about size users and roles.
+    namespace - keeps apart the tokens of different auth services using the same file
+    '''
+
+    _MAX_TIME_SEC = TokenCache._MAX_TIME_SEC
+
+    def __init__(self, path, size=4096, namespace=''):
+        self._namespace = namespace.encode('utf-8') + b'\0'
+        self._buckets = max(1, -(-size // _WAYS))
+        self._bucket_size = _WAYS * _SLOT_SIZE
+        length = _HEADER_SIZE + self._buckets * self._bucket_size
+        self._fd = _open(path, length, _HEADER.pack(_MAGIC, self._buckets, _WAYS))
+        try:
+            self._map = mmap.mmap(self._fd, length)
+        except BaseException:
+            os.close(self._fd)
+            raise
+        self._locks = [threading.Lock() for _ in range(_THREAD_LOCKS)]
+        self._fallback = TokenCache()
+
+    def _key(self, token):
+        digest = hashlib.sha256(self._namespace + token.encode('utf-8')).digest()
+        return digest, int.from_bytes(digest[:8], 'little') % self._buckets
+
+    @contextlib.contextmanager
+    def _locked(self, bucket, op):
+        ''' locks a bucket and yields the offset of its first slot '''
+        start = _HEADER_SIZE + bucket * self._bucket_size
+        with self._locks[bucket % _THREAD_LOCKS]:
+            fcntl.lockf(self._fd, op, self._bucket_size, start)
+            try:
+                yield start
+            finally:
+                fcntl.lockf(self._fd, fcntl.LOCK_UN, self._bucket_size, start)
+
+    def _get(self, token, kind, max_age):
+        digest, bucket = self._key(token)
+        try:
+            with self._locked(bucket, fcntl.LOCK_SH) as start:
+                for offset in range(start, start + self._bucket_size, _SLOT_SIZE):
+                    key, k, added, length = _SLOT.unpack_from(self._map, offset)
+                    if k == kind and key == digest:
+                        if 0 <= time.time() - added <= max_age:
+                            offset += _SLOT.size
+                            return self._map[offset:offset + length]
+                        break
+        except OSError:
+            ERRORS.inc()
+        return None
+
+    def _put(self, token, kind, value):
+        if len(value) > _MAX_VALUE:
+            return False
+        digest, bucket = self._key(token)
+        try:
+            with self._locked(bucket, fcntl.LOCK_EX) as start:
+                # read the clock once the bucket is locked, or entries added while this
+                # process waited would seem to be from the future
+                now = time.time()
+                slot = oldest = None
+                for offset in range(start, start + self._bucket_size, _SLOT_SIZE):
+                    key, k, added, _ = _SLOT.unpack_from(self._map, offset)
+                    if k == kind and key == digest:
+                        slot = offset
+                        break
+                    if k == _EMPTY or not 0 <= now - added <= self._MAX_TIME_SEC:
+                        added = float('-inf')
+                    if oldest is None or added < oldest:
+                        slot, oldest = offset, added
+                _SLOT.pack_into(self._map, slot, digest, kind, now, len(value))
+                self._map[slot + _SLOT.size:slot + _SLOT.size + len(value)] = value
+            return True
+        except OSError:
+            ERRORS.inc()
+            return False
+
+    def get_user(self, token):
+        user = self._get(token, _USER, self._MAX_TIME_SEC)
+        if user is None:
+            return self._fallback.get_user(token)
+        return user.decode('utf-8')
+
+    def add_valid_token(self, token, user):
+        if not token:
+            raise ValueError('Must supply token')
+        if not user:
+            raise ValueError('Must supply user')
+        if not self._put(token, _USER, user.encode('utf-8')):
+            self._fallback.add_valid_token(token, user)
+
+    def get_roles(self, token, ttl):
+        '''
+        Returns the roles of a token cached less than ttl seconds ago (at most 5 minutes), or
+        None.
+        '''
+        roles = self._get(token, _ROLES, min(ttl, self._MAX_TIME_SEC))
+        if roles is None:
+            return self._fallback.get_roles(token, ttl)
+        return json.loads(roles)
+
+    def add_roles(self, token, roles):
+        if not token:
+            raise ValueError('Must supply token')
+        roles = list(roles)
+        if not self._put(token, _ROLES, json.dumps(roles).encode('utf-8')):
+            self._fallback.add_roles(token, roles)
+
+    def get_invalid(self, token, ttl):
+        return self._fallback.get_invalid(token, ttl)
+
+    def add_invalid(self, token, error):
+        self._fallback.add_invalid(token, error)
+
+    def invalidate(self, token):
+        ''' Forgets the user and roles of a token. '''
+        self._fallback.invalidate(token)
+        digest, bucket = self._key(token)
+        try:
+            with self._locked(bucket, fcntl.LOCK_EX) as start:
+                for offset in range(start, start + self._bucket_size, _SLOT_SIZE):
+                    if self._map[offset:offset + len(digest)] == digest:
+                        self._map[offset + _KIND] = _EMPTY
+        except OSError:
+            ERRORS.inc()
+
+    def clear(self):
+        self._fallback.clear()
+        try:
+            for bucket in range(self._buckets):
+                with self._locked(bucket, fcntl.LOCK_EX) as start:
+                    self._map[start:start + self._bucket_size] = bytes(self._bucket_size)
+        except OSError:
+            ERRORS.inc()
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
@@ -0,0 +1,69 @@
+'''
+Single-flight coalescing of identical concurrent calls: while a call for a key is running,
+other callers with the same key wait for it and share its result (or exception) instead
+of repeating the work.  Each waiting caller gets its own copy of the result, and waits no
+longer than its request deadline.  Nothing is cached once the call has finished.
+'''
+import copy
+import json
+import threading
+
+from biokbase.catalog import deadline
+
+
+class _Call:
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        '''
+        runs fn, or waits for the running call with the same key.  Returns (result, shared)
+        where shared is True if the result is a copy of another caller's result.  Raises
+        DeadlineExceededError if the request deadline passes while waiting.
+        '''
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            if not call.done.wait(deadline.timeout()):
+                raise deadline.DeadlineExceededError(
+                    'The request deadline was exceeded waiting for an identical call')
+            if call.error is not None:
+                raise call.error
+            return copy.deepcopy(call.result), True
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+    def in_flight(self):
+        with self._lock:
+            return len(self._calls)
+
+
+def request_key(method, params):
+    '''
+    returns a key identifying a call of method with params, the same for params that only
+    differ in the order of their keys
+    '''
+    return method + ':' + json.dumps(params, sort_keys=True, separators=(',', ':'))
@@ -0,0 +1,294 @@
+'''
+Lightweight request tracing for the catalog server.
+
+Application.__call__ starts a trace for every request and spans are opened around the
+RPC method, the controller methods, every MongoCatalogDBI call and the auth and NMS HTTP
+calls.  The current trace and span are kept in context variables, so spans opened in the
+batch thread pool are attached to the request that submitted them, and when no trace is
+active (tracing is disabled, or in registration threads) opening a span costs only a
+context variable lookup.
+
+Finished traces are summarized in a Server-Timing response header and exported, in the
+OTLP/JSON format, either as one line per trace in a local file or to an OTLP/HTTP
+collector.  W3C traceparent headers are honored on requests and added to outgoing calls.
+'''
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+import requests
+
+_trace = contextvars.ContextVar('catalog_trace', default=None)
+_span = contextvars.ContextVar('catalog_span', default=None)
+
+_config = {'enabled': False, 'server_timing': False, 'sample_rate': 1.0, 'exporter': None}
+
+
+def _new_id(nbytes):
+    return '{:0{}x}'.format(random.getrandbits(nbytes * 8), nbytes * 2)
+
+
+class Span:
+
+    __slots__ = ('name', 'span_id', 'parent_id', 'start', 'end', 'start_ns', 'attributes',
+                 'error')
+
+    def __init__(self, name, parent_id, attributes):
+        self.name = name
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.start_ns = time.time_ns()
+        self.start = time.perf_counter()
+        self.end = None
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+
+class Trace:
+
+    def __init__(self, name, traceparent=None, attributes=None):
+        self.trace_id = None
+        parent_id = None
+        if traceparent:
+            parts = traceparent.strip().split('-')
+            if len(parts) >= 4 and len(parts[1]) == 32 and len(parts[2]) == 16:
+                self.trace_id, parent_id = parts[1], parts[2]
+        if self.trace_id is None:
+            self.trace_id = _new_id(16)
+        self.sampled = random.random() < _config['sample_rate']
+        self._lock = threading.Lock()
+        self.spans = []
+        self.root = Span(name, parent_id, dict(attributes or {}))
+        _trace.set(self)
+        _span.set(self.root)
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def finish(self):
+        ''' ends the root span and exports the trace, returns the Server-Timing header '''
+        self.root.end = time.perf_counter()
+        _trace.set(None)
+        _span.set(None)
+        exporter = _config['exporter']
+        if exporter is not None and self.sampled:
+            exporter.export(self)
+        if _config['server_timing']:
+            return self.server_timing()
+        return None
+
+    def server_timing(self):
+        '''
+        Totals the span durations by the first component of the span name (db, auth, nms,
+        controller, ...).  Nested spans are included in their parents' totals.
+        '''
+        totals = {}
+        counts = {}
+        with self._lock:
+            spans = list(self.spans)
+        for s in spans:
+            category = s.name.split('.', 1)[0]
+            totals[category] = totals.get(category, 0) + s.duration
+            counts[category] = counts.get(category, 0) + 1
+        parts = ['{};desc="{} calls";dur={:.1f}'.format(c, counts[c], totals[c] * 1000)
+                 for c in totals]
+        parts.append('total;dur={:.1f}'.format(self.root.duration * 1000))
+        return ', '.join(parts)
+
+    def to_otlp(self):
+        with self._lock:
+            spans = [self.root] + self.spans
+        return {'resourceSpans': [{
+            'resource': {'attributes': [_otlp_attribute('service.name', 'catalog')]},
+            'scopeSpans': [{
+                'scope': {'name': 'biokbase.catalog'},
+                'spans': [_otlp_span(self.trace_id, s, s is self.root) for s in spans]
+            }]
+        }]}
+
+
+def _otlp_attribute(key, value):
+    if isinstance(value, bool):
+        return {'key': key, 'value': {'boolValue': value}}
+    if isinstance(value, int):
+        return {'key': key, 'value': {'intValue': str(value)}}
+    if isinstance(value, float):
+        return {'key': key, 'value': {'doubleValue': value}}
+    return {'key': key, 'value': {'stringValue': str(value)}}
+
+
+def _otlp_span(trace_id, span, root):
+    end_ns = span.start_ns + int(span.duration * 1e9)
+    s = {'traceId': trace_id,
+         'spanId': span.span_id,
+         'name': span.name,
+         'kind': 2 if root else 1,  # SERVER, INTERNAL
+         'startTimeUnixNano': str(span.start_ns),
+         'endTimeUnixNano': str(end_ns),
+         'attributes': [_otlp_attribute(k, v) for k, v in span.attributes.items()],
+         'status': {'code': 2, 'message': span.error} if span.error else {'code': 1}}
+    if span.parent_id:
+        s['parentSpanId'] = span.parent_id
+    return s
+
+
+class FileExporter:
+    ''' appends each trace to a file as one line of OTLP/JSON '''
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        line = json.dumps(trace.to_otlp()) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+class OTLPExporter:
+    '''
+    posts traces to an OTLP/HTTP collector (e.g. http://localhost:4318/v1/traces) from a
+    background thread.  Traces are dropped if the collector can't keep up.
+    '''
+
+    def __init__(self, endpoint, max_queue=1000, batch_size=50, timeout=5):
+        self.endpoint = endpoint
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def export(self, trace):
+        if self._pid != os.getpid():
+            # one sender thread per (uwsgi worker) process
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    threading.Thread(target=self._send_loop, name='otlp-export',
+                                     daemon=True).start()
+        try:
+            self._queue.put_nowait(trace.to_otlp())
+        except queue.Full:
+            self.dropped += 1
+
+    def _send_loop(self):
+        session = requests.Session()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            body = {'resourceSpans': [rs for t in batch for rs in t['resourceSpans']]}
+            try:
+                session.post(self.endpoint, data=json.dumps(body), timeout=self.timeout,
+                             headers={'Content-Type': 'application/json'})
+            except requests.RequestException as e:
+                logging.warning('Could not export traces to {}: {}'.format(self.endpoint, e))
+
+
+def configure(config):
+    '''
+    reads the tracing-* and server-timing keys of the service configuration.  Traces are
+    only recorded if an exporter is configured or the Server-Timing header is enabled.
+    '''
+    exporter_name = config.get('tracing-exporter', '').strip().lower()
+    exporter = None
+    if exporter_name == 'file':
+        exporter = FileExporter(config['tracing-file'])
+    elif exporter_name == 'otlp':
+        exporter = OTLPExporter(config['tracing-otlp-endpoint'])
+    elif exporter_name not in ('', 'none'):
+        raise ValueError('Unknown tracing-exporter: ' + exporter_name)
+    _config['exporter'] = exporter
+    _config['server_timing'] = config.get('server-timing', '').strip().lower() == 'true'
+    _config['sample_rate'] = float(config.get('tracing-sample-rate') or 1.0)
+    _config['enabled'] = exporter is not None or _config['server_timing']
+
+
+def start_trace(name, traceparent=None, **attributes):
+    ''' starts the trace for a request, returns None if tracing is disabled '''
+    if not _config['enabled']:
+        _trace.set(None)
+        _span.set(None)
+        return None
+    return Trace(name, traceparent, attributes)
+
+
+def current_trace():
+    return _trace.get()
+
+
+@contextlib.contextmanager
+def _span_context(trace, name, attributes):
+    parent = _span.get()
+    s = Span(name, parent.span_id if parent else trace.root.span_id, attributes)
+    token = _span.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = '{}: {}'.format(type(e).__name__, e)
+        raise
+    finally:
+        s.end = time.perf_counter()
+        _span.reset(token)
+        trace.add(s)
+
+
+def span(name, **attributes):
+    ''' returns a context manager timing a child span of the current span '''
+    trace = _trace.get()
+    if trace is None:
+        return contextlib.nullcontext()
+    return _span_context(trace, name, attributes)
+
+
+def traceparent():
+    ''' returns a W3C traceparent header value for an outgoing call, or None '''
+    trace = _trace.get()
+    s = _span.get()
+    if trace is None or s is None:
+        return None
+    return '00-{}-{}-{}'.format(trace.trace_id, s.span_id, '01' if trace.sampled else '00')
+
+
+def traced(name):
+    ''' decorator running the function in a span with the given name '''
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _trace.get() is None:
+                return func(*args, **kwargs)
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def trace_methods(prefix):
+    ''' class decorator tracing every public method as a <prefix>.<method name> span '''
+    def decorator(cls):
+        for attr, value in list(vars(cls).items()):
+            if callable(value) and not attr.startswith('_'):
+                setattr(cls, attr, traced(prefix + '.' + attr)(value))
+        return cls
+    return decorator
@@ -23,6 +23,27 @@ except ImportError:
     from urlparse import urlparse as _urlparse  # py2
 import time
 
+try:
+    # spans and trace propagation when running inside the catalog server
+    from biokbase.catalog.tracing import span as _span, traceparent as _traceparent
+    # and calls limited to the deadline of the catalog request
+    from biokbase.catalog.deadline import timeout as _timeout
+    # over the catalog's pooled connections
+    from biokbase.catalog.http_session import post as _post
+except ImportError:
+    from contextlib import nullcontext as _nullcontext
+
+    def _span(name, **attributes):
+        return _nullcontext()
+
+    def _traceparent():
+        return None
+
+    def _timeout(default):
+        return default
+
+    _post = _requests.post
+
 _CT = 'content-type'
 _AJ = 'application/json'
 _URL_SCHEME = frozenset(['http', 'https'])
@@ -172,9 +193,14 @@ class BaseClient(object):
             arg_hash['context'] = context
 
         body = _json.dumps(arg_hash, cls=_JSONObjectEncoder)
-        ret = _requests.post(url, data=body, headers=self._headers,
-                             timeout=self.timeout,
-                             verify=not self.trust_all_ssl_certificates)
+        headers = self._headers
+        traceparent = _traceparent()
+        if traceparent:
+            headers = dict(headers, traceparent=traceparent)
+        with _span('nms.' + method.split('.')[-1], url=url):
+            ret = _post(url, data=body, headers=headers,
+                        timeout=_timeout(self.timeout),
+                        verify=not self.trust_all_ssl_certificates)
         ret.encoding = 'utf-8'
         if ret.status_code == 500:
             if ret.headers.get(_CT) == _AJ:
@@ -1,5 +1,6 @@
 import unittest
 
+from biokbase.catalog import authclient
 from biokbase.catalog.Impl import Catalog
 from catalog_test_util import CatalogTestUtil
 
@@ -18,6 +19,29 @@ class AdminMethodsTest(unittest.TestCase):
         self.assertEqual(self.catalog.is_admin(self.cUtil.user_ctx(), userName)[0], 0)
         self.assertEqual(self.catalog.is_admin(self.cUtil.admin_ctx(), adminName)[0], 1)
 
+    def test_admin_role_cache(self):
+        config = dict(self.cUtil.getCatalogConfig(), **{'admin-role-cache-ttl': '60'})
+        catalog = Catalog(config)
+        authclient.token_cache.clear()
+        adminName = self.cUtil.admin_ctx()['user_id']
+        hits = authclient.ROLE_CACHE_HITS.get()
+        misses = authclient.ROLE_CACHE_MISSES.get()
+
+        self.assertEqual(catalog.is_admin(self.cUtil.admin_ctx(), adminName)[0], 1)
+        self.assertEqual(catalog.is_admin(self.cUtil.admin_ctx(), adminName)[0], 1)
+        self.assertEqual(catalog.is_admin(self.cUtil.user_ctx(), None)[0], 0)
+        self.assertEqual(catalog.is_admin(self.cUtil.user_ctx(), None)[0], 0)
+        self.assertEqual(authclient.ROLE_CACHE_HITS.get(), hits + 2)
+        self.assertEqual(authclient.ROLE_CACHE_MISSES.get(), misses + 2)
+
+        authclient.token_cache.invalidate(self.cUtil.admin_ctx()['token'])
+        self.assertEqual(catalog.is_admin(self.cUtil.admin_ctx(), adminName)[0], 1)
+        self.assertEqual(authclient.ROLE_CACHE_MISSES.get(), misses + 3)
+
+        # no remote check without a token
+        self.assertEqual(catalog.is_admin(self.cUtil.anonymous_ctx(), None)[0], 0)
+        self.assertEqual(authclient.ROLE_CACHE_MISSES.get(), misses + 3)
+
     # test with no token and user token (admin token gets tested in add_remove_developers
     def test_list_approved_developers(self):
         with self.assertRaisesRegex(ValueError, 'Only Admin users can list approved developers.'):
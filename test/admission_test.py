@@ -0,0 +1,92 @@
+import time
+import unittest
+
+from biokbase.catalog.admission import (AdmissionController, RateLimitedError, TokenBucket,
+                                        REJECTIONS, parse_rate, parse_method_limits)
+
+
+class AdmissionTest(unittest.TestCase):
+
+    def test_parse(self):
+        self.assertEqual(parse_rate('10/20'), (10.0, 20.0))
+        self.assertEqual(parse_rate('0.5'), (0.5, 1.0))
+        with self.assertRaises(ValueError):
+            parse_rate('0/5')
+        self.assertEqual(parse_method_limits(' Catalog.a=1, Catalog.b=2 ,', int),
+                         {'Catalog.a': 1, 'Catalog.b': 2})
+        self.assertEqual(parse_method_limits(None, int), {})
+        with self.assertRaises(ValueError) as e:
+            parse_method_limits('Catalog.a', int)
+        self.assertEqual(str(e.exception), 'Expected <method>=<limit>, got: Catalog.a')
+
+    def test_token_bucket(self):
+        bucket = TokenBucket(100, 2)
+        self.assertEqual(bucket.take(), 0)
+        self.assertEqual(bucket.take(), 0)
+        wait = bucket.take()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.01)
+        time.sleep(0.02)
+        self.assertEqual(bucket.take(), 0)
+
+    def test_disabled(self):
+        admission = AdmissionController({})
+        self.assertFalse(admission.enabled)
+        for _ in range(100):
+            with admission.admit('Catalog.version', 'user1'):
+                pass
+
+    def test_user_rate(self):
+        admission = AdmissionController({'rate-limit-per-user': '0.01/2'})
+        before = REJECTIONS.get(method='Catalog.version', reason='user_rate')
+        for _ in range(2):
+            with admission.admit('Catalog.version', 'user1'):
+                pass
+        with self.assertRaises(RateLimitedError) as e:
+            with admission.admit('Catalog.list_builds', 'user1'):
+                pass
+        self.assertEqual(e.exception.data, 'Rate limit exceeded for user1')
+        self.assertGreater(e.exception.retry_after, 50)
+        # other users have their own bucket
+        with admission.admit('Catalog.version', 'user2'):
+            pass
+        self.assertEqual(REJECTIONS.get(method='Catalog.list_builds', reason='user_rate'),
+                         before + 1)
+
+    def test_method_rate(self):
+        admission = AdmissionController({'rate-limit-methods': 'Catalog.get_exec_raw_stats=0.01/1'})
+        with admission.admit('Catalog.get_exec_raw_stats', 'user1'):
+            pass
+        with self.assertRaises(RateLimitedError) as e:
+            with admission.admit('Catalog.get_exec_raw_stats', 'user2'):
+                pass
+        self.assertEqual(e.exception.data, 'Rate limit exceeded for Catalog.get_exec_raw_stats')
+        with admission.admit('Catalog.version', 'user2'):
+            pass
+
+    def test_concurrency(self):
+        admission = AdmissionController({'concurrency-limits': 'Catalog.get_exec_aggr_table=1'})
+        with admission.admit('Catalog.get_exec_aggr_table', 'user1'):
+            with self.assertRaises(RateLimitedError) as e:
+                with admission.admit('Catalog.get_exec_aggr_table', 'user2'):
+                    pass
+            self.assertEqual(e.exception.data, 'Too many concurrent ' +
+                             'Catalog.get_exec_aggr_table requests, the limit is 1')
+        # the slot is released when the request finishes, even if it fails
+        with self.assertRaises(ValueError):
+            with admission.admit('Catalog.get_exec_aggr_table', 'user1'):
+                raise ValueError('boom')
+        with admission.admit('Catalog.get_exec_aggr_table', 'user1'):
+            pass
+
+    def test_user_eviction(self):
+        admission = AdmissionController({'rate-limit-per-user': '1/1'}, max_users=10)
+        for i in range(25):
+            with admission.admit('Catalog.version', 'user%d' % i):
+                pass
+        self.assertLessEqual(len(admission._user_buckets), 10)
+        self.assertIn('user24', admission._user_buckets)
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING admission_test.py +++++++++++')
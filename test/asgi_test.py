@@ -0,0 +1,199 @@
+import asyncio
+import gzip
+import json
+from unittest import mock
+
+from server_test_util import ServerTestCase, rpc
+
+
+class FakeMongo:
+
+    def close(self):
+        pass
+
+
+class FakeAsyncDB:
+    ''' stands in for AsyncMongoCatalogDBI '''
+
+    def __init__(self, *args):
+        self.mongo = FakeMongo()
+
+    async def is_registered(self, module_name='', git_url=''):
+        return module_name == 'registered'
+
+    async def find_basic_module_info(self, query):
+        return [{'module_name': 'async%d' % i, 'owners': [{'kb_username': 'owner'}]}
+                for i in range(3)]
+
+
+class ASGITest(ServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING asgi_test.py +++++++++++')
+        super().setUpClass()
+        from biokbase.catalog import asgi
+        cls.asgi = asgi
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(self.asgi, 'AsyncMongoCatalogDBI', FakeAsyncDB)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_asgi(self, config=None):
+        app = self.asgi.ASGIApplication(self.make_app(config or {}),
+                                        {'mongodb-host': 'localhost:1',
+                                         'mongodb-database': 'catalog_test'})
+        self.addCleanup(app.executor.shutdown)
+        return app
+
+    def request(self, app, body, headers=None, chunk_size=None):
+        ''' sends a request through app's __call__, returns the status, headers and body '''
+        raw = body if isinstance(body, bytes) else json.dumps(body).encode('utf8')
+        chunk_size = chunk_size or len(raw) or 1
+        parts = [raw[i:i + chunk_size] for i in range(0, len(raw), chunk_size)] or [b'']
+        received = [{'type': 'http.request', 'body': p, 'more_body': i < len(parts) - 1}
+                    for i, p in enumerate(parts)]
+        sent = []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        scope = {'type': 'http', 'method': 'POST', 'path': '/', 'query_string': b'',
+                 'headers': [(k.lower().encode(), v.encode())
+                             for k, v in (headers or {}).items()],
+                 'client': ('127.0.0.1', 5000)}
+        asyncio.run(app(scope, receive, send))
+        self.assertEqual(sent[0]['type'], 'http.response.start')
+        self.assertFalse(sent[-1].get('more_body'))
+        response_headers = {k.decode(): v.decode() for k, v in sent[0]['headers']}
+        return (sent[0]['status'], response_headers,
+                b''.join(m.get('body', b'') for m in sent[1:]))
+
+    def test_async_methods(self):
+        app = self.make_asgi()
+        status, headers, body = self.request(
+            app, rpc('Catalog.list_basic_module_info'), chunk_size=10)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), {
+            'version': '1.1', 'id': '1', 'result': [[
+                {'module_name': 'async%d' % i, 'owners': ['owner']} for i in range(3)]]})
+        self.assertEqual(headers['content-length'], str(len(body)))
+        # served on the event loop, not by the wsgi application
+        self.assertEqual(self.calls, [])
+        self.assertEqual(self.logged, [('list_basic_module_info', 'start method'),
+                                       ('list_basic_module_info', 'end method')])
+
+        status, _, body = self.request(app, rpc('Catalog.is_registered',
+                                                {'module_name': 'registered'}))
+        self.assertEqual((status, json.loads(body)['result']), (200, [1]))
+
+        # a notification has no response
+        status, _, body = self.request(app, rpc('Catalog.is_registered', id=None))
+        self.assertEqual((status, body), (200, b''))
+
+    def test_errors(self):
+        app = self.make_asgi()
+        status, _, body = self.request(app, rpc('Catalog.list_basic_module_info', 'modules'))
+        self.assertEqual(status, 500)
+        self.assertIn('wrong type', json.loads(body)['error']['message'])
+
+        status, _, body = self.request(
+            app, rpc('Catalog.list_service_modules', {'tag': 'nightly'}))
+        self.assertEqual(status, 500)
+        self.assertIn('tag parameter must be', json.loads(body)['error']['message'])
+
+        app.wsgi_app.method_authentication['Catalog.is_registered'] = 'required'
+        status, _, body = self.request(app, rpc('Catalog.is_registered'))
+        self.assertEqual(status, 500)
+        self.assertIn('Authentication required', json.loads(body)['error']['message'])
+        with mock.patch.object(app.wsgi_app.auth_client, 'get_user',
+                               side_effect=ValueError('bad token')):
+            status, _, body = self.request(app, rpc('Catalog.is_registered'),
+                                           {'Authorization': 'token'})
+        self.assertEqual(status, 500)
+        self.assertIn('Token validation failed: bad token',
+                      json.loads(body)['error']['message'])
+
+    def test_shared_steps(self):
+        app = self.make_asgi({'compression-encodings': 'gzip',
+                              'compression-min-size': '10',
+                              'rate-limit-methods': 'Catalog.list_basic_module_info=1/1',
+                              'deadline-methods': 'Catalog.is_registered=50'})
+        status, headers, body = self.request(app, rpc('Catalog.list_basic_module_info'),
+                                             {'Accept-Encoding': 'gzip'})
+        self.assertEqual((status, headers['content-encoding']), (200, 'gzip'))
+        self.assertIn(b'async2', gzip.decompress(body))
+
+        status, headers, body = self.request(app, rpc('Catalog.list_basic_module_info'))
+        self.assertEqual(status, 429)
+        self.assertEqual(headers['retry-after'], '1')
+
+        async def slow(db, module_name='', git_url=''):
+            await asyncio.sleep(1)
+        with mock.patch.object(FakeAsyncDB, 'is_registered', slow):
+            status, _, body = self.request(app, rpc('Catalog.is_registered'))
+        self.assertEqual(status, 504)
+        self.assertIn('did not finish before the request deadline', body.decode())
+
+    def test_request_size(self):
+        app = self.make_asgi({'max-request-size': '100'})
+        body = json.dumps(rpc('Catalog.is_registered')).encode('utf8') + b' ' * 100
+        status, _, response = self.request(app, body, chunk_size=10)
+        self.assertEqual(status, 500)
+        self.assertEqual(json.loads(response)['error']['message'],
+                         'Request body exceeds 100 bytes')
+
+    def test_wsgi_path(self):
+        # methods on a lane or in the response cache, and batches, go to the wsgi application
+        for config in [{'lanes': 'slow=1/0',
+                        'lane-methods': 'Catalog.list_basic_module_info=slow'},
+                       {'response-cache-methods': 'Catalog.list_basic_module_info'}]:
+            app = self.make_asgi(config)
+            self.calls = []
+            status, _, body = self.request(app, rpc('Catalog.list_basic_module_info'))
+            self.assertEqual(status, 200)
+            self.assertEqual(json.loads(body)['result'][0][0], {'module_name': 'module0'})
+            self.assertEqual(len(self.calls), 1)
+            self.assertNotIn('Catalog.list_basic_module_info', app.handlers)
+
+        app = self.make_asgi()
+        self.calls = []
+        status, _, body = self.request(app, [rpc('Catalog.list_basic_module_info', id='a'),
+                                             rpc('Catalog.list_basic_module_info', id='b')])
+        self.assertEqual(status, 200)
+        self.assertEqual([r['id'] for r in json.loads(body)], ['a', 'b'])
+        self.assertEqual(len(self.calls), 2)
+
+        status, _, body = self.request(app, b'{"method": ')
+        self.assertEqual(status, 500)
+        self.assertEqual(json.loads(body)['error']['name'], 'Parse error')
+
+    def test_startup_runs_once(self):
+        app = self.make_asgi()
+        with mock.patch.object(app, 'startup') as startup:
+            for _ in range(2):
+                status, _, _ = self.request(app, rpc('Catalog.list_basic_module_info'))
+                self.assertEqual(status, 200)
+        # no handlers were set up, so both requests went to the wsgi application
+        self.assertEqual(startup.call_count, 1)
+        self.assertEqual(app.handlers, {})
+
+    def test_lifespan(self):
+        app = self.make_asgi()
+        received = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+        sent = []
+
+        async def receive():
+            return received.pop(0)
+
+        async def send(message):
+            sent.append(message['type'])
+
+        asyncio.run(app({'type': 'lifespan'}, receive, send))
+        self.assertEqual(sent, ['lifespan.startup.complete', 'lifespan.shutdown.complete'])
+        self.assertIn('Catalog.list_basic_module_info', app.handlers)
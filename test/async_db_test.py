@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import copy
+import unittest
+from unittest import mock
+
+from biokbase.catalog import deadline
+from biokbase.catalog.async_db import AsyncMongoCatalogDBI
+from biokbase.catalog.db import MongoCatalogDBI
+
+MODULES = [
+    {'module_name': 'Echo', 'module_name_lc': 'echo', 'git_url': 'https://github.com/e/echo',
+     'info': {'dynamic_service': 1}, 'owners': [{'kb_username': 'owner'}],
+     'current_versions': {'release': {'git_commit_hash': 'a1'}, 'dev': {'git_commit_hash': 'b2'}},
+     'release_version_list': [{'git_commit_hash': 'a1'}]}]
+VERSIONS = [
+    {'module_name_lc': 'echo', 'git_commit_hash': 'a1', 'version': '1.0.0',
+     'dynamic_service': 1, 'docker_img_name': 'echo:a1'},
+    {'module_name_lc': 'echo', 'git_commit_hash': 'b2', 'version': '1.1.0',
+     'dynamic_service': 1, 'docker_img_name': 'echo:b2'}]
+CLIENT_GROUPS = [
+    {'module_name': 'Echo', 'module_name_lc': 'echo', 'function_name': 'run',
+     'client_groups': ['njs']}]
+
+
+class Cursor:
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __iter__(self):
+        return iter(self.docs)
+
+    async def to_list(self, length):
+        return self.docs
+
+
+class Collection:
+    ''' records the queries sent to a collection, and returns copies of its documents '''
+
+    def __init__(self, queries, docs):
+        self.queries = queries
+        self.docs = docs
+
+    def find(self, *args):
+        self.queries.append(('find',) + copy.deepcopy(args))
+        return Cursor(copy.deepcopy(self.docs))
+
+    def find_one(self, *args):
+        self.queries.append(('find_one',) + copy.deepcopy(args))
+        return copy.deepcopy(self.docs[0]) if self.docs else None
+
+
+class AsyncCollection(Collection):
+
+    async def find_one(self, *args):
+        return super().find_one(*args)
+
+
+def make_db(cls, collection):
+    ''' returns a db interface of cls using fake collections, and the list of its queries '''
+    db = object.__new__(cls)
+    queries = []
+    db.modules = collection(queries, MODULES)
+    db.module_versions = collection(queries, VERSIONS)
+    db.client_groups = collection(queries, CLIENT_GROUPS)
+    return db, queries
+
+
+class AsyncDBTest(unittest.TestCase):
+    ''' the asyncio db interface must send the same queries and return the same results '''
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING async_db_test.py +++++++++++')
+
+    def check(self, method, *args):
+        db, queries = make_db(MongoCatalogDBI, Collection)
+        async_db, async_queries = make_db(AsyncMongoCatalogDBI, AsyncCollection)
+        result = getattr(db, method)(*args)
+        async_result = asyncio.run(getattr(async_db, method)(*args))
+        self.assertEqual(async_queries, queries)
+        self.assertEqual(async_result, result)
+        return result
+
+    def test_same_queries(self):
+        self.assertTrue(self.check('is_registered', 'Echo', ''))
+        self.assertTrue(self.check('is_registered', '', ' https://github.com/e/echo '))
+        self.assertFalse(self.check('is_registered', '', ''))
+        self.assertEqual(len(self.check('find_basic_module_info', {'state.active': True})), 1)
+        self.assertEqual(self.check('list_service_module_versions_with_tag', 'dev'),
+                         [{'module_name': 'Echo', 'version': '1.1.0',
+                           'git_commit_hash': 'b2', 'docker_img_name': 'echo:b2'}])
+        self.check('list_all_released_service_module_versions')
+        self.assertEqual(self.check('list_client_groups', None), CLIENT_GROUPS)
+        self.assertEqual(self.check('list_client_groups', ['echo/run']),
+                         [{'module_name': 'Echo', 'function_name': 'run',
+                           'client_groups': ['njs']}])
+        self.assertEqual(self.check('list_client_groups', ['echo/other']), [])
+
+    def test_deadline(self):
+        with mock.patch('biokbase.catalog.async_db.AsyncIOMotorClient') as client:
+            db = AsyncMongoCatalogDBI('localhost', 'catalog', '', '', 'DEFAULT')
+        modules = client.return_value['catalog'][MongoCatalogDBI._MODULES]
+        modules.find_one = mock.AsyncMock(return_value=None)
+        cursor = modules.find.return_value
+        cursor.max_time_ms.return_value.to_list = mock.AsyncMock(return_value=[])
+
+        async def calls():
+            await db.is_registered('Echo')
+            await db.find_basic_module_info({})
+
+        def with_deadline():
+            token = deadline.start(5)
+            try:
+                asyncio.run(calls())
+            finally:
+                deadline.end(token)
+        contextvars.copy_context().run(with_deadline)
+        self.assertTrue(0 < modules.find_one.call_args.kwargs['max_time_ms'] <= 5000)
+        self.assertTrue(0 < cursor.max_time_ms.call_args.args[0] <= 5000)
@@ -0,0 +1,68 @@
+'''
+Micro-benchmark of the JSON codecs in biokbase.catalog.codec on payloads shaped like
+typical catalog responses and requests.  Run from the test directory with the catalog
+lib on the path:
+
+    PYTHONPATH=../lib python benchmarks/codec_benchmark.py --modules 2000
+'''
+import argparse
+import timeit
+
+from biokbase.catalog import codec
+
+
+def module_info(i):
+    version = {'git_commit_hash': '%040x' % i, 'version': '1.0.%d' % i,
+               'timestamp': 1500000000000 + i, 'registration_id': '%d_%d' % (i, i),
+               'docker_img_name': 'dockerhub-ci.kbase.us/kbase:module%d.%040x' % (i, i),
+               'dynamic_service': i % 2, 'narrative_methods': ['method_%d' % j
+                                                               for j in range(5)],
+               'local_functions': [], 'release_timestamp': None, 'released': 1,
+               'released_timestamp': None}
+    return {'module_name': 'Module%d' % i,
+            'git_url': 'https://github.com/kbaseapps/Module%d' % i,
+            'owners': ['user%d' % i, 'wstester1'],
+            'language': 'python',
+            'info': {'description': 'Module %d does things with genomes' % i,
+                     'language': 'python', 'dynamic_service': i % 2},
+            'dev': version, 'beta': version, 'release': version,
+            'release_version_list': [version] * 3}
+
+
+def payloads(modules):
+    infos = [module_info(i) for i in range(modules)]
+    return {
+        'list_basic_module_info': {'version': '1.1', 'id': '1', 'result': [infos]},
+        'get_build_log': {'version': '1.1', 'id': '2', 'result': [[
+            {'content': 'Step %d/20 : RUN pip install thing==%d\n' % (i, i), 'error': 0}
+            for i in range(modules * 10)]]},
+        'small request': {'version': '1.1', 'id': '3', 'method': 'Catalog.get_module_info',
+                          'params': [{'module_name': 'onerepotest'}]},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modules', type=int, default=1000,
+                        help='number of modules in the generated list responses')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    print('{:<24} {:<8} {:>10} {:>12} {:>12}'.format(
+        'payload', 'codec', 'bytes', 'dumps ms', 'loads ms'))
+    for payload_name, payload in payloads(args.modules).items():
+        number = 1000 if payload_name == 'small request' else 3
+        for name in codec.available_codecs():
+            c = codec.get_codec(name)
+            encoded = c.dumps(payload)
+            dumps = min(timeit.repeat(lambda: c.dumps(payload), number=number,
+                                      repeat=args.repeat)) / number
+            loads = min(timeit.repeat(lambda: c.loads(encoded), number=number,
+                                      repeat=args.repeat)) / number
+            print('{:<24} {:<8} {:>10} {:>12.3f} {:>12.3f}'.format(
+                payload_name, name, len(encoded), dumps * 1000, loads * 1000))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+'''
+Benchmark of the latency of the auth call made for every authenticated request, with a new
+connection per call (requests.post, as before) and over the pooled connections of
+http_session.  By default it runs against a local stand-in for the auth service, over TLS
+with a self signed certificate made with openssl; --connect-delay-ms adds a delay to every
+new connection to model the round trips of the TCP and TLS handshakes to a remote host.
+Give --url and --token to time a real auth service instead.  Run from the test directory
+with the catalog lib on the path:
+
+    PYTHONPATH=../lib python benchmarks/http_session_benchmark.py --calls 500 \\
+        --connect-delay-ms 0,20
+    PYTHONPATH=../lib python benchmarks/http_session_benchmark.py \\
+        --url https://ci.kbase.us/services/auth/api/legacy/KBase/Sessions/Login --token $TOKEN
+'''
+import argparse
+import os
+import shutil
+import ssl
+import statistics
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from biokbase.catalog import http_session
+
+
+class AuthHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        if self.server.connect_delay:
+            time.sleep(self.server.connect_delay)
+        super().setup()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        body = b'{"user_id": "user1"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_server(tls_dir):
+    ''' returns the server and the url of a local auth service '''
+    server = ThreadingHTTPServer(('127.0.0.1', 0), AuthHandler)
+    server.daemon_threads = True
+    server.connect_delay = 0
+    scheme = 'http'
+    if tls_dir:
+        cert, key = os.path.join(tls_dir, 'cert.pem'), os.path.join(tls_dir, 'key.pem')
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days',
+                        '1', '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                        '-keyout', key, '-out', cert], check=True, capture_output=True)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+        scheme = 'https'
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, '{}://127.0.0.1:{}/'.format(scheme, server.server_address[1])
+
+
+def time_calls(post, url, token, calls, verify):
+    ''' returns the latency of each call in milliseconds '''
+    times = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        r = post(url, data={'token': token, 'fields': 'user_id'}, verify=verify)
+        r.raise_for_status()
+        times.append((time.perf_counter() - start) * 1000)
+    return times
+
+
+def percentile(times, p):
+    return sorted(times)[min(len(times) - 1, int(len(times) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=300)
+    parser.add_argument('--connect-delay-ms', default='0',
+                        help='comma separated delays added to each new local connection')
+    parser.add_argument('--no-tls', action='store_true', help='use http for the local server')
+    parser.add_argument('--url', help='an auth service login url to time instead')
+    parser.add_argument('--token', default='token')
+    args = parser.parse_args()
+
+    tls_dir = None if args.no_tls or args.url else tempfile.mkdtemp()
+    try:
+        server = None
+        url, verify = args.url, True
+        if not url:
+            server, url = start_server(tls_dir)
+            verify = os.path.join(tls_dir, 'cert.pem') if tls_dir else True
+        delays = [0] if args.url else [int(d) for d in args.connect_delay_ms.split(',')]
+        print('{:>8} {:>12} {:>9} {:>9} {:>9}'.format(
+            'delay', 'client', 'mean ms', 'p50 ms', 'p99 ms'))
+        for delay in delays:
+            if server:
+                server.connect_delay = delay / 1000
+            means = {}
+            for name, post in [('new conn', requests.post), ('pooled', http_session.post)]:
+                http_session.reset()
+                times = time_calls(post, url, args.token, args.calls, verify)
+                means[name] = statistics.mean(times)
+                print('{:>8} {:>12} {:>9.2f} {:>9.2f} {:>9.2f}'.format(
+                    delay, name, means[name], percentile(times, 0.5), percentile(times, 0.99)))
+            print('saved per authenticated request: {:.2f} ms'.format(
+                means['new conn'] - means['pooled']))
+    finally:
+        if tls_dir:
+            shutil.rmtree(tls_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+'''
+Concurrent load benchmark for catalog deployments.  Fires the same JSON-RPC call at one or
+more running endpoints and reports throughput and latency percentiles for each, e.g. to
+compare the uwsgi deployment of Server.py with the ASGI entry point:
+
+    uwsgi --master --processes 4 --threads 4 --http :5000 --wsgi-file Server.py
+    uvicorn biokbase.catalog.asgi:application --port 5001
+
+    python rpc_load_benchmark.py --endpoint uwsgi=http://localhost:5000 \\
+        --endpoint asgi=http://localhost:5001 --method Catalog.list_basic_module_info \\
+        --params '[{}]' --concurrency 200 --requests 5000
+'''
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, int(round(pct / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def run_endpoint(url, body, headers, concurrency, total):
+    local = threading.local()
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def one(_):
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        start = time.perf_counter()
+        try:
+            r = local.session.post(url, data=body, headers=headers, timeout=600)
+            ok = r.status_code == 200
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors[0] += 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': total,
+        'errors': errors[0],
+        'wall_s': wall,
+        'req_per_s': total / wall,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p95_ms': percentile(latencies, 95) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoint', action='append', required=True,
+                        help='name=url of a running catalog endpoint, may be repeated')
+    parser.add_argument('--method', default='Catalog.version')
+    parser.add_argument('--params', default='[]', help='JSON list of method parameters')
+    parser.add_argument('--token', help='auth token for methods that require one')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--warmup', type=int, default=50)
+    args = parser.parse_args()
+
+    body = json.dumps({'method': args.method, 'params': json.loads(args.params),
+                       'version': '1.1', 'id': '1'})
+    headers = {'Content-Type': 'application/json'}
+    if args.token:
+        headers['Authorization'] = args.token
+
+    print('{:<12} {:>8} {:>7} {:>10} {:>9} {:>9} {:>9}'.format(
+        'endpoint', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms'))
+    for endpoint in args.endpoint:
+        name, url = endpoint.split('=', 1)
+        run_endpoint(url, body, headers, min(args.concurrency, args.warmup), args.warmup)
+        r = run_endpoint(url, body, headers, args.concurrency, args.requests)
+        print('{:<12} {:>8} {:>7} {:>10.1f} {:>9.1f} {:>9.1f} {:>9.1f}'.format(
+            name, r['requests'], r['errors'], r['req_per_s'], r['p50_ms'], r['p95_ms'],
+            r['p99_ms']))
+
+
+if __name__ == '__main__':
+    main()
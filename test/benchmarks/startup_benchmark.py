@@ -0,0 +1,95 @@
+'''
+Startup benchmark for the catalog service.  Reports the time to import the given modules,
+with the slowest imports from python -X importtime, and the time from starting Server.py to
+the first successful response.  Run from the test directory with the catalog lib on the
+path; the time to first request needs a deployment config with reachable dependencies:
+
+    PYTHONPATH=../lib python benchmarks/startup_benchmark.py --module biokbase.catalog.Impl
+    KB_DEPLOYMENT_CONFIG=../deploy.cfg PYTHONPATH=../lib \\
+        python benchmarks/startup_benchmark.py --first-request
+'''
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+import requests
+
+SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'lib',
+                      'biokbase', 'catalog', 'Server.py')
+
+
+def import_times(module):
+    ''' returns the total import time of module in seconds and a dict of package to self time '''
+    p = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+                       stderr=subprocess.PIPE, text=True, check=True)
+    total = 0
+    self_times = {}
+    for line in p.stderr.splitlines():
+        m = re.match(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)', line)
+        if not m:
+            continue
+        top = m.group(4).split('.')[0]
+        self_times[top] = self_times.get(top, 0) + int(m.group(1)) / 1e6
+        if m.group(4) == module:
+            total = int(m.group(2)) / 1e6
+    return total, self_times
+
+
+def time_to_first_request(port, timeout):
+    start = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, SERVER, '--port', str(port)],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    body = json.dumps({'method': 'Catalog.version', 'params': [], 'version': '1.1',
+                       'id': '1'})
+    try:
+        while time.perf_counter() - start < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError('server exited with {}'.format(proc.returncode))
+            try:
+                r = requests.post('http://localhost:{}'.format(port), data=body, timeout=5)
+                if r.status_code == 200:
+                    return time.perf_counter() - start
+            except requests.ConnectionError:
+                time.sleep(0.01)
+        raise RuntimeError('no response in {}s'.format(timeout))
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', action='append',
+                        help='module to import, may be repeated (default biokbase.catalog.Impl)')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10,
+                        help='number of the slowest top level packages to show')
+    parser.add_argument('--first-request', action='store_true',
+                        help='also time starting Server.py until it answers Catalog.version')
+    parser.add_argument('--port', type=int, default=5999)
+    parser.add_argument('--timeout', type=float, default=60)
+    args = parser.parse_args()
+
+    for module in args.module or ['biokbase.catalog.Impl']:
+        runs = [import_times(module) for _ in range(args.runs)]
+        totals = [r[0] for r in runs]
+        print('import {}: median {:.1f} ms, min {:.1f} ms over {} runs'.format(
+            module, statistics.median(totals) * 1000, min(totals) * 1000, args.runs))
+        slowest = sorted(runs[-1][1].items(), key=lambda kv: kv[1], reverse=True)
+        for name, seconds in slowest[:args.top]:
+            print('    {:<30} {:8.1f} ms'.format(name, seconds * 1000))
+
+    if args.first_request:
+        times = [time_to_first_request(args.port, args.timeout) for _ in range(args.runs)]
+        print('time to first request: median {:.0f} ms, min {:.0f} ms over {} runs'.format(
+            statistics.median(times) * 1000, min(times) * 1000, args.runs))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+'''
+Micro-benchmark of the auth TokenCache under concurrent requests.  Each thread looks up
+random tokens from a pool with get_user and, like KBaseAuth, adds the ones it misses, so a
+pool larger than the cache keeps it evicting.  Run from the test directory with the catalog
+lib on the path:
+
+    PYTHONPATH=../lib python benchmarks/token_cache_benchmark.py --threads 1,8,32 \\
+        --tokens 1500,5000
+'''
+import argparse
+import random
+import threading
+import time
+
+from biokbase.catalog.authclient import TokenCache
+
+
+def run(cache, tokens, threads, seconds):
+    ''' returns the lookups per second and the fraction that hit '''
+    stop = threading.Event()
+    counts = []
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        ops = hits = 0
+        while not stop.is_set():
+            for _ in range(100):
+                token = rnd.choice(tokens)
+                if cache.get_user(token) is None:
+                    cache.add_valid_token(token, 'user')
+                else:
+                    hits += 1
+            ops += 100
+        counts.append((ops, hits))
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for w in workers:
+        w.start()
+    time.sleep(seconds)
+    stop.set()
+    for w in workers:
+        w.join()
+    ops = sum(c[0] for c in counts)
+    hits = sum(c[1] for c in counts)
+    return ops / seconds, hits / max(ops, 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', default='1,8,32',
+                        help='comma separated thread counts')
+    parser.add_argument('--tokens', default='1500,5000',
+                        help='comma separated token pool sizes')
+    parser.add_argument('--maxsize', type=int, default=2000, help='cache size')
+    parser.add_argument('--seconds', type=float, default=2)
+    args = parser.parse_args()
+
+    print('{:>8} {:>8} {:>14} {:>8}'.format('tokens', 'threads', 'lookups/s', 'hits'))
+    for pool in [int(n) for n in args.tokens.split(',')]:
+        tokens = ['token-%d-%s' % (i, 'x' * 26) for i in range(pool)]
+        for threads in [int(n) for n in args.threads.split(',')]:
+            cache = TokenCache(maxsize=args.maxsize)
+            rate, hits = run(cache, tokens, threads, args.seconds)
+            print('{:>8} {:>8} {:>14,.0f} {:>7.0%}'.format(pool, threads, rate, hits))
+
+
+if __name__ == '__main__':
+    main()
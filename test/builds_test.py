@@ -0,0 +1,103 @@
+import threading
+import types
+import unittest
+from unittest import mock
+
+from biokbase.catalog.builds import BuildRegistry, INTERRUPTED_MESSAGE, drain_on_exit
+
+
+class FakeDB:
+
+    def __init__(self):
+        self.build_log_states = {}
+        self.module_states = {}
+
+    def set_build_log_state(self, registration_id, registration_state, error_message=''):
+        self.build_log_states[registration_id] = (registration_state, error_message)
+
+    def set_module_registration_state(self, module_name='', git_url='', new_state=None,
+                                      last_state=None, error_message=''):
+        self.module_states[git_url] = (new_state, error_message)
+
+
+class BuildRegistryTest(unittest.TestCase):
+
+    def test_drain(self):
+        registry = BuildRegistry(drain_timeout=5)
+        db = FakeDB()
+        finish = threading.Event()
+        done = []
+
+        def build(name):
+            finish.wait()
+            done.append(name)
+
+        registry.start('r1', 'https://github.com/kbaseIncubator/m1', db, build, args=('m1',))
+        registry.start('r2', 'https://github.com/kbaseIncubator/m2', db, build, args=('m2',))
+        self.assertEqual(sorted(registry.active()), ['r1', 'r2'])
+
+        threading.Timer(0.2, finish.set).start()
+        self.assertEqual(registry.shutdown(), [])
+        self.assertEqual(sorted(done), ['m1', 'm2'])
+        self.assertEqual(registry.active(), [])
+        self.assertEqual(db.build_log_states, {})
+
+    def test_drain_on_uwsgi_exit(self):
+        registry = mock.Mock()
+        previous = mock.Mock()
+        uwsgi = types.SimpleNamespace(atexit=previous)
+        with mock.patch('atexit.register') as register:
+            drain_on_exit(registry, uwsgi)
+        register.assert_not_called()
+        registry.shutdown.assert_not_called()
+        uwsgi.atexit()
+        registry.shutdown.assert_called_once_with()
+        previous.assert_called_once_with()
+
+        with mock.patch('atexit.register') as register:
+            drain_on_exit(registry)
+        register.assert_called_once_with(registry.shutdown)
+
+    def test_interrupted(self):
+        registry = BuildRegistry()
+        db = FakeDB()
+        finish = threading.Event()
+        registry.start('r1', 'https://github.com/kbaseIncubator/m1', db, finish.wait, args=())
+
+        self.assertEqual(registry.shutdown(timeout=0.1), ['r1'])
+        self.assertEqual(db.build_log_states, {'r1': ('error', INTERRUPTED_MESSAGE)})
+        self.assertEqual(db.module_states,
+                         {'https://github.com/kbaseIncubator/m1': ('error', INTERRUPTED_MESSAGE)})
+        finish.set()
+
+    def test_not_accepting(self):
+        registry = BuildRegistry()
+        registry.shutdown()
+        with self.assertRaises(ValueError) as e:
+            registry.check_accepting()
+        self.assertIn('shutting down', str(e.exception))
+
+        # a registration that got past the check is marked as failed
+        db = FakeDB()
+        ran = []
+        with self.assertRaises(ValueError):
+            registry.start('r1', 'https://github.com/kbaseIncubator/m1', db, ran.append,
+                           args=(1,))
+        self.assertEqual(ran, [])
+        self.assertEqual(db.build_log_states, {'r1': ('error', INTERRUPTED_MESSAGE)})
+
+    def test_failed_build_is_removed(self):
+        registry = BuildRegistry()
+        db = FakeDB()
+
+        def build():
+            raise ValueError('no docker')
+
+        registry.start('r1', 'https://github.com/kbaseIncubator/m1', db, build, args=())
+        self.assertEqual(registry.shutdown(timeout=5), [])
+        self.assertEqual(registry.active(), [])
+        self.assertEqual(db.build_log_states, {'r1': ('error', 'Registration failed: no docker')})
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING builds_test.py +++++++++++')
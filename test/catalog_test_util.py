@@ -95,6 +95,7 @@ class CatalogTestUtil:
         self.client_groups = db[MongoCatalogDBI._CLIENT_GROUPS]
         self.volume_mounts = db[MongoCatalogDBI._VOLUME_MOUNTS]
         self.secure_config_params = db[MongoCatalogDBI._SECURE_CONFIG_PARAMS]
+        self.data_generation = db[MongoCatalogDBI._DATA_GENERATION]
 
         self.exec_stats_raw = db[MongoCatalogDBI._EXEC_STATS_RAW]
         self.exec_stats_apps = db[MongoCatalogDBI._EXEC_STATS_APPS]
@@ -115,6 +116,7 @@ class CatalogTestUtil:
         self.exec_stats_apps.drop()
         self.exec_stats_users.drop()
         self.secure_config_params.drop()
+        self.data_generation.drop()
 
         # if self.modules.count() > 0 :
         #    raise ValueError('mongo database collection "'+MongoCatalogDBI._MODULES+'"" not empty (contains '+str(self.modules.count())+' records).  aborting.')
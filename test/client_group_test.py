@@ -501,6 +501,26 @@ class ClientGroupMethodsTest(unittest.TestCase):
 
         return
 
+    def test_data_generation(self):
+        adminCtx = self.cUtil.admin_ctx()
+        cc = self.catalog.get_controller()
+
+        generation = cc.get_data_generation()
+        self.catalog.get_client_groups(self.cUtil.anonymous_ctx(), {})
+        self.assertEqual(cc.get_data_generation(), generation)
+
+        self.catalog.set_client_group_config(adminCtx,
+                                             {'module_name': 'gen', 'function_name': 'run',
+                                              'client_groups': ['g1']})
+        self.assertEqual(cc.get_data_generation(), generation + 1)
+        # invalid params are rejected before anything is written
+        with self.assertRaises(ValueError):
+            self.catalog.remove_client_group_config(adminCtx, {'module_name': 'gen'})
+        self.assertEqual(cc.get_data_generation(), generation + 1)
+        self.catalog.remove_client_group_config(adminCtx,
+                                                {'module_name': 'gen', 'function_name': 'run'})
+        self.assertEqual(cc.get_data_generation(), generation + 2)
+
     @classmethod
     def setUpClass(cls):
         print('++++++++++++ RUNNING client_group_test.py +++++++++++')
@@ -0,0 +1,101 @@
+import json
+import unittest
+
+from biokbase.catalog import codec
+
+
+class JSONableThing:
+
+    def toJSONable(self):
+        return {'thing': 1}
+
+
+class CodecTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        doc = {'module_name': 'onerepotest', 'owners': ['wstester1'], 'info': {'a': None},
+               'released': 1, 'ratio': 0.5, 'unicode': 'héllo / ☃',
+               'release_version_list': [{'git_commit_hash': 'abc'}]}
+        for name in codec.available_codecs():
+            c = codec.get_codec(name)
+            self.assertEqual(c.name, name)
+            encoded = c.dumps(doc)
+            self.assertIsInstance(encoded, str)
+            self.assertEqual(json.loads(encoded), doc)
+            self.assertEqual(c.loads(encoded), doc)
+            self.assertEqual(c.loads(encoded.encode('utf8')), doc)
+
+    def test_special_types(self):
+        for name in codec.available_codecs():
+            c = codec.get_codec(name)
+            self.assertEqual(sorted(json.loads(c.dumps({'s': {1, 2}}))['s']), [1, 2])
+            self.assertEqual(json.loads(c.dumps([frozenset(['a'])])), [['a']])
+            self.assertEqual(json.loads(c.dumps([JSONableThing()])), [{'thing': 1}])
+            self.assertEqual(json.loads(c.dumps({1: 'a'})), {'1': 'a'})
+            self.assertEqual(json.loads(c.dumps([2 ** 70])), [2 ** 70])
+            with self.assertRaises(TypeError):
+                c.dumps([object()])
+
+    def test_invalid_json(self):
+        for name in codec.available_codecs():
+            with self.assertRaises(ValueError):
+                codec.get_codec(name).loads('{"method": ')
+
+    def test_get_codec(self):
+        self.assertEqual(codec.get_codec('auto').name, codec.available_codecs()[0])
+        self.assertEqual(codec.get_codec('JSON').name, 'json')
+        with self.assertRaises(ValueError) as e:
+            codec.get_codec('simplejson')
+        self.assertTrue(str(e.exception).startswith('JSON codec simplejson is not available'))
+
+        try:
+            self.assertEqual(codec.use('json').name, 'json')
+            self.assertEqual(codec.dumps({'a': [1]}), '{"a": [1]}')
+        finally:
+            codec.use('auto')
+
+    def test_join(self):
+        for name in codec.available_codecs():
+            c = codec.get_codec(name)
+            self.assertEqual(json.loads(c.join([c.dumps({'a': 1}), c.dumps([2])])),
+                             [{'a': 1}, [2]])
+
+    @unittest.skipIf(codec.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        c = codec.MsgpackCodec()
+        doc = {'module_name': 'onerepotest', 'owners': ['wstester1'], 'info': {'a': None},
+               'unicode': 'héllo / ☃', 'bin': b'\x00\x01'}
+        self.assertEqual(c.loads(c.dumps(doc)), doc)
+        self.assertEqual(c.loads(c.dumps([{1, 2}, JSONableThing()])), [[1, 2], {'thing': 1}])
+        self.assertEqual(c.loads(c.join([c.dumps({'a': 1}), c.dumps([2])])), [{'a': 1}, [2]])
+        with self.assertRaises(ValueError):
+            c.loads(b'\xc1')
+        with self.assertRaises(ValueError):
+            c.loads(c.dumps(doc)[:-3])
+
+    @unittest.skipIf(codec.msgpack is None, 'msgpack is not installed')
+    def test_negotiate(self):
+        mp = 'application/msgpack'
+        self.assertEqual(codec.request_codec(None), codec.current())
+        self.assertEqual(codec.request_codec('application/json; charset=utf-8'),
+                         codec.current())
+        self.assertEqual(codec.request_codec(mp).name, 'msgpack')
+        self.assertEqual(codec.request_codec('application/x-msgpack').name, 'msgpack')
+
+        def response(accept, content_type=None):
+            return codec.response_codec(accept, content_type).content_type
+
+        self.assertEqual(response(None), 'application/json')
+        self.assertEqual(response('*/*'), 'application/json')
+        self.assertEqual(response(mp), mp)
+        self.assertEqual(response('application/json, application/msgpack;q=0.5'),
+                         'application/json')
+        self.assertEqual(response('application/json;q=0.5, application/msgpack'), mp)
+        # a msgpack request gets a msgpack response unless it asks for JSON
+        self.assertEqual(response(None, mp), mp)
+        self.assertEqual(response('*/*', mp), mp)
+        self.assertEqual(response('application/json', mp), 'application/json')
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING codec_test.py +++++++++++')
@@ -0,0 +1,72 @@
+import gzip
+import os
+import unittest
+
+from biokbase.catalog.compression import (ResponseCompressor, decompress, parse_accept_encoding,
+                                          GZIP, ZSTD, supported_encodings)
+
+
+class CompressionTest(unittest.TestCase):
+
+    def test_parse_accept_encoding(self):
+        self.assertEqual(parse_accept_encoding(None), {})
+        self.assertEqual(parse_accept_encoding('gzip, deflate'), {'gzip': 1.0, 'deflate': 1.0})
+        self.assertEqual(parse_accept_encoding('gzip;q=0.5, zstd ; q=0.8, br;q=x'),
+                         {'gzip': 0.5, 'zstd': 0.8, 'br': 0.0})
+
+    def test_negotiate(self):
+        compressor = ResponseCompressor(encodings=[GZIP])
+        self.assertEqual(compressor.negotiate('gzip, deflate'), GZIP)
+        self.assertEqual(compressor.negotiate('*'), GZIP)
+        self.assertIsNone(compressor.negotiate('deflate'))
+        self.assertIsNone(compressor.negotiate('gzip;q=0'))
+        self.assertIsNone(compressor.negotiate(None))
+
+        # disabled
+        self.assertIsNone(ResponseCompressor(encodings=[]).negotiate('gzip'))
+
+        if ZSTD in supported_encodings():
+            compressor = ResponseCompressor(encodings=[ZSTD, GZIP])
+            self.assertEqual(compressor.negotiate('gzip, zstd'), ZSTD)
+            self.assertEqual(compressor.negotiate('gzip, zstd;q=0.5'), GZIP)
+
+    def test_compress_round_trip(self):
+        body = b'{"module_name": "onerepotest", "release_version_list": []}' * 500
+        compressor = ResponseCompressor(encodings=supported_encodings(), level=1)
+        for encoding in supported_encodings():
+            compressed = compressor.compress(body, encoding)
+            self.assertLess(len(compressed), len(body))
+            self.assertEqual(decompress(compressed, encoding, len(body)), body)
+
+            chunks = [body[i:i + 1000] for i in range(0, len(body), 1000)]
+            streamed = b''.join(compressor.compress_iter(chunks, encoding))
+            self.assertEqual(decompress(streamed, encoding, len(body)), body)
+
+        self.assertEqual(gzip.decompress(compressor.compress(body, GZIP)), body)
+
+    def test_decompress_errors(self):
+        body = b'x' * 10000
+        self.assertEqual(decompress(body, None, 10000), body)
+        self.assertEqual(decompress(body, 'identity', 10000), body)
+        with self.assertRaises(ValueError) as e:
+            decompress(body, None, 9999)
+        self.assertEqual(str(e.exception), 'Request body exceeds 9999 bytes')
+        with self.assertRaises(ValueError) as e:
+            decompress(gzip.compress(body), 'gzip', 9999)
+        self.assertEqual(str(e.exception), 'Decompressed request body exceeds 9999 bytes')
+        with self.assertRaises(ValueError):
+            decompress(b'not gzip', 'gzip', 100)
+        # the size limit applies to the compressed body too
+        with self.assertRaises(ValueError) as e:
+            decompress(os.urandom(200), 'gzip', 100)
+        self.assertEqual(str(e.exception), 'Request body exceeds 100 bytes')
+        with self.assertRaises(ValueError) as e:
+            decompress(gzip.compress(body)[:-8], 'gzip', 10000)
+        self.assertEqual(str(e.exception), 'Invalid gzip request body: truncated')
+        with self.assertRaises(ValueError) as e:
+            decompress(body, 'br', 100000)
+        self.assertEqual(str(e.exception), 'Unsupported Content-Encoding: br')
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING compression_test.py +++++++++++')
@@ -0,0 +1,195 @@
+import contextvars
+import time
+import unittest
+
+from pymongo.errors import ExecutionTimeout
+from requests.exceptions import ReadTimeout
+
+from biokbase.catalog import deadline
+from biokbase.catalog.db import MongoCatalogDBI, DeadlineCollection, _mutates
+
+
+class FakeCursor:
+
+    def __init__(self):
+        self.max_time = None
+
+    def max_time_ms(self, ms):
+        self.max_time = ms
+        return self
+
+
+class FakeCollection:
+
+    def __init__(self):
+        self.calls = []
+
+    def find(self, *args, **kwargs):
+        self.calls.append(('find', args, kwargs))
+        return FakeCursor()
+
+    def find_one_and_update(self, *args, **kwargs):
+        self.calls.append(('find_one_and_update', args, kwargs))
+        return {'generation': len(self.calls)}
+
+    def __getattr__(self, name):
+        def call(*args, **kwargs):
+            self.calls.append((name, args, kwargs))
+        return call
+
+
+class FakeDB:
+
+    bump_data_generation = MongoCatalogDBI.bump_data_generation
+
+    def __init__(self):
+        self.fake = FakeCollection()
+        self.modules = DeadlineCollection(self.fake)
+        self.data_generation = DeadlineCollection(self.fake)
+
+    @_mutates
+    def release(self):
+        self.modules.update_one({'module_name': 'm'}, {'$set': {'state': 'beta'}})
+        time.sleep(0.02)
+        self.modules.find_one({'module_name': 'm'})
+        self.modules.update_one({'module_name': 'm'}, {'$set': {'state': 'released'}})
+
+    @_mutates
+    def fail(self):
+        self.modules.update_one({'module_name': 'm'}, {'$set': {'state': 'beta'}})
+        raise ValueError('write failed')
+
+
+class DeadlineTest(unittest.TestCase):
+
+    def run_with_deadline(self, seconds, fn, *args):
+        ''' runs fn in a new context, so that the deadline doesn't leak into other tests '''
+        def run():
+            token = deadline.start(seconds)
+            try:
+                return fn(*args)
+            finally:
+                deadline.end(token)
+        return contextvars.copy_context().run(run)
+
+    def test_no_deadline(self):
+        self.assertIsNone(deadline.remaining())
+        self.assertIsNone(deadline.max_time_ms())
+        self.assertEqual(deadline.timeout(30), 30)
+        self.assertIsNone(deadline.timeout())
+        deadline.check()
+        self.assertIsNone(deadline.start(None))
+        deadline.end(None)
+
+    def test_deadline(self):
+        def check():
+            self.assertTrue(0 < deadline.remaining() <= 2)
+            self.assertTrue(1000 < deadline.max_time_ms() <= 2000)
+            self.assertTrue(1 < deadline.timeout(30) <= 2)
+            self.assertEqual(deadline.timeout(0.5), 0.5)
+            # a nested deadline can't extend the outer one
+            token = deadline.start(10)
+            self.assertTrue(deadline.remaining() <= 2)
+            deadline.end(token)
+        self.run_with_deadline(2, check)
+        self.assertIsNone(deadline.remaining())
+
+    def test_exceeded(self):
+        def check():
+            time.sleep(0.02)
+            with self.assertRaises(deadline.DeadlineExceededError):
+                deadline.check()
+            with self.assertRaises(deadline.DeadlineExceededError):
+                deadline.max_time_ms()
+            with self.assertRaises(deadline.DeadlineExceededError):
+                deadline.timeout(30)
+            self.assertTrue(deadline.is_timeout(ReadTimeout()))
+            self.assertTrue(deadline.is_timeout(ExecutionTimeout('too slow')))
+            self.assertFalse(deadline.is_timeout(ValueError()))
+        self.run_with_deadline(0.01, check)
+        self.assertFalse(deadline.is_timeout(ReadTimeout()))
+        self.assertFalse(deadline.is_timeout(ExecutionTimeout('too slow')))
+        self.assertTrue(deadline.is_timeout(deadline.DeadlineExceededError('late')))
+
+    def test_config(self):
+        d = deadline.Deadlines({'deadline-default-ms': '5000',
+                                'deadline-methods': 'Catalog.slow=20000, Catalog.free=0'})
+        self.assertEqual(d.seconds('Catalog.version'), 5)
+        self.assertEqual(d.seconds('Catalog.slow'), 20)
+        self.assertIsNone(d.seconds('Catalog.free'))
+        # the client can only shorten the deadline
+        self.assertEqual(d.seconds('Catalog.slow', '1500'), 1.5)
+        self.assertEqual(d.seconds('Catalog.version', 60000), 5)
+        self.assertEqual(d.seconds('Catalog.free', 100), 0.1)
+        self.assertEqual(d.seconds('Catalog.version', ''), 5)
+        for bad in ['0', '-5', 'soon', 'inf', 'nan', {}]:
+            with self.assertRaises(ValueError):
+                d.seconds('Catalog.version', bad)
+
+        self.assertIsNone(deadline.Deadlines(None).seconds('Catalog.version'))
+        with self.assertRaises(ValueError):
+            deadline.Deadlines({'deadline-methods': 'Catalog.version'})
+        with self.assertRaises(ValueError):
+            deadline.Deadlines({'deadline-default-ms': '-1'})
+
+    def test_collection(self):
+        fake = FakeCollection()
+        collection = DeadlineCollection(fake)
+
+        self.assertIsNone(collection.find({'a': 1}).max_time)
+        collection.find_one({'a': 1})
+        collection.aggregate([])
+        collection.update_one({'a': 1}, {'$set': {'b': 2}})
+        self.assertEqual(fake.calls[1], ('find_one', ({'a': 1},), {}))
+        self.assertEqual(fake.calls[2], ('aggregate', ([],), {}))
+
+        def with_deadline():
+            self.assertTrue(0 < collection.find({'a': 1}).max_time <= 5000)
+            collection.find_one({'a': 1})
+            collection.aggregate([])
+            collection.count_documents({})
+            collection.find_one_and_update({'_id': 1}, {'$inc': {'n': 1}})
+        fake.calls = []
+        self.run_with_deadline(5, with_deadline)
+        self.assertTrue(0 < fake.calls[1][2]['max_time_ms'] <= 5000)
+        for call in fake.calls[2:4]:
+            self.assertTrue(0 < call[2]['maxTimeMS'] <= 5000, call)
+        # writes are never limited
+        self.assertEqual(fake.calls[4], ('find_one_and_update', ({'_id': 1}, {'$inc': {'n': 1}}),
+                                         {}))
+
+        def expired():
+            time.sleep(0.02)
+            with self.assertRaises(deadline.DeadlineExceededError):
+                collection.find({})
+            collection.update_one({'a': 1}, {'$set': {'b': 2}})
+            collection.create_index('a')
+        fake.calls = []
+        self.run_with_deadline(0.01, expired)
+        self.assertEqual([c[0] for c in fake.calls], ['update_one', 'create_index'])
+
+    def test_writes_finish(self):
+        db = FakeDB()
+
+        def release():
+            db.release()
+            # the deadline is lifted for the rest of the request
+            self.assertIsNone(deadline.remaining())
+        # the deadline passes between the writes, and before the generation is bumped
+        self.run_with_deadline(0.01, release)
+        self.assertEqual([c[0] for c in db.fake.calls],
+                         ['update_one', 'find_one', 'update_one', 'find_one_and_update'])
+        self.assertEqual(db._data_generation[0], 4)
+
+        # a failed write bumps the generation and keeps its error
+        db.fake.calls = []
+        with self.assertRaisesRegex(ValueError, 'write failed'):
+            self.run_with_deadline(5, db.fail)
+        self.assertEqual([c[0] for c in db.fake.calls], ['update_one', 'find_one_and_update'])
+        db.data_generation = None
+        with self.assertRaisesRegex(ValueError, 'write failed'):
+            db.fail()
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING deadline_test.py +++++++++++')
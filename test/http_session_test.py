@@ -0,0 +1,113 @@
+import contextvars
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from biokbase.catalog import deadline, http_session
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+        self.server.requests.append(self.command)
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        body = b'{"user_id": "user1"}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = respond
+    do_POST = respond
+
+    def log_message(self, *args):
+        pass
+
+
+class HTTPSessionTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING http_session_test.py +++++++++++')
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        cls.server.daemon_threads = True
+        cls.url = 'http://127.0.0.1:{}/'.format(cls.server.server_address[1])
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.connections = 0
+        self.server.requests = []
+        self.server.statuses = []
+        http_session.configure({})
+
+    def tearDown(self):
+        http_session.configure({})
+
+    def test_connections_are_reused(self):
+        for _ in range(5):
+            self.assertEqual(http_session.post(self.url, data={'token': 'x'}).json(),
+                             {'user_id': 'user1'})
+            self.assertTrue(http_session.get(self.url).ok)
+        self.assertEqual(len(self.server.requests), 10)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_new_process(self):
+        s = http_session.session()
+        self.assertIs(http_session.session(), s)
+        with mock.patch.object(http_session.os, 'getpid', return_value=-1):
+            child = http_session.session()
+        self.assertIsNot(child, s)
+        http_session.reset()
+        self.assertIsNot(http_session.session(), child)
+
+    def test_timeout(self):
+        self.assertEqual(http_session.get_timeout(), (None, None))
+        self.assertEqual(http_session.get_timeout(30), (30, 30))
+        http_session.configure({'http-connect-timeout-ms': '2000',
+                                'http-read-timeout-ms': '10000'})
+        self.assertEqual(http_session.get_timeout(), (2, 10))
+        self.assertEqual(http_session.get_timeout(1), (1, 1))
+
+        def with_deadline():
+            token = deadline.start(5)
+            try:
+                connect, read = http_session.get_timeout(1800)
+                self.assertEqual(connect, 2)
+                self.assertTrue(4 < read <= 5)
+            finally:
+                deadline.end(token)
+        contextvars.copy_context().run(with_deadline)
+
+        for key in ['http-read-timeout-ms', 'http-retries', 'http-pool-size']:
+            with self.assertRaises(ValueError):
+                http_session.configure({key: '-1'})
+
+    def test_retries(self):
+        self.server.statuses = [503, 502]
+        self.assertEqual(http_session.get(self.url).status_code, 503)
+
+        http_session.configure({'http-retries': '2'})
+        self.server.statuses = [503, 502]
+        self.assertEqual(http_session.get(self.url).status_code, 200)
+        self.assertEqual(self.server.requests[-3:], ['GET', 'GET', 'GET'])
+
+        # a POST may have changed the server's state, it's not sent again
+        self.server.requests = []
+        self.server.statuses = [503]
+        self.assertEqual(http_session.post(self.url, data='{}').status_code, 503)
+        self.assertEqual(self.server.requests, ['POST'])
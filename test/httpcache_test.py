@@ -0,0 +1,41 @@
+import unittest
+from urllib.parse import quote
+
+from biokbase.catalog import httpcache
+
+
+class HTTPCacheTest(unittest.TestCase):
+
+    def test_parse_request(self):
+        req = httpcache.parse_request(
+            '/rpc/Catalog.get_module_info',
+            'params=' + quote('[{"module_name": "onerepotest"}]'))
+        self.assertEqual(req, {'method': 'Catalog.get_module_info',
+                               'params': [{'module_name': 'onerepotest'}],
+                               'version': '1.1', 'id': 'get'})
+        self.assertEqual(httpcache.parse_request('/rpc/Catalog.version', '')['params'], [])
+        self.assertEqual(httpcache.parse_request('/rpc/Catalog.version', None)['params'], [])
+        with self.assertRaises(ValueError):
+            httpcache.parse_request('/rpc/Catalog.version', 'params=%5B')
+
+    def test_etag(self):
+        self.assertEqual(httpcache.etag(12, 'json'), '"12-json"')
+        self.assertEqual(httpcache.etag(12, 'msgpack', 'gzip'), '"12-msgpack-gzip"')
+
+    def test_matches(self):
+        tag = httpcache.etag(3, 'json')
+        self.assertTrue(httpcache.matches(tag, tag))
+        self.assertTrue(httpcache.matches('"2-json", W/' + tag, tag))
+        self.assertTrue(httpcache.matches('*', tag))
+        self.assertFalse(httpcache.matches('"2-json"', tag))
+        self.assertFalse(httpcache.matches(httpcache.etag(3, 'json', 'gzip'), tag))
+        self.assertFalse(httpcache.matches(None, tag))
+        self.assertFalse(httpcache.matches('', tag))
+
+    def test_cache_control(self):
+        self.assertEqual(httpcache.cache_control(60), 'public, max-age=60')
+        self.assertEqual(httpcache.cache_control(0), 'public, no-cache')
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING httpcache_test.py +++++++++++')
@@ -0,0 +1,34 @@
+import os
+import subprocess
+import sys
+import unittest
+
+# modules only needed for module registration and NMS updates, which must not be imported
+# by processes that only serve reads
+LAZY = ['docker', 'yaml', 'biokbase.catalog.registrar', 'biokbase.narrative_method_store.client']
+
+
+class ImportTest(unittest.TestCase):
+
+    def imported(self, module):
+        lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+        env = dict(os.environ)
+        env['PYTHONPATH'] = os.pathsep.join([lib, env.get('PYTHONPATH', '')])
+        code = ('import sys, {}\n'
+                'print(" ".join(m for m in {!r} if m in sys.modules))').format(module, LAZY)
+        p = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], env=env,
+                           stdout=subprocess.PIPE, text=True, check=True)
+        return p.stdout.split()
+
+    def test_controller_imports_no_build_dependencies(self):
+        self.assertEqual(self.imported('biokbase.catalog.controller'), [])
+        self.assertEqual(self.imported('biokbase.catalog.Impl'), [])
+
+    def test_registrar_still_imports(self):
+        self.assertEqual(self.imported('biokbase.catalog.registrar'),
+                         ['docker', 'yaml', 'biokbase.catalog.registrar',
+                          'biokbase.narrative_method_store.client'])
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING import_test.py +++++++++++')
@@ -0,0 +1,157 @@
+import contextvars
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from biokbase.catalog import deadline
+from biokbase.catalog.admission import RateLimitedError
+from biokbase.catalog.lanes import Lane, Lanes, QUEUED, REJECTED, WAIT, parse_lane
+
+var = contextvars.ContextVar('lanes_test_var', default=None)
+
+
+class LanesTest(unittest.TestCase):
+
+    def test_parse_lane(self):
+        self.assertEqual(parse_lane('4/16'), (4, 16))
+        self.assertEqual(parse_lane('2'), (2, 0))
+        for bad in ['0/4', '2/-1', 'x']:
+            with self.assertRaises(ValueError):
+                parse_lane(bad)
+
+    def test_config(self):
+        lanes = Lanes({'lanes': 'critical-read=8/32, bulk-analytics=1/1',
+                       'lane-methods': 'Catalog.module_version_lookup=critical-read,'
+                                       'Catalog.get_exec_raw_stats=bulk-analytics'})
+        self.assertEqual(sorted(lanes.lanes), ['bulk-analytics', 'critical-read'])
+        self.assertEqual(lanes.lanes['critical-read'].threads, 8)
+        self.assertEqual(lanes.methods['Catalog.get_exec_raw_stats'], 'bulk-analytics')
+        # methods without a lane run on the calling thread
+        self.assertEqual(lanes.run('Catalog.version', threading.current_thread),
+                         threading.current_thread())
+        self.assertNotEqual(lanes.run('Catalog.module_version_lookup', threading.current_thread),
+                            threading.current_thread())
+        with self.assertRaises(ValueError):
+            Lanes({'lanes': 'a=1', 'lane-methods': 'Catalog.version=b'})
+        self.assertEqual(Lanes(None).lanes, {})
+
+    def test_context_and_errors(self):
+        lane = Lane('context', 2)
+        token = var.set('request')
+        try:
+            self.assertEqual(lane.run(var.get), 'request')
+        finally:
+            var.reset(token)
+
+        def fail():
+            raise ValueError('boom')
+        with self.assertRaises(ValueError):
+            lane.run(fail)
+        # the slot of the failed call was released
+        self.assertEqual([lane.run(lambda: 1) for _ in range(3)], [1, 1, 1])
+
+    def test_full_lane_rejects(self):
+        lane = Lane('bulk', 1, 1)
+        release = threading.Event()
+        started = threading.Event()
+        results = []
+
+        def slow():
+            started.set()
+            release.wait()
+            return 'done'
+
+        def run():
+            results.append(lane.run(slow))
+
+        rejected = REJECTED.get(lane='bulk')
+        threads = [threading.Thread(target=run) for _ in range(2)]
+        threads[0].start()
+        started.wait()
+        threads[1].start()
+        for _ in range(100):
+            if QUEUED.get(lane='bulk') == 1:
+                break
+            time.sleep(0.01)
+        self.assertEqual(QUEUED.get(lane='bulk'), 1)
+        with self.assertRaises(RateLimitedError):
+            lane.run(slow)
+        self.assertEqual(REJECTED.get(lane='bulk'), rejected + 1)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, ['done', 'done'])
+        self.assertEqual(QUEUED.get(lane='bulk'), 0)
+        self.assertEqual(WAIT.get(lane='bulk')[0], 2)
+
+    def test_expired_call_is_not_started(self):
+        lane = Lane('deadline', 1)
+        ran = []
+
+        def run():
+            token = deadline.start(0.001)
+            try:
+                time.sleep(0.01)
+                return lane.run(ran.append, 1)
+            finally:
+                deadline.end(token)
+        with self.assertRaises(deadline.DeadlineExceededError):
+            contextvars.copy_context().run(run)
+        self.assertEqual(ran, [])
+
+    def test_check_threads(self):
+        config = {'lanes': 'bulk-analytics=1/0, admin-write=1/1'}
+        Lanes(dict(config, threads='4'))
+        with self.assertRaisesRegex(ValueError, 'admit 3 calls'):
+            Lanes(dict(config, threads='3'))
+        lanes = Lanes(config)
+        lanes.check_threads(8)
+        with self.assertRaises(ValueError):
+            lanes.check_threads(2)
+
+    def test_check_limits(self):
+        lanes = Lanes({'lanes': 'bulk-analytics=2/4, other=1',
+                       'lane-methods': 'Catalog.get_exec_raw_stats=bulk-analytics,'
+                                       'Catalog.get_exec_aggr_stats=bulk-analytics'})
+        lanes.check_limits({'Catalog.get_exec_raw_stats': 2, 'Catalog.get_exec_aggr_stats': 4,
+                            'Catalog.version': 10})
+        with self.assertRaisesRegex(ValueError, 'Lane bulk-analytics admits 6 calls, fewer '
+                                                'than the 7'):
+            lanes.check_limits({'Catalog.get_exec_raw_stats': 3,
+                                'Catalog.get_exec_aggr_stats': 4})
+
+    def test_saturated_lane_leaves_threads_for_reads(self):
+        # a worker with 4 request threads, flooded with slow bulk calls
+        lanes = Lanes({'threads': '4', 'lanes': 'flood=1/1',
+                       'lane-methods': 'Catalog.get_exec_aggr_stats=flood'})
+        release = threading.Event()
+        results = []
+
+        def request(method):
+            try:
+                results.append(lanes.run(method, lambda: method if method == 'Catalog.version'
+                                         else release.wait()))
+            except RateLimitedError:
+                results.append('rejected')
+
+        with ThreadPoolExecutor(max_workers=4) as request_threads:
+            for _ in range(10):
+                request_threads.submit(request, 'Catalog.get_exec_aggr_stats')
+            start = time.monotonic()
+            read = request_threads.submit(request, 'Catalog.version')
+            for _ in range(200):
+                if 'Catalog.version' in results:
+                    break
+                time.sleep(0.01)
+            elapsed = time.monotonic() - start
+            release.set()
+        read.result()
+        self.assertIn('Catalog.version', results)
+        self.assertLess(elapsed, 0.5)
+        self.assertEqual(results.count('rejected'), 8)
+        self.assertEqual(results.count(True), 2)
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING lanes_test.py +++++++++++')
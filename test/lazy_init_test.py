@@ -0,0 +1,111 @@
+import os
+import time
+import unittest
+from unittest import mock
+
+from biokbase.catalog import Impl
+from biokbase.catalog.Impl import Catalog
+
+
+class FakeController:
+    ''' records whether each controller was asked to set up the db '''
+
+    def __init__(self, config, setup_db=True):
+        if config.get('fail'):
+            raise IOError('mongo is down')
+        if setup_db:
+            # gives the other processes time to try to set up the db too
+            time.sleep(0.2)
+        self.setup_db = setup_db
+        os.write(config['pipe'], b'1' if setup_db else b'0')
+
+
+class LazyInitTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING lazy_init_test.py +++++++++++')
+
+    def setUp(self):
+        self.read, self.write = os.pipe()
+        patcher = mock.patch.object(Impl, 'CatalogController', FakeController)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        os.close(self.read)
+        os.close(self.write)
+
+    def config(self, lazy, **kwargs):
+        config = {'lazy-init': 'true' if lazy else 'false', 'pipe': self.write}
+        config.update(kwargs)
+        return config
+
+    def created(self):
+        ''' returns the setup_db flags of the controllers created so far '''
+        os.set_blocking(self.read, False)
+        try:
+            return os.read(self.read, 100).decode()
+        except BlockingIOError:
+            return ''
+
+    def fork_workers(self, catalog, count):
+        ''' creates the controller in count child processes at once '''
+        pids = []
+        for _ in range(count):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    catalog.get_controller()
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        for pid in pids:
+            os.waitpid(pid, 0)
+
+    def test_controller_per_process(self):
+        catalog = Catalog(self.config(lazy=True))
+        self.assertEqual(self.created(), '')
+        cc = catalog.get_controller()
+        self.assertIs(catalog.cc, cc)
+        self.assertEqual(self.created(), '1')
+        # a forked process creates its own controller, without setting up the db again
+        with mock.patch.object(Impl.os, 'getpid', return_value=-1):
+            child_cc = catalog.get_controller()
+        self.assertIsNot(child_cc, cc)
+        self.assertEqual(self.created(), '0')
+
+    def test_master_sets_up_the_db(self):
+        catalog = Catalog(self.config(lazy=False))
+        self.assertEqual(self.created(), '1')
+        self.fork_workers(catalog, 3)
+        self.assertEqual(self.created(), '000')
+
+    def test_one_worker_sets_up_the_db(self):
+        catalog = Catalog(self.config(lazy=True))
+        self.fork_workers(catalog, 4)
+        self.assertEqual(sorted(self.created()), ['0', '0', '0', '1'])
+        catalog.get_controller()
+        self.assertEqual(self.created(), '0')
+
+    def test_failures_back_off(self):
+        now = [1000.0]
+        catalog = Catalog(self.config(lazy=True, fail='yes'))
+        with mock.patch.object(Impl.time, 'monotonic', lambda: now[0]):
+            for retry in [1, 2, 4]:
+                with self.assertRaisesRegex(IOError, '^mongo is down'):
+                    catalog.get_controller()
+                # fails fast until the retry time
+                now[0] += retry - 0.5
+                with self.assertRaisesRegex(IOError, 'failed, retrying in 0s: mongo is down'):
+                    catalog.get_controller()
+                now[0] += 0.5
+            # the db was never set up, another process will try
+            with mock.patch.object(Impl.os, 'getpid', return_value=-1):
+                with self.assertRaisesRegex(IOError, '^mongo is down'):
+                    catalog.get_controller()
+
+            del catalog._config['fail']
+            catalog.get_controller()
+            self.assertEqual(self.created(), '1')
+            self.assertIsNone(catalog._init_failure)
@@ -0,0 +1,125 @@
+import json
+import logging
+import sys
+import threading
+import time
+import unittest
+
+from biokbase.catalog import tracing
+from biokbase.catalog.logqueue import (AsyncLog, DROPPED, JSONFormatter, LogQueue,
+                                       configure_root_logger)
+
+
+class SlowLog:
+
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.messages = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def log_message(self, level, message, *args):
+        self.release.wait()
+        time.sleep(self.delay)
+        self.messages.append((level, message) + args)
+
+    def get_log_file(self):
+        return 'catalog.log'
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+class LogQueueTest(unittest.TestCase):
+
+    def test_async_log(self):
+        sink = SlowLog(delay=0.05)
+        logger = AsyncLog(sink, LogQueue(100), 'server')
+        start = time.monotonic()
+        for i in range(10):
+            logger.log_message(6, 'message %d' % i, '127.0.0.1', 'user1', 'Catalog', 'version',
+                               '1')
+        self.assertLess(time.monotonic() - start, 0.05)
+        self.assertEqual(logger.get_log_file(), 'catalog.log')
+        self.assertTrue(logger._log_queue.flush())
+        self.assertEqual([m[1] for m in sink.messages], ['message %d' % i for i in range(10)])
+        self.assertEqual(sink.messages[0][2:], ('127.0.0.1', 'user1', 'Catalog', 'version', '1'))
+
+    def test_drops(self):
+        sink = SlowLog()
+        sink.release.clear()
+        q = LogQueue(3)
+        logger = AsyncLog(sink, q, 'test')
+        before = DROPPED.get(sink='test')
+        logger.log_message(6, 'first')
+        # wait for the writer to pick up the first message and block on it
+        for _ in range(100):
+            if q._queue.qsize() == 0:
+                break
+            time.sleep(0.01)
+        for i in range(5):
+            logger.log_message(6, 'queued %d' % i)
+        self.assertEqual(DROPPED.get(sink='test'), before + 2)
+        self.assertFalse(q.flush(timeout=0.05))
+        sink.release.set()
+        self.assertTrue(q.flush())
+        self.assertEqual([m[1] for m in sink.messages],
+                         ['first', 'queued 0', 'queued 1', 'queued 2'])
+
+    def test_root_logger(self):
+        root = logging.getLogger()
+        saved = root.handlers, root.level
+        handler = ListHandler()
+        try:
+            root.handlers = [handler]
+            root.setLevel(logging.INFO)
+            q = LogQueue(100)
+            configure_root_logger('json', q)
+            self.assertNotIn(handler, root.handlers)
+
+            args = ['a']
+            trace = tracing.Trace('request')
+            logging.info('list is %s', args)
+            trace.finish()
+            args.append('b')
+            logging.debug('not logged')
+            self.assertTrue(q.flush())
+
+            self.assertEqual(len(handler.lines), 1)
+            doc = json.loads(handler.lines[0])
+            self.assertEqual(doc['message'], "list is ['a']")
+            self.assertEqual(doc['level'], 'INFO')
+            self.assertEqual(doc['trace_id'], trace.trace_id)
+
+            # configuring again doesn't nest the queues
+            configure_root_logger('text', q)
+            self.assertEqual(root.handlers[0].handlers, [handler])
+        finally:
+            root.handlers, level = saved
+            root.setLevel(level)
+
+    def test_json_formatter(self):
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            record = logging.getLogger('catalog').makeRecord(
+                'catalog', logging.ERROR, __file__, 1, 'failed: %s', ('x',), sys.exc_info())
+        doc = json.loads(JSONFormatter().format(record))
+        self.assertEqual(doc['message'], 'failed: x')
+        self.assertEqual(doc['logger'], 'catalog')
+        self.assertIn('ValueError: boom', doc['exception'])
+
+    def test_bad_format(self):
+        with self.assertRaises(ValueError):
+            configure_root_logger('xml')
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING logqueue_test.py +++++++++++')
@@ -0,0 +1,111 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from biokbase.catalog import metrics
+
+# well above any pid_max, so never a running process
+DEAD_PID = 99999999
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_render(self):
+        registry = metrics.Registry()
+        requests = metrics.Counter('requests_total', 'Requests', ['method'], registry=registry)
+        in_flight = metrics.Gauge('in_flight', 'In flight', registry=registry)
+        latency = metrics.Histogram('latency_seconds', 'Latency', ['method'],
+                                    buckets=[0.1, 1], registry=registry)
+
+        requests.inc(method='Catalog.version')
+        requests.inc(2, method='Catalog.version')
+        requests.inc(method='Catalog.list_builds')
+        with in_flight.track_inprogress():
+            self.assertEqual(in_flight.get(), 1)
+        in_flight.set(3)
+        latency.observe(0.05, method='Catalog.version')
+        latency.observe(0.5, method='Catalog.version')
+        latency.observe(5, method='Catalog.version')
+
+        self.assertEqual(requests.get(method='Catalog.version'), 3)
+        self.assertEqual(latency.get(method='Catalog.version'), (3, 5.55))
+        with self.assertRaises(ValueError):
+            requests.inc(-1, method='Catalog.version')
+        with self.assertRaises(ValueError):
+            requests.inc()
+
+        self.assertEqual(registry.render().split('\n'), [
+            '# HELP in_flight In flight',
+            '# TYPE in_flight gauge',
+            'in_flight 3',
+            '# HELP latency_seconds Latency',
+            '# TYPE latency_seconds histogram',
+            'latency_seconds_bucket{method="Catalog.version",le="0.1"} 1',
+            'latency_seconds_bucket{method="Catalog.version",le="1"} 2',
+            'latency_seconds_bucket{method="Catalog.version",le="+Inf"} 3',
+            'latency_seconds_sum{method="Catalog.version"} 5.55',
+            'latency_seconds_count{method="Catalog.version"} 3',
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total{method="Catalog.list_builds"} 1',
+            'requests_total{method="Catalog.version"} 3',
+            ''])
+
+    def test_multiprocess(self):
+        registry = metrics.Registry()
+        requests = metrics.Counter('requests_total', 'Requests', ['method'], registry=registry)
+        in_flight = metrics.Gauge('in_flight', 'In flight', registry=registry)
+        latency = metrics.Histogram('latency_seconds', 'Latency', buckets=[1],
+                                    registry=registry)
+        registry.configure(self.metrics_dir, flush_interval=60)
+        requests.inc(method='Catalog.version')
+        in_flight.set(2)
+        latency.observe(0.5)
+
+        # a worker that has exited, with its last snapshot left behind
+        dead = {'pid': DEAD_PID, 'metrics': {
+            'requests_total': {'type': 'counter', 'help': 'Requests', 'labelnames': ['method'],
+                               'values': [[['Catalog.version'], 4],
+                                          [['Catalog.status'], 1]]},
+            'in_flight': {'type': 'gauge', 'help': 'In flight', 'labelnames': [],
+                          'values': [[[], 7]]},
+            'latency_seconds': {'type': 'histogram', 'help': 'Latency', 'labelnames': [],
+                                'buckets': [1, float('inf')],
+                                'values': [[[], [[0, 2], 6.0, 2]]]}
+        }}
+        with open(os.path.join(self.metrics_dir, '{}.json'.format(DEAD_PID)), 'w') as f:
+            json.dump(dead, f)
+
+        # and an exited worker whose pid was reused by this process
+        reused = {'pid': os.getpid(), 'started': 1, 'metrics': {
+            'requests_total': {'type': 'counter', 'help': 'Requests', 'labelnames': ['method'],
+                               'values': [[['Catalog.version'], 10]]}}}
+        with open(os.path.join(self.metrics_dir, '{}-1000.json'.format(os.getpid())),
+                  'w') as f:
+            json.dump(reused, f)
+
+        own = '{}-{}.json'.format(os.getpid(), int(registry._started * 1000))
+        for _ in range(2):
+            collected = registry.collect()
+            self.assertEqual(sorted(collected['requests_total']['values']),
+                             [[['Catalog.status'], 1], [['Catalog.version'], 15]])
+            self.assertEqual(collected['in_flight']['values'], [[[], 2]])
+            self.assertEqual(collected['latency_seconds']['values'], [[[], [[1, 2], 6.5, 3]]])
+            # the snapshots of the exited processes were folded into the archive
+            self.assertEqual(sorted(os.listdir(self.metrics_dir)), sorted(['archive.json', own]))
+
+        # leftovers from a previous run are removed when the service starts
+        metrics.Registry().configure(self.metrics_dir)
+        self.assertEqual(os.listdir(self.metrics_dir), [own])
+
+    def setUp(self):
+        self.metrics_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.metrics_dir)
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING metrics_test.py +++++++++++')
@@ -0,0 +1,92 @@
+import os
+import re
+import signal
+import subprocess
+import sys
+import threading
+import time
+import unittest
+import urllib.request
+
+SERVER = '''
+import os, time
+from biokbase.catalog.prefork import PreforkServer
+
+def app(environ, start_response):
+    time.sleep(float(environ.get('QUERY_STRING') or 0))
+    body = str(os.getpid()).encode()
+    start_response('200 OK', [('content-type', 'text/plain'),
+                              ('content-length', str(len(body)))])
+    return [body]
+
+PreforkServer(app, port=0, workers=2, threads=3, graceful_timeout=5).serve()
+'''
+
+
+class PreforkServerTest(unittest.TestCase):
+
+    def setUp(self):
+        env = dict(os.environ)
+        lib = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lib')
+        env['PYTHONPATH'] = os.pathsep.join([lib, env.get('PYTHONPATH', '')])
+        self.proc = subprocess.Popen([sys.executable, '-c', SERVER], env=env,
+                                     stdout=subprocess.PIPE, text=True)
+        line = self.proc.stdout.readline()
+        self.port = int(re.search(r':(\d+) with', line).group(1))
+        self.wait_until_up()
+
+    def tearDown(self):
+        if self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc.stdout.close()
+
+    def wait_until_up(self):
+        for _ in range(100):
+            try:
+                self.get(0)
+                return
+            except OSError:
+                time.sleep(0.05)
+
+    def get(self, sleep):
+        url = 'http://localhost:{}/?{}'.format(self.port, sleep)
+        with urllib.request.urlopen(url, timeout=10) as r:
+            return r.status, r.read().decode()
+
+    def get_concurrently(self, n, sleep, results):
+        def run():
+            try:
+                results.append(self.get(sleep))
+            except Exception as e:
+                results.append(e)
+        threads = [threading.Thread(target=run) for _ in range(n)]
+        for t in threads:
+            t.start()
+        return threads
+
+    def test_concurrency(self):
+        results = []
+        start = time.monotonic()
+        for t in self.get_concurrently(6, 0.5, results):
+            t.join()
+        # 6 requests on up to 2 x 3 threads, more than one at a time
+        self.assertLess(time.monotonic() - start, 2.5)
+        self.assertEqual([r[0] for r in results], [200] * 6)
+        self.assertNotIn(str(self.proc.pid), [r[1] for r in results])
+
+    def test_graceful_shutdown(self):
+        results = []
+        threads = self.get_concurrently(3, 1, results)
+        time.sleep(0.3)
+        self.proc.send_signal(signal.SIGTERM)
+        for t in threads:
+            t.join()
+        self.assertEqual([r[0] for r in results], [200] * 3)
+        self.assertEqual(self.proc.wait(timeout=10), 0)
+        with self.assertRaises(OSError):
+            self.get(0)
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING prefork_test.py +++++++++++')
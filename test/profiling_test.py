@@ -0,0 +1,71 @@
+import os
+import pstats
+import shutil
+import tempfile
+import time
+import unittest
+
+from biokbase.catalog.profiling import ProfileStore
+
+
+def slow_function(n):
+    time.sleep(0.01)
+    return sum(range(n))
+
+
+def failing_function():
+    raise ValueError('boom')
+
+
+class ProfileStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.store = ProfileStore(os.path.join(self.dir, 'profiles'), max_profiles=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_run_and_report(self):
+        result, profile_id = self.store.run({'method': 'Catalog.version', 'user': 'admin'},
+                                            slow_function, 100)
+        self.assertEqual(result, 4950)
+        path = self.store.path(profile_id)
+        self.assertTrue(path.endswith(profile_id + '.prof'))
+        stats = pstats.Stats(path)
+        self.assertTrue(any(f[2] == 'slow_function' for f in stats.stats))
+
+        report = self.store.report(profile_id)
+        self.assertIn('method: Catalog.version\n', report)
+        self.assertIn('user: admin\n', report)
+        self.assertIn('slow_function', report)
+
+    def test_failed_call_is_stored(self):
+        with self.assertRaises(ValueError):
+            self.store.run({'method': 'Catalog.version'}, failing_function)
+        self.assertEqual(len([f for f in os.listdir(self.store.directory)
+                              if f.endswith('.prof')]), 1)
+
+    def test_unknown_ids(self):
+        self.assertIsNone(self.store.path('0' * 32))
+        self.assertIsNone(self.store.report('0' * 32))
+        self.assertIsNone(self.store.path('../../etc/passwd'))
+        self.assertIsNone(self.store.path('A' * 32))
+
+    def test_prune(self):
+        ids = []
+        for _ in range(4):
+            ids.append(self.store.run({}, slow_function, 10)[1])
+            # make sure the modification times differ
+            time.sleep(0.01)
+        self.assertIsNone(self.store.path(ids[0]))
+        self.assertIsNone(self.store.path(ids[1]))
+        self.assertIsNotNone(self.store.path(ids[2]))
+        self.assertIsNotNone(self.store.path(ids[3]))
+        self.assertEqual(sorted(os.listdir(self.store.directory)),
+                         sorted([ids[2] + '.prof', ids[2] + '.json',
+                                 ids[3] + '.prof', ids[3] + '.json']))
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING profiling_test.py +++++++++++')
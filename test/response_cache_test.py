@@ -0,0 +1,71 @@
+import json
+import unittest
+
+from biokbase.catalog import codec
+from biokbase.catalog.response_cache import HITS, MISSES, ResponseCache
+
+
+class ResponseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.generation = 1
+        self.cache = ResponseCache(['Catalog.list_basic_module_info'], lambda: self.generation,
+                                   max_bytes=100)
+
+    def test_hit_and_miss(self):
+        m = 'Catalog.list_basic_module_info'
+        hits, misses = HITS.get(method=m), MISSES.get(method=m)
+        g = self.cache.generation()
+        self.assertIsNone(self.cache.get(m, 'k', g))
+        self.cache.put('k', g, '["a"]')
+        self.assertEqual(self.cache.get(m, 'k', g), '["a"]')
+        self.assertEqual(HITS.get(method=m), hits + 1)
+        self.assertEqual(MISSES.get(method=m), misses + 1)
+
+    def test_generation(self):
+        m = 'Catalog.list_basic_module_info'
+        self.cache.put('k', 1, '["a"]')
+        self.assertEqual(len(self.cache), 1)
+
+        # a write empties the cache
+        self.generation = 2
+        self.assertIsNone(self.cache.get(m, 'k', self.cache.generation()))
+        self.assertEqual(len(self.cache), 0)
+
+        # a result computed before the write is not cached
+        self.cache.put('k', 1, '["a"]')
+        self.assertEqual(len(self.cache), 0)
+        self.cache.put('k', 2, '["b"]')
+        self.assertEqual(self.cache.get(m, 'k', 2), '["b"]')
+
+    def test_eviction(self):
+        m = 'Catalog.list_basic_module_info'
+        for k in 'abcd':
+            self.cache.put(k, 1, k * 30)
+        # the least recently used entry is evicted first
+        self.assertEqual(self.cache.get(m, 'b', 1), 'b' * 30)
+        self.cache.put('e', 1, 'e' * 30)
+        self.assertIsNone(self.cache.get(m, 'a', 1))
+        self.assertIsNone(self.cache.get(m, 'c', 1))
+        self.assertEqual(self.cache.get(m, 'b', 1), 'b' * 30)
+        self.assertEqual(self.cache.get(m, 'e', 1), 'e' * 30)
+        # too large to cache
+        self.cache.put('f', 1, 'f' * 101)
+        self.assertIsNone(self.cache.get(m, 'f', 1))
+        self.assertEqual(len(self.cache), 3)
+
+    def test_splice(self):
+        respond = {'version': '1.1', 'id': '12'}
+        for name in codec.available_codecs():
+            c = codec.get_codec(name)
+            self.assertEqual(json.loads(c.splice(respond, c.dumps([{'a': 1}]))),
+                             {'version': '1.1', 'id': '12', 'result': [{'a': 1}]})
+            self.assertEqual(json.loads(c.splice({}, c.dumps([1]))), {'result': [1]})
+        if codec.msgpack is not None:
+            c = codec.MsgpackCodec()
+            self.assertEqual(c.loads(c.splice(respond, c.dumps([{'a': 1}]))),
+                             {'version': '1.1', 'id': '12', 'result': [{'a': 1}]})
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING response_cache_test.py +++++++++++')
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import time
+from unittest import mock
+
+from biokbase.catalog import admission
+
+from server_test_util import ServerTestCase, call, rpc, start
+
+
+class ServerTest(ServerTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING server_test.py +++++++++++')
+        super().setUpClass()
+
+    def test_cached_methods_are_not_streamed(self):
+        for cached in [False, True]:
+            self.calls = []
+            app = self.make_app({
+                'stream-methods': 'Catalog.list_basic_module_info,Catalog.list_builds',
+                'response-cache-methods':
+                    'Catalog.list_basic_module_info' if cached else ''})
+            for _ in range(2):
+                status, headers, body = call(app, rpc('Catalog.list_basic_module_info'))
+                self.assertEqual(status, '200 OK')
+                self.assertEqual(json.loads(body)['result'][0][2], {'module_name': 'module2'})
+                # a streamed response has no content length
+                self.assertEqual('content-length' in headers, cached)
+            self.assertEqual(len(self.calls), 1 if cached else 2)
+            self.assertEqual(app.stream_methods, {'Catalog.list_builds'} if cached else
+                             {'Catalog.list_basic_module_info', 'Catalog.list_builds'})
+
+    def test_response_cache_config(self):
+        for method in ['Catalog.list_builds', 'Catalog.get_build_log',
+                       'Catalog.get_exec_aggr_stats']:
+            with self.assertRaisesRegex(ValueError, 'may not list ' + method):
+                self.make_app({'response-cache-methods': method})
+        with self.assertRaisesRegex(ValueError, 'not Catalog.register_repo'):
+            self.make_app({'response-cache-methods': 'Catalog.register_repo'})
+
+    def test_stream(self):
+        app = self.make_app({'stream-methods': 'Catalog.list_basic_module_info'})
+        status, headers, chunks = start(app, rpc('Catalog.list_basic_module_info',
+                                                 {'count': 5000}))
+        self.assertEqual(status, '200 OK')
+        self.assertNotIn('content-length', headers)
+        # the end is logged once the whole response has been encoded
+        self.assertEqual(self.logged, [('list_basic_module_info', 'start method')])
+        chunks = list(chunks)
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(len(json.loads(b''.join(chunks))['result'][0]), 5000)
+        self.assertEqual(self.logged[-1], ('list_basic_module_info', 'end method'))
+
+        # batches and errors are not streamed
+        for body in [[rpc('Catalog.list_basic_module_info')],
+                     rpc('Catalog.list_basic_module_info', {'fail': 1})]:
+            status, headers, response = call(app, body)
+            self.assertEqual(headers['content-length'], str(len(response)))
+
+    def test_stream_failure(self):
+        app = self.make_app({'stream-methods': 'Catalog.list_basic_module_info'})
+        # fails before anything is sent
+        status, headers, body = call(app, rpc('Catalog.list_basic_module_info',
+                                              {'count': 5000, 'bad_at': 0}))
+        self.assertEqual(status, '500 Internal Server Error')
+        self.assertEqual(headers['content-length'], str(len(body)))
+        self.assertEqual(json.loads(body)['error']['message'], 'The result could not be encoded')
+
+        # fails after the first chunk was sent, so the server has to drop the connection
+        self.logged = []
+        status, _, chunks = start(app, rpc('Catalog.list_basic_module_info',
+                                           {'count': 5000, 'bad_at': 4000}))
+        self.assertEqual(status, '200 OK')
+        sent = [next(chunks)]
+        with self.assertRaises(TypeError):
+            for chunk in chunks:
+                sent.append(chunk)
+        with self.assertRaises(ValueError):
+            json.loads(b''.join(sent))
+        messages = [m for _, m in self.logged]
+        self.assertNotIn('end method', messages)
+        self.assertTrue(messages[-1].startswith('streaming the response failed'))
+
+    def test_iter_rpc_response(self):
+        iter_rpc_response = self.Server.iter_rpc_response
+        respond = {'version': '1.1', 'id': '1', 'result': [['m\u00e9', {'a': 1}, 2]]}
+        chunks = list(iter_rpc_response(respond, chunk_size=4))
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(json.loads(b''.join(chunks)), respond)
+        # results that are not a single list are encoded at once
+        for result in [[{'a': 1}], [[1], [2]], None]:
+            respond = {'version': '1.1', 'id': '1', 'result': result}
+            chunks = list(iter_rpc_response(respond, chunk_size=1))
+            self.assertEqual(len(chunks), 1)
+            self.assertEqual(json.loads(chunks[0]), respond)
+
+    def test_batch(self):
+        for workers in ['0', '4']:
+            app = self.make_app({'batch-max-workers': workers})
+            self.calls = []
+            status, _, body = call(app, [
+                rpc('Catalog.list_basic_module_info', {'count': 1}, id='a'),
+                rpc('Catalog.list_basic_module_info', {'count': 2}, id=None),
+                rpc('Catalog.list_basic_module_info', {'fail': 1}, id='b'),
+                {'id': 'c', 'params': []},
+                rpc('Catalog.list_basic_module_info', {'count': 3}, id='d')])
+            self.assertEqual(status, '200 OK')
+            responses = json.loads(body)
+            # the notification has no response, errors are reported in place
+            self.assertEqual([r['id'] for r in responses], ['a', 'b', 'c', 'd'])
+            self.assertEqual(len(responses[0]['result'][0]), 1)
+            self.assertIn('listing failed', responses[1]['error']['message'])
+            self.assertEqual(responses[2]['error']['message'], 'Malformed request in batch')
+            self.assertEqual(len(responses[3]['result'][0]), 3)
+            self.assertEqual(len(self.calls), 4)
+
+        status, _, body = call(app, [rpc('Catalog.list_basic_module_info')] * 101)
+        self.assertEqual(status, '500 Internal Server Error')
+        self.assertIn('between 1 and 100 requests', json.loads(body)['error']['message'])
+        status, _, body = call(app, [])
+        self.assertEqual(status, '500 Internal Server Error')
+
+    def test_batch_order(self):
+        app = self.make_app({'batch-max-workers': '2'})
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def list_modules(ctx, params):
+            with lock:
+                running.append(params['n'])
+                peak.append(len(running))
+            # the later requests of the batch finish first
+            time.sleep(0.01 * (10 - params['n']))
+            with lock:
+                running.remove(params['n'])
+            return [params['n']]
+        app.rpc_service.add(list_modules, name='Catalog.list_basic_module_info', types=[dict])
+
+        status, _, body = call(app, [rpc('Catalog.list_basic_module_info', {'n': n}, id=n)
+                                     for n in range(10)])
+        self.assertEqual(status, '200 OK')
+        self.assertEqual([(r['id'], r['result']) for r in json.loads(body)],
+                         [(n, [n]) for n in range(10)])
+        # the executor runs at most batch-max-workers requests at a time, the rest wait
+        self.assertEqual(max(peak), 2)
+        self.assertIs(app.get_batch_executor(), app.get_batch_executor())
+        self.assertIsNone(self.make_app({'batch-max-workers': '1'}).get_batch_executor())
+
+    def test_request_size(self):
+        app = self.make_app({'max-request-size': '100'})
+        body = json.dumps(rpc('Catalog.list_basic_module_info')).encode('utf8')
+        status, _, response = call(app, body)
+        self.assertEqual(status, '200 OK')
+        for headers in [{}, {'Content-Encoding': 'gzip'}]:
+            status, _, response = call(app, body + b' ' * 100, headers)
+            self.assertEqual(status, '500 Internal Server Error')
+            self.assertEqual(json.loads(response)['error']['message'],
+                             'Request body exceeds 100 bytes')
+        self.assertEqual(len(self.calls), 1)
+
+    def test_unknown_methods_share_a_label(self):
+        app = self.make_app({'rate-limit-per-user': '1/1'})
+        before = admission.REJECTIONS.get(method='unknown', reason='user_rate')
+        for method in ['Catalog.no_such_method', 'Catalog.random_name']:
+            status, _, _ = call(app, rpc(method))
+        self.assertEqual(status, '429 Too Many Requests')
+        self.assertEqual(admission.REJECTIONS.get(method='unknown', reason='user_rate'),
+                         before + 1)
+        self.assertEqual(admission.REJECTIONS.get(method='Catalog.random_name',
+                                                  reason='user_rate'), 0)
+
+    def wait_for_warm_up(self, app):
+        for _ in range(200):
+            if not app._warmup['running']:
+                return
+            time.sleep(0.01)
+        self.fail('warm up did not finish')
+
+    def test_readiness(self):
+        app = self.make_app({'warmup-methods': 'Catalog.list_basic_module_info'})
+        # a newly forked worker
+        app._warmup['pid'] = None
+        controller = mock.Mock()
+        controller.check_mongo.return_value = None
+        with mock.patch.object(self.Server.impl_Catalog, 'get_controller',
+                               side_effect=[IOError('mongo is down'), controller, controller,
+                                            controller, controller]):
+            status, report = app.readiness()
+            self.assertEqual(status, '503 Service Unavailable')
+            self.assertEqual(report, {'ready': False, 'checks': {'warmup': 'running'}})
+            self.wait_for_warm_up(app)
+            status, report = app.readiness()
+            self.assertEqual(report['checks'], {'warmup': 'OSError: mongo is down'})
+            # a failed warm up is started again
+            self.wait_for_warm_up(app)
+            self.assertEqual(self.calls, [{}])
+            status, report = app.readiness()
+            self.assertEqual(status, '200 OK')
+            self.assertEqual(report, {'ready': True, 'checks': {'warmup': 'ok', 'mongo': 'ok'}})
+
+            # the mongo check is reused for a few seconds
+            controller.check_mongo.return_value = 'connection refused'
+            status, report = app.readiness()
+            self.assertEqual(status, '200 OK')
+            self.assertEqual(controller.check_mongo.call_count, 1)
+            with mock.patch.object(self.Server.time, 'monotonic',
+                                   return_value=time.monotonic() + 5):
+                status, report = app.readiness()
+            self.assertEqual(status, '503 Service Unavailable')
+            self.assertEqual(report['checks']['mongo'], 'connection refused')
+
+    def test_warm_up_after_fork(self):
+        app = self.make_app({})
+        with mock.patch.object(self.Server.impl_Catalog, 'get_controller'):
+            status, _, _ = call(app, rpc('Catalog.list_basic_module_info'))
+            self.assertEqual(app._warmup['pid'], os.getpid())
+            self.wait_for_warm_up(app)
+            self.assertTrue(app._warmup['done'])
+            # the first request of a forked process starts its warm up
+            with mock.patch.object(self.Server.os, 'getpid', return_value=-1):
+                call(app, rpc('Catalog.list_basic_module_info'))
+                self.assertEqual(app._warmup['pid'], -1)
+                self.wait_for_warm_up(app)
+        self.assertEqual(status, '200 OK')
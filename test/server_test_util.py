@@ -0,0 +1,99 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+# the controller is only created on first use, so the server can be imported without mongo
+CONFIG = '''
+[Catalog]
+lazy-init = true
+mongodb-host = localhost:1
+mongodb-database = catalog_test
+'''
+
+
+def call(app, body, headers=None):
+    ''' posts body to the wsgi app and returns the status, headers and response body '''
+    status, response_headers, chunks = start(app, body, headers)
+    try:
+        body = b''.join(chunks)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+    return status, response_headers, body
+
+
+def start(app, body, headers=None):
+    ''' posts body to the wsgi app and returns the status, headers and unread response '''
+    raw = body if isinstance(body, bytes) else json.dumps(body).encode('utf8')
+    environ = {'REQUEST_METHOD': 'POST', 'PATH_INFO': '/', 'QUERY_STRING': '',
+               'CONTENT_LENGTH': str(len(raw)), 'wsgi.input': io.BytesIO(raw),
+               'REMOTE_ADDR': '127.0.0.1'}
+    for name, value in (headers or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = value
+    response = {}
+
+    def start_response(status, response_headers, exc_info=None):
+        response['status'] = status
+        response['headers'] = dict((k.lower(), v) for k, v in response_headers)
+
+    chunks = app(environ, start_response)
+    return response['status'], response['headers'], chunks
+
+
+def rpc(method, params=None, id='1'):
+    return {'version': '1.1', 'id': id, 'method': method, 'params': [params or {}]}
+
+
+class ServerTestCase(unittest.TestCase):
+    '''
+    Imports the Server module with a configuration that needs no services, and makes
+    Applications whose catalog methods are fakes.
+    '''
+
+    Server = None
+
+    @classmethod
+    def setUpClass(cls):
+        cls.dir = tempfile.mkdtemp()
+        path = os.path.join(cls.dir, 'deploy.cfg')
+        with open(path, 'w') as f:
+            f.write(CONFIG)
+        with mock.patch.dict(os.environ, {'KB_DEPLOYMENT_CONFIG': path,
+                                          'KB_SERVICE_NAME': 'Catalog'}):
+            from biokbase.catalog import Server
+        cls.Server = Server
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.dir)
+
+    def setUp(self):
+        self.calls = []
+        self.logged = []
+
+    def make_app(self, config):
+        ''' returns an Application with config, whose catalog methods are fakes '''
+        with mock.patch.object(self.Server, 'config', config):
+            app = self.Server.Application()
+        # as if this worker had already warmed up
+        app._warmup.update(pid=os.getpid(), done=True)
+        if app.rpc_service.response_cache is not None:
+            app.rpc_service.response_cache._get_generation = lambda: 1
+        app.rpc_service.add(self.list_modules, name='Catalog.list_basic_module_info',
+                            types=[dict])
+        app.log = lambda level, ctx, message: self.logged.append((ctx['method'], message))
+        return app
+
+    def list_modules(self, ctx, params):
+        self.calls.append(params)
+        if params.get('fail'):
+            raise ValueError('listing failed')
+        modules = [{'module_name': 'module%d' % i} for i in range(params.get('count', 3))]
+        if 'bad_at' in params:
+            # can't be encoded
+            modules[params['bad_at']]['owners'] = object()
+        return [modules]
@@ -0,0 +1,185 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from biokbase.catalog import shared_cache
+from biokbase.catalog.shared_cache import SharedTokenCache
+
+
+class SharedCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'token_cache')
+        self.caches = []
+
+    def tearDown(self):
+        for cache in self.caches:
+            cache.close()
+        shutil.rmtree(self.dir)
+
+    def open(self, *args, **kwargs):
+        cache = SharedTokenCache(self.path, *args, **kwargs)
+        self.caches.append(cache)
+        return cache
+
+    def test_shared(self):
+        cache = self.open()
+        other = self.open()
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+        self.assertIsNone(other.get_user('token1'))
+        cache.add_valid_token('token1', 'user1')
+        cache.add_roles('token1', ('CATALOG_ADMIN',))
+        self.assertEqual(other.get_user('token1'), 'user1')
+        self.assertEqual(other.get_roles('token1', 60), ['CATALOG_ADMIN'])
+        with open(self.path, 'rb') as f:
+            self.assertNotIn(b'token1', f.read())
+
+        other.invalidate('token1')
+        self.assertIsNone(cache.get_user('token1'))
+        self.assertIsNone(cache.get_roles('token1', 60))
+        for token, user in [('', 'user1'), ('token1', '')]:
+            with self.assertRaises(ValueError):
+                cache.add_valid_token(token, user)
+
+    def test_namespace(self):
+        cache = self.open(namespace='https://ci.kbase.us/services/auth')
+        other = self.open(namespace='https://kbase.us/services/auth')
+        cache.add_valid_token('token1', 'user1')
+        self.assertIsNone(other.get_user('token1'))
+
+    def test_expiry(self):
+        cache = self.open()
+        now = [1000.0]
+        with mock.patch.object(shared_cache.time, 'time', lambda: now[0]):
+            cache.add_valid_token('token1', 'user1')
+            cache.add_roles('token1', [])
+            now[0] += 61
+            self.assertIsNone(cache.get_roles('token1', 60))
+            self.assertEqual(cache.get_roles('token1', 120), [])
+            now[0] += 240
+            self.assertIsNone(cache.get_user('token1'))
+            self.assertIsNone(cache.get_roles('token1', 3600))
+            # a clock moved back doesn't extend the entries
+            cache.add_valid_token('token1', 'user1')
+            now[0] -= 10
+            self.assertIsNone(cache.get_user('token1'))
+
+    def test_full_bucket(self):
+        cache = self.open(size=8)
+        now = [1000.0]
+        with mock.patch.object(shared_cache.time, 'time', lambda: now[0]):
+            for i in range(9):
+                now[0] += 1
+                cache.add_valid_token('token%d' % i, 'user%d' % i)
+            # the oldest entry was replaced
+            self.assertIsNone(cache.get_user('token0'))
+            self.assertEqual(cache.get_user('token8'), 'user8')
+            now[0] += 300
+            cache.add_valid_token('token9', 'user9')
+            cache.add_valid_token('token8', 'user8')
+            self.assertEqual(cache.get_user('token9'), 'user9')
+            self.assertEqual(cache.get_user('token8'), 'user8')
+
+    def test_fallback(self):
+        cache = self.open()
+        roles = ['ROLE_%d' % i for i in range(100)]
+        cache.add_roles('token1', roles)
+        self.assertEqual(cache.get_roles('token1', 60), roles)
+        self.assertIsNone(self.open().get_roles('token1', 60))
+        cache.invalidate('token1')
+        self.assertIsNone(cache.get_roles('token1', 60))
+
+        errors = shared_cache.ERRORS.get()
+        with mock.patch.object(shared_cache.fcntl, 'lockf', side_effect=OSError('no locks')):
+            cache.add_valid_token('token2', 'user2')
+            self.assertEqual(cache.get_user('token2'), 'user2')
+            cache.clear()
+            self.assertIsNone(cache.get_user('token2'))
+        self.assertEqual(shared_cache.ERRORS.get(), errors + 4)
+
+    def test_invalid_tokens_are_per_process(self):
+        cache = self.open()
+        cache.add_invalid('bad', 'Invalid token')
+        self.assertEqual(cache.get_invalid('bad', 30), 'Invalid token')
+        self.assertIsNone(cache.get_user('bad'))
+        self.assertIsNone(self.open().get_invalid('bad', 30))
+
+    def test_file(self):
+        cache = self.open(size=16)
+        cache.add_valid_token('token1', 'user1')
+        # a file of another size is replaced, not resized under its users
+        other = self.open(size=64)
+        self.assertIsNone(other.get_user('token1'))
+        self.assertEqual(cache.get_user('token1'), 'user1')
+        other.add_valid_token('token1', 'user2')
+        self.assertEqual(self.open(size=64).get_user('token1'), 'user2')
+
+        os.chmod(self.path, 0o644)
+        with self.assertRaises(ValueError):
+            self.open(size=64)
+
+    def test_private(self):
+        # a missing directory is created for the owner only
+        self.path = os.path.join(self.dir, 'run', 'token_cache')
+        self.open()
+        self.assertEqual(os.stat(os.path.dirname(self.path)).st_mode & 0o777, 0o700)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o600)
+
+        # a symbolic link could point the cache at any file the server can write
+        target = self.path
+        self.path = os.path.join(self.dir, 'run', 'link')
+        os.symlink(target, self.path)
+        with self.assertRaises(OSError):
+            self.open()
+
+        os.chmod(os.path.dirname(self.path), 0o777)
+        self.path = target
+        with self.assertRaisesRegex(ValueError, 'must only be writable by its owner'):
+            self.open()
+
+    def test_processes(self):
+        cache = self.open()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child = SharedTokenCache(self.path)
+                for i in range(200):
+                    child.add_valid_token('token%d' % i, 'user%d' % i)
+            finally:
+                os._exit(0)
+        for i in range(200):
+            cache.add_roles('token%d' % i, ['ROLE'])
+        os.waitpid(pid, 0)
+        found = [cache.get_user('token%d' % i) for i in range(200)]
+        self.assertEqual(found, ['user%d' % i for i in range(200)])
+
+    def test_threads(self):
+        cache = self.open(size=64)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(500):
+                    token = 'token%d' % ((i * 7 + n) % 100)
+                    user = cache.get_user(token)
+                    if user is None:
+                        cache.add_valid_token(token, 'user-' + token)
+                    elif user != 'user-' + token:
+                        errors.append(user)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING shared_cache_test.py +++++++++++')
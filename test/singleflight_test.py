@@ -0,0 +1,122 @@
+import contextvars
+import threading
+import time
+import unittest
+
+from biokbase.catalog import deadline
+from biokbase.catalog.singleflight import SingleFlight, request_key
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def test_request_key(self):
+        self.assertEqual(request_key('Catalog.get_module_version',
+                                     [{'module_name': 'm', 'version': 'dev'}]),
+                         request_key('Catalog.get_module_version',
+                                     [{'version': 'dev', 'module_name': 'm'}]))
+        self.assertNotEqual(request_key('Catalog.get_module_version', [{'module_name': 'm'}]),
+                            request_key('Catalog.get_module_info', [{'module_name': 'm'}]))
+        self.assertNotEqual(request_key('Catalog.get_module_info', [{'module_name': 'm'}]),
+                            request_key('Catalog.get_module_info', [{'module_name': 'n'}]))
+
+    def run_concurrently(self, sf, key, fn, n, seconds=None):
+        ''' calls fn through sf from n threads at once, each with a deadline of seconds '''
+        results = []
+        start = threading.Barrier(n)
+
+        def call():
+            start.wait()
+            token = deadline.start(seconds)
+            try:
+                results.append(sf.do(key, fn))
+            except Exception as e:
+                results.append(e)
+            finally:
+                deadline.end(token)
+
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(call,))
+                   for _ in range(n)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return results
+
+    def test_coalesce(self):
+        sf = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return ['result']
+
+        results = self.run_concurrently(sf, 'k', fn, 10)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([r[0] for r in results], [['result']] * 10)
+        self.assertEqual(sorted(r[1] for r in results), [False] + [True] * 9)
+        self.assertEqual(sf.in_flight(), 0)
+
+        # nothing is cached after the call finishes
+        self.assertEqual(sf.do('k', fn), (['result'], False))
+        self.assertEqual(len(calls), 2)
+
+    def test_errors_are_shared(self):
+        sf = SingleFlight()
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('no such module')
+
+        results = self.run_concurrently(sf, 'k', fn, 5)
+        self.assertEqual(len(calls), 1)
+        for r in results:
+            self.assertIsInstance(r, ValueError)
+            self.assertEqual(str(r), 'no such module')
+        self.assertEqual(sf.in_flight(), 0)
+
+    def test_results_are_copied(self):
+        sf = SingleFlight()
+
+        def fn():
+            time.sleep(0.2)
+            return [{'module_name': 'm'}]
+
+        results = self.run_concurrently(sf, 'k', fn, 5)
+        self.assertEqual([r[0] for r in results], [[{'module_name': 'm'}]] * 5)
+        # a caller changing its result doesn't change the others'
+        for i in range(5):
+            for j in range(i + 1, 5):
+                self.assertIsNot(results[i][0], results[j][0])
+                self.assertIsNot(results[i][0][0], results[j][0][0])
+
+    def test_wait_is_bounded_by_the_deadline(self):
+        sf = SingleFlight()
+        leader = threading.Event()
+
+        def fn():
+            leader.set()
+            time.sleep(0.5)
+            return 'result'
+
+        thread = threading.Thread(target=sf.do, args=('k', fn))
+        thread.start()
+        leader.wait()
+        started = time.monotonic()
+        results = self.run_concurrently(sf, 'k', fn, 3, seconds=0.05)
+        self.assertTrue(time.monotonic() - started < 0.4)
+        for r in results:
+            self.assertIsInstance(r, deadline.DeadlineExceededError)
+        thread.join()
+        self.assertEqual(sf.in_flight(), 0)
+
+    def test_different_keys(self):
+        sf = SingleFlight()
+        self.assertEqual(sf.do('a', lambda: 1), (1, False))
+        self.assertEqual(sf.do('b', lambda: 2), (2, False))
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING singleflight_test.py +++++++++++')
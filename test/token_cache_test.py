@@ -0,0 +1,227 @@
+import threading
+import unittest
+from unittest import mock
+
+from biokbase.catalog import authclient
+from biokbase.catalog.authclient import (KBaseAuth, TokenCache, INVALID_TOKENS,
+                                         REJECTED_TOKENS, TOKEN_REJECTIONS, _LRUCache)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeResponse:
+
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.ok = status_code < 300
+        self.reason = 'Unauthorized' if status_code == 401 else 'Error'
+        self.body = body
+
+    def json(self):
+        return self.body
+
+
+class TokenCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        patcher = mock.patch.object(authclient, '_time', self.clock)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_users(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get_user('token1'))
+        cache.add_valid_token('token1', 'user1')
+        self.assertEqual(cache.get_user('token1'), 'user1')
+        # keyed by the token hash
+        self.assertNotIn('token1', str(cache._users._stripes[0].entries))
+        for token, user in [('', 'user1'), (None, 'user1'), ('token1', '')]:
+            with self.assertRaises(ValueError):
+                cache.add_valid_token(token, user)
+
+    def test_expiry(self):
+        cache = TokenCache()
+        cache.add_valid_token('token1', 'user1')
+        self.clock.now += 299
+        self.assertEqual(cache.get_user('token1'), 'user1')
+        self.clock.now += 2
+        self.assertIsNone(cache.get_user('token1'))
+        self.assertEqual(len(cache._users), 0)
+
+    def test_roles(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get_roles('token1', 60))
+        cache.add_roles('token1', ('CATALOG_ADMIN',))
+        self.assertEqual(cache.get_roles('token1', 60), ['CATALOG_ADMIN'])
+        self.clock.now += 61
+        self.assertIsNone(cache.get_roles('token1', 60))
+        self.assertEqual(cache.get_roles('token1', 120), ['CATALOG_ADMIN'])
+        # never longer than the cache's own limit
+        self.clock.now += 300
+        self.assertIsNone(cache.get_roles('token1', 3600))
+
+    def test_invalidate_and_clear(self):
+        cache = TokenCache()
+        cache.add_valid_token('token1', 'user1')
+        cache.add_roles('token1', [])
+        cache.add_valid_token('token2', 'user2')
+        cache.invalidate('token1')
+        self.assertIsNone(cache.get_user('token1'))
+        self.assertIsNone(cache.get_roles('token1', 60))
+        self.assertEqual(cache.get_user('token2'), 'user2')
+        cache.invalidate('token3')
+        cache.clear()
+        self.assertIsNone(cache.get_user('token2'))
+
+    def test_invalid(self):
+        cache = TokenCache(maxsize=2, invalid_maxsize=2, stripes=1)
+        cache.add_valid_token('token1', 'user1')
+        for i in range(5):
+            cache.add_invalid('bad%d' % i, 'Invalid token')
+        # rejected tokens don't push out the valid ones
+        self.assertEqual(cache.get_user('token1'), 'user1')
+        self.assertEqual(len(cache._invalid), 2)
+        self.assertEqual(cache.get_invalid('bad4', 30), 'Invalid token')
+        self.assertIsNone(cache.get_invalid('bad0', 30))
+        self.assertIsNone(cache.get_user('bad4'))
+        self.clock.now += 31
+        self.assertIsNone(cache.get_invalid('bad4', 30))
+        cache.clear()
+        self.assertIsNone(cache.get_invalid('bad3', 300))
+
+    def test_auth_rejections(self):
+        cache = TokenCache()
+        auth = KBaseAuth('http://auth', cache=cache, invalid_ttl=30)
+        responses = {
+            'good': FakeResponse(200, {'user_id': 'user1'}),
+            'bad': FakeResponse(401, {'error': {'message': '10020 Invalid token'}}),
+            'down': FakeResponse(500, {'error': {'message': 'oops'}})}
+        calls = []
+
+        def post(url, data):
+            calls.append(data['token'])
+            return responses[data['token']]
+
+        from_auth = TOKEN_REJECTIONS.get(source='auth')
+        from_cache = TOKEN_REJECTIONS.get(source='cache')
+        with mock.patch.object(authclient.http_session, 'post', post):
+            self.assertEqual(auth.get_user('good'), 'user1')
+            for _ in range(3):
+                with self.assertRaisesRegex(ValueError, '401 Unauthorized\n10020 Invalid token'):
+                    auth.get_user('bad')
+            with self.assertRaises(ValueError):
+                auth.get_cached_user('bad')
+            self.assertIsNone(auth.get_cached_user('down'))
+            for _ in range(2):
+                with self.assertRaisesRegex(ValueError, 'oops'):
+                    auth.get_user('down')
+            self.assertEqual(calls, ['good', 'bad', 'down', 'down'])
+            self.assertEqual(TOKEN_REJECTIONS.get(source='auth'), from_auth + 1)
+            self.assertEqual(TOKEN_REJECTIONS.get(source='cache'), from_cache + 3)
+
+            # the rejection expires
+            self.clock.now += 31
+            with self.assertRaises(ValueError):
+                auth.get_user('bad')
+            self.assertEqual(calls[-1], 'bad')
+
+            # and isn't remembered at all when disabled
+            calls = []
+            auth = KBaseAuth('http://auth', cache=TokenCache())
+            for _ in range(2):
+                with self.assertRaises(ValueError):
+                    auth.get_user('bad')
+            self.assertEqual(calls, ['bad', 'bad'])
+
+    def test_rejection_metrics(self):
+        cache = TokenCache()
+        KBaseAuth('http://auth', cache=cache, invalid_ttl=30)
+        cache.add_invalid('bad1', 'Invalid token')
+        self.clock.now += 20
+        cache.add_invalid('bad2', 'Invalid token')
+        for _ in range(3):
+            cache.get_invalid('bad2', 30)
+        cache.get_invalid('bad1', 30)
+        self.assertEqual(INVALID_TOKENS.get(), 2)
+        bad2 = cache._hash('bad2')[:12]
+        self.assertEqual(cache.top_invalid(30, 1), [(bad2, 3)])
+        self.assertEqual(REJECTED_TOKENS.get(token=bad2), 3)
+        self.assertEqual(len(REJECTED_TOKENS.snapshot()['values']), 2)
+        # the gauges count down as the rejections expire
+        self.clock.now += 15
+        self.assertEqual(INVALID_TOKENS.get(), 1)
+        self.assertEqual(REJECTED_TOKENS.snapshot()['values'], [[[bad2], 3]])
+        cache.clear()
+        self.assertEqual(INVALID_TOKENS.get(), 0)
+
+    def test_lru_eviction(self):
+        cache = _LRUCache(3, 300, stripes=1)
+        for k in 'abc':
+            cache.put(k, k.upper())
+        self.assertEqual(cache.get('a'), 'A')
+        cache.put('d', 'D')
+        # b was the least recently used
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual([cache.get(k) for k in 'acd'], ['A', 'C', 'D'])
+        cache.put('c', 'C2')
+        cache.put('e', 'E')
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('c'), 'C2')
+        self.assertEqual(len(cache), 3)
+
+    def test_expired_entries_are_evicted(self):
+        cache = _LRUCache(4, 10, stripes=1)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.clock.now += 5
+        cache.put('c', 3)
+        cache.put('d', 4)
+        self.clock.now += 6
+        # full: a is evicted as the least recently used, b because it expired
+        cache.put('e', 5)
+        self.assertEqual(len(cache), 3)
+        self.assertEqual([cache.get(k) for k in 'cde'], [3, 4, 5])
+
+    def test_bounded_over_stripes(self):
+        cache = _LRUCache(100, 300, stripes=16)
+        self.assertEqual(sum(s.maxsize for s in cache._stripes), 100)
+        for i in range(1000):
+            cache.put('key%d' % i, i)
+        self.assertLessEqual(len(cache), 100)
+        self.assertEqual(cache.get('key999'), 999)
+        self.assertEqual(len(_LRUCache(2, 300, stripes=16)._stripes), 2)
+
+    def test_threads(self):
+        cache = TokenCache(maxsize=50)
+        errors = []
+
+        def worker(n):
+            try:
+                for i in range(2000):
+                    token = 'token%d' % ((i * 7 + n) % 200)
+                    if cache.get_user(token) is None:
+                        cache.add_valid_token(token, 'user')
+                    if i % 100 == 0:
+                        cache.invalidate(token)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(len(cache._users), 50)
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING token_cache_test.py +++++++++++')
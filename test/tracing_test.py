@@ -0,0 +1,118 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from biokbase.catalog import tracing
+
+
+@tracing.trace_methods('db')
+class FakeDB:
+
+    def get_module(self, name):
+        return self.get_versions(name)
+
+    def get_versions(self, name):
+        if name == 'missing':
+            raise ValueError('no module ' + name)
+        return [name]
+
+    def _private(self):
+        return tracing.current_trace()
+
+
+class TracingTest(unittest.TestCase):
+
+    def test_disabled(self):
+        tracing.configure({})
+        self.assertIsNone(tracing.start_trace('request'))
+        with tracing.span('db.find') as s:
+            self.assertIsNone(s)
+        self.assertEqual(FakeDB().get_module('m'), ['m'])
+        self.assertIsNone(tracing.traceparent())
+
+    def test_spans(self):
+        tracing.configure({'server-timing': 'true'})
+        trace = tracing.start_trace('request', client_ip='1.2.3.4')
+        db = FakeDB()
+        with tracing.span('controller.get_module_info') as controller_span:
+            self.assertEqual(db.get_module('m'), ['m'])
+            with self.assertRaises(ValueError):
+                db.get_module('missing')
+        self.assertIs(db._private(), trace)
+
+        parent = tracing.traceparent()
+        self.assertEqual(parent, '00-{}-{}-01'.format(trace.trace_id, trace.root.span_id))
+
+        header = trace.finish()
+        self.assertIsNone(tracing.current_trace())
+        names = [s.name for s in trace.spans]
+        self.assertEqual(names, ['db.get_versions', 'db.get_module', 'db.get_versions',
+                                 'db.get_module', 'controller.get_module_info'])
+        by_id = {s.span_id: s for s in trace.spans}
+        self.assertEqual(trace.spans[0].parent_id, trace.spans[1].span_id)
+        self.assertEqual(trace.spans[1].parent_id, controller_span.span_id)
+        self.assertEqual(by_id[controller_span.span_id].parent_id, trace.root.span_id)
+        self.assertEqual(trace.spans[2].error, 'ValueError: no module missing')
+        self.assertIsNone(trace.spans[0].error)
+
+        parts = header.split(', ')
+        self.assertTrue(parts[0].startswith('db;desc="4 calls";dur='))
+        self.assertTrue(parts[1].startswith('controller;desc="1 calls";dur='))
+        self.assertTrue(parts[2].startswith('total;dur='))
+
+    def test_traceparent(self):
+        tracing.configure({'server-timing': 'true'})
+        trace = tracing.start_trace(
+            'request', '00-0af7651916cd43dd8448eb211c80319c-b7ad6b7169203331-01')
+        self.assertEqual(trace.trace_id, '0af7651916cd43dd8448eb211c80319c')
+        self.assertEqual(trace.root.parent_id, 'b7ad6b7169203331')
+        trace.finish()
+
+        trace = tracing.start_trace('request', 'garbage')
+        self.assertEqual(len(trace.trace_id), 32)
+        self.assertIsNone(trace.root.parent_id)
+        trace.finish()
+
+    def test_file_exporter(self):
+        path = os.path.join(self.tempdir, 'traces.jsonl')
+        tracing.configure({'tracing-exporter': 'file', 'tracing-file': path})
+        for _ in range(2):
+            trace = tracing.start_trace('request')
+            with tracing.span('auth.validate_token', url='http://auth'):
+                pass
+            self.assertIsNone(trace.finish())
+
+        lines = open(path).read().splitlines()
+        self.assertEqual(len(lines), 2)
+        doc = json.loads(lines[0])
+        resource = doc['resourceSpans'][0]
+        self.assertEqual(resource['resource']['attributes'],
+                         [{'key': 'service.name', 'value': {'stringValue': 'catalog'}}])
+        root, child = resource['scopeSpans'][0]['spans']
+        self.assertEqual(root['name'], 'request')
+        self.assertEqual(root['kind'], 2)
+        self.assertNotIn('parentSpanId', root)
+        self.assertEqual(child['name'], 'auth.validate_token')
+        self.assertEqual(child['parentSpanId'], root['spanId'])
+        self.assertEqual(child['traceId'], root['traceId'])
+        self.assertEqual(child['attributes'],
+                         [{'key': 'url', 'value': {'stringValue': 'http://auth'}}])
+        self.assertEqual(child['status'], {'code': 1})
+
+    def test_bad_exporter(self):
+        with self.assertRaises(ValueError) as e:
+            tracing.configure({'tracing-exporter': 'zipkin'})
+        self.assertEqual(str(e.exception), 'Unknown tracing-exporter: zipkin')
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        tracing.configure({})
+        shutil.rmtree(self.tempdir)
+
+    @classmethod
+    def setUpClass(cls):
+        print('++++++++++++ RUNNING tracing_test.py +++++++++++')